@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command Line Interface
+Headless batch conversion across a process pool with per-stage concurrency limits
+
+Usage:
+    python -m plugins.cli convert <dir|glob|file>... --type mp4_to_txt --engine whisper
+    python -m plugins.cli convert --manifest inputs.txt --workers 8 --report results.jsonl
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from plugins.config import load_config_file, get_default_config, MP4_TO_MP3_CONFIG, MP3_TO_TXT_CONFIG
+
+logger = logging.getLogger(__name__)
+
+CONVERSION_TYPES = ('mp4_to_mp3', 'mp3_to_txt', 'mp4_to_txt')
+ENGINES = ('alibaba_nls', 'whisper')
+
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv'}
+AUDIO_EXTENSIONS = {'.mp3', '.wav', '.aac', '.flac', '.ogg', '.m4a', '.opus', '.webm'}
+
+# Per-stage semaphores shared by the worker processes (set by _init_worker)
+_stage_limits = {}
+
+# Converters reused by one worker process (keeps e.g. the Whisper model loaded)
+_converters = {}
+
+def _input_extensions(conversion_type: str) -> set:
+    """File extensions a conversion type accepts"""
+    return AUDIO_EXTENSIONS if conversion_type == 'mp3_to_txt' else VIDEO_EXTENSIONS
+
+def expand_inputs(patterns: List[str], conversion_type: str, output_dir: Optional[Path] = None,
+                  recursive: bool = False) -> List[Dict]:
+    """
+    Turn directories, globs and file paths into conversion jobs
+    
+    Files found under a directory keep their relative location below
+    ``output_dir``; other inputs are written straight into it. Without an
+    output directory results go next to their input.
+    
+    Args:
+        patterns: Directories, glob patterns or files
+        conversion_type: Conversion type applied to every input
+        output_dir: Optional directory for the results
+        recursive: Whether directories are scanned recursively
+        
+    Returns:
+        List of job dictionaries with input and output_dir
+    """
+    extensions = _input_extensions(conversion_type)
+    jobs = []
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            found = path.rglob('*') if recursive else path.glob('*')
+            for file_path in sorted(found):
+                if file_path.is_file() and file_path.suffix.lower() in extensions:
+                    target = output_dir / file_path.parent.relative_to(path) if output_dir else file_path.parent
+                    jobs.append({'input': str(file_path), 'output_dir': str(target)})
+            continue
+        
+        matches = [Path(p) for p in sorted(glob.glob(pattern, recursive=True))] if glob.has_magic(pattern) else [path]
+        for file_path in matches:
+            if not file_path.is_file():
+                logger.warning(f"Skipping missing input: {file_path}")
+                continue
+            if file_path.suffix.lower() not in extensions:
+                logger.warning(f"Skipping {file_path}: not a {conversion_type} input")
+                continue
+            jobs.append({'input': str(file_path), 'output_dir': str(output_dir or file_path.parent)})
+    return jobs
+
+def read_manifest(manifest_path: Path, defaults: Dict) -> List[Dict]:
+    """
+    Read a manifest of inputs
+    
+    Every non-empty line is either a path or a JSON object with ``input``
+    and optional ``type``, ``engine`` and ``output_dir``; lines starting
+    with '#' are comments. Relative paths are resolved against the
+    manifest's directory.
+    
+    Args:
+        manifest_path: Manifest file
+        defaults: Job fields used when a line does not set them
+        
+    Returns:
+        List of job dictionaries
+    """
+    jobs = []
+    base = manifest_path.parent
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            entry = json.loads(line) if line.startswith('{') else {'input': line}
+            if 'input' not in entry:
+                raise ValueError(f"{manifest_path}:{number}: missing 'input'")
+            
+            job = dict(defaults, **entry)
+            input_path = Path(job['input'])
+            job['input'] = str(input_path if input_path.is_absolute() else base / input_path)
+            if not job.get('output_dir'):
+                job['output_dir'] = str(Path(job['input']).parent)
+            jobs.append(job)
+    return jobs
+
+def expected_outputs(job: Dict, config: Dict) -> List[Path]:
+    """Result files a job produces (primary output first)"""
+    input_path = Path(job['input'])
+    output_dir = Path(job['output_dir'])
+    if job['type'] == 'mp4_to_mp3':
+        from plugins.common.ffmpeg_utils import audio_output_suffix
+        return [output_dir / f"{input_path.stem}{audio_output_suffix(config.get('mp4_to_mp3') or MP4_TO_MP3_CONFIG)}"]
+    return [output_dir / f"{input_path.stem}.txt", output_dir / f"{input_path.stem}.srt"]
+
+def is_up_to_date(job: Dict, config: Dict) -> Optional[List[str]]:
+    """Existing outputs that are newer than the input, None if the job has to run"""
+    input_mtime = Path(job['input']).stat().st_mtime
+    outputs = expected_outputs(job, config)
+    if job['type'] == 'mp4_to_mp3' and not outputs[0].exists():
+        # Stream copy of an AAC source keeps the audio as .m4a
+        outputs = [outputs[0].with_suffix('.m4a')]
+    
+    for output in outputs:
+        if not output.exists() or output.stat().st_size == 0 or output.stat().st_mtime < input_mtime:
+            return None
+    return [str(output) for output in outputs]
+
+def _init_worker(stage_limits: Dict, log_level: int):
+    """Process pool initializer: install the shared stage semaphores"""
+    _stage_limits.update(stage_limits)
+    logging.basicConfig(level=log_level, format='%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s')
+
+def _stage(name: str):
+    """Hold one slot of a stage's concurrency limit"""
+    return _stage_limits.get(name) or nullcontext()
+
+def _get_converter(kind: str, config: Dict):
+    """Converter of one kind, created once per worker process"""
+    if kind not in _converters:
+        if kind == 'mp4_to_mp3':
+            from plugins.mp4_to_mp3.mp4_to_mp3 import MP4ToMP3Converter
+            _converters[kind] = MP4ToMP3Converter(config.get('mp4_to_mp3'))
+        elif kind == 'whisper':
+            from plugins.mp3_to_txt.whisper_convert import WhisperConverter
+            _converters[kind] = WhisperConverter(config.get('mp3_to_txt'))
+        else:
+            from plugins.mp3_to_txt.mp3_to_txt import MP3ToTXTConverter
+            _converters[kind] = MP3ToTXTConverter(config.get('mp3_to_txt'))
+    return _converters[kind]
+
+def _transcribe(job: Dict, config: Dict, audio_source: Path, outputs: List[Path]):
+    """Run the speech recognition stage"""
+    converter = _get_converter('whisper' if job['engine'] == 'whisper' else 'alibaba_nls', config)
+    with _stage('asr'):
+        return converter.convert(audio_source, outputs[0], outputs[1])
+
+def run_job(job: Dict, config: Dict) -> Dict:
+    """
+    Convert one input (runs in a worker process)
+    
+    Args:
+        job: Job dictionary (input, type, engine, output_dir)
+        config: Configuration the conversion runs with
+        
+    Returns:
+        Result record for the report
+    """
+    from plugins.common.ffmpeg_utils import get_video_info
+    from plugins.common.result_cache import result_cache
+    from plugins.common.silence import TimeMap
+    
+    input_path = Path(job['input'])
+    output_dir = Path(job['output_dir'])
+    output_dir.mkdir(parents=True, exist_ok=True)
+    outputs = expected_outputs(job, config)
+    started = time.time()
+    record = {
+        'input': str(input_path),
+        'type': job['type'],
+        'engine': job['engine'] if job['type'] != 'mp4_to_mp3' else None,
+        'input_size': input_path.stat().st_size,
+        'media_duration': float(get_video_info(str(input_path), fast=True).get('duration', 0) or 0),
+        'worker': os.getpid()
+    }
+    
+    try:
+        cache_key = None
+        if result_cache.enabled:
+            cache_key = result_cache.make_key(input_path, job['type'], job['engine'], config)
+            cached = result_cache.lookup(cache_key, output_dir, input_path.stem)
+            if cached:
+                return dict(record, status='cached', success=True, message=cached['message'],
+                            outputs=cached['files'], elapsed=round(time.time() - started, 3))
+        
+        metadata = {}
+        if job['type'] == 'mp4_to_mp3':
+            converter = _get_converter('mp4_to_mp3', config)
+            with _stage('decode'):
+                success, message, metadata = converter.convert(input_path, outputs[0])
+            if success:
+                outputs = [Path(metadata.get('output_path', outputs[0]))]
+                cache_files = outputs + [TimeMap.path_for(outputs[0])]
+        
+        elif job['type'] == 'mp3_to_txt':
+            success, message, metadata = _transcribe(job, config, input_path, outputs)
+            cache_files = outputs
+        
+        else:
+            mp3_config = config.get('mp3_to_txt') or MP3_TO_TXT_CONFIG
+            if mp3_config.get('direct_pcm', True):
+                # The recognizer decodes the video through a PCM pipe
+                success, message, metadata = _transcribe(job, config, input_path, outputs)
+            else:
+                from plugins.common.scratch import scratch_manager, audio_size_hint
+                mp4_config = config.get('mp4_to_mp3') or MP4_TO_MP3_CONFIG
+                with scratch_manager.job(f"cli-{input_path.stem}") as scratch:
+                    temp_audio = scratch.allocate(
+                        f"{input_path.stem}.mp3",
+                        audio_size_hint(record['media_duration'], mp4_config.get('audio_bitrate', '64k'))
+                    )
+                    converter = _get_converter('mp4_to_mp3', config)
+                    with _stage('decode'):
+                        success, message, metadata = converter.convert(input_path, temp_audio)
+                    if success:
+                        success, message, metadata = _transcribe(
+                            job, config, Path(metadata.get('output_path', temp_audio)), outputs
+                        )
+            cache_files = outputs
+        
+        if success and cache_key:
+            result_cache.store(cache_key, job['type'], cache_files, input_path.stem, message, metadata)
+        
+        return dict(record, status='converted' if success else 'failed', success=success, message=message,
+                    outputs=[str(output) for output in outputs if output.exists()] if success else [],
+                    elapsed=round(time.time() - started, 3))
+    
+    except Exception as e:
+        logger.error(f"Conversion of {input_path} failed: {str(e)}")
+        return dict(record, status='failed', success=False, message=str(e), outputs=[],
+                    elapsed=round(time.time() - started, 3))
+
+class BatchRunner:
+    """
+    Batch conversion driver
+    
+    Plans jobs, skips the ones whose outputs are already newer than their
+    inputs, fans the rest out to a process pool and appends one JSON line
+    per finished job to the report while printing aggregate throughput.
+    """
+    
+    def __init__(self, config: Dict, workers: int, decode_jobs: int, asr_jobs: int,
+                 report_path: Optional[Path] = None, force: bool = False, log_level: int = logging.WARNING):
+        """
+        Initialize runner
+        
+        Args:
+            config: Configuration every job runs with
+            workers: Worker processes
+            decode_jobs: Jobs allowed in the FFmpeg decode/encode stage at once
+            asr_jobs: Jobs allowed in the speech recognition stage at once
+            report_path: Optional JSONL results report
+            force: Convert even if the outputs are up to date
+            log_level: Logging level of the worker processes
+        """
+        self.config = config
+        self.workers = max(1, workers)
+        self.decode_jobs = max(1, decode_jobs)
+        self.asr_jobs = max(1, asr_jobs)
+        self.report_path = report_path
+        self.force = force
+        self.log_level = log_level
+        self.totals = {'converted': 0, 'cached': 0, 'skipped': 0, 'failed': 0}
+        self.media_seconds = 0.0
+        self.input_bytes = 0
+    
+    def run(self, jobs: List[Dict]) -> bool:
+        """
+        Run all jobs
+        
+        Args:
+            jobs: Job dictionaries
+            
+        Returns:
+            True if no job failed
+        """
+        started = time.time()
+        report = open(self.report_path, 'a', encoding='utf-8') if self.report_path else None
+        
+        try:
+            pending = []
+            claimed = set()
+            for job in jobs:
+                outputs = tuple(str(path) for path in expected_outputs(job, self.config))
+                if outputs in claimed:
+                    self._finish(report, dict(job, status='failed', success=False, outputs=[],
+                                              message="another input writes the same outputs"), len(jobs), started)
+                    continue
+                claimed.add(outputs)
+                
+                existing = None if self.force else is_up_to_date(job, self.config)
+                if existing:
+                    self._finish(report, dict(job, status='skipped', success=True, outputs=existing,
+                                              message="outputs are up to date"), len(jobs), started)
+                else:
+                    pending.append(job)
+            
+            if pending:
+                context = multiprocessing.get_context()
+                stage_limits = {
+                    'decode': context.BoundedSemaphore(self.decode_jobs),
+                    'asr': context.BoundedSemaphore(self.asr_jobs)
+                }
+                with ProcessPoolExecutor(max_workers=min(self.workers, len(pending)), mp_context=context,
+                                         initializer=_init_worker,
+                                         initargs=(stage_limits, self.log_level)) as pool:
+                    futures = {pool.submit(run_job, job, self.config): job for job in pending}
+                    for future in as_completed(futures):
+                        try:
+                            record = future.result()
+                        except Exception as e:
+                            job = futures[future]
+                            record = dict(job, status='failed', success=False, outputs=[], message=str(e))
+                        self._finish(report, record, len(jobs), started)
+        finally:
+            if report:
+                report.close()
+        
+        elapsed = time.time() - started
+        print(f"Done in {elapsed:.1f}s: " + ', '.join(f"{count} {status}" for status, count in self.totals.items())
+              + f" | {self._throughput(elapsed)}")
+        return self.totals['failed'] == 0
+    
+    def _throughput(self, elapsed: float) -> str:
+        """Aggregate throughput of the jobs that did work"""
+        elapsed = max(elapsed, 1e-6)
+        done = self.totals['converted'] + self.totals['cached']
+        return (f"{done / elapsed * 60:.1f} files/min, {self.media_seconds / elapsed:.1f}x realtime, "
+                f"{self.input_bytes / elapsed / (1024 * 1024):.1f} MB/s")
+    
+    def _finish(self, report, record: Dict, total: int, started: float):
+        """Count a finished job, print a progress line and append it to the report"""
+        status = record['status']
+        self.totals[status] += 1
+        if status in ('converted', 'cached'):
+            self.media_seconds += record.get('media_duration', 0)
+            self.input_bytes += record.get('input_size', 0)
+        
+        finished = sum(self.totals.values())
+        outputs = ', '.join(Path(p).name for p in record.get('outputs', []))
+        line = f"[{finished}/{total}] {status:<9} {Path(record['input']).name}"
+        if outputs:
+            line += f" -> {outputs}"
+        if status == 'failed':
+            line += f" ({record.get('message')})"
+        elif 'elapsed' in record:
+            line += f" ({record['elapsed']:.1f}s)"
+        print(f"{line} | {self._throughput(time.time() - started)}", flush=True)
+        
+        if report:
+            report.write(json.dumps(dict(record, timestamp=datetime.now().isoformat()), ensure_ascii=False) + '\n')
+            report.flush()
+
+def build_parser() -> argparse.ArgumentParser:
+    """Command line parser"""
+    parser = argparse.ArgumentParser(prog='python -m plugins.cli', description='Headless batch conversion')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    convert = commands.add_parser('convert', help='Convert files, directories, globs or a manifest')
+    convert.add_argument('inputs', nargs='*', help='Input files, directories or glob patterns')
+    convert.add_argument('--manifest', type=Path, help='File listing one input path (or JSON object) per line')
+    convert.add_argument('--type', dest='conversion_type', choices=CONVERSION_TYPES, default='mp4_to_txt',
+                         help='Conversion type (default: mp4_to_txt)')
+    convert.add_argument('--engine', choices=ENGINES, default='alibaba_nls',
+                         help='Speech recognition engine (default: alibaba_nls)')
+    convert.add_argument('--audio-codec', choices=('mp3', 'opus', 'aac_he'),
+                         help='Audio output codec (default: from config)')
+    convert.add_argument('-o', '--output-dir', type=Path, help='Output directory (default: next to each input)')
+    convert.add_argument('-r', '--recursive', action='store_true', help='Scan directories recursively')
+    convert.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1,
+                         help='Worker processes (default: CPU count)')
+    convert.add_argument('--decode-jobs', type=int,
+                         help='Concurrent FFmpeg decode/encode stages (default: workers)')
+    convert.add_argument('--asr-jobs', type=int,
+                         help='Concurrent speech recognition stages (default: 1 for whisper, workers otherwise)')
+    convert.add_argument('--report', type=Path, help='Append one JSON line per input to this file')
+    convert.add_argument('-f', '--force', action='store_true', help='Convert even if outputs are up to date')
+    convert.add_argument('-v', '--verbose', action='count', default=0, help='More logging (-vv for debug)')
+    return parser
+
+def cmd_convert(args) -> int:
+    """The convert command"""
+    config = load_config_file() or get_default_config()
+    if args.audio_codec:
+        config['mp4_to_mp3'] = dict(config.get('mp4_to_mp3') or MP4_TO_MP3_CONFIG, audio_codec=args.audio_codec)
+    
+    jobs = expand_inputs(args.inputs, args.conversion_type, args.output_dir, args.recursive)
+    for job in jobs:
+        job.update(type=args.conversion_type, engine=args.engine)
+    if args.manifest:
+        defaults = {'type': args.conversion_type, 'engine': args.engine,
+                    'output_dir': str(args.output_dir) if args.output_dir else None}
+        jobs += read_manifest(args.manifest, defaults)
+    
+    invalid = [job for job in jobs if job['type'] not in CONVERSION_TYPES or job['engine'] not in ENGINES]
+    if invalid:
+        print(f"Invalid type or engine for {invalid[0]['input']}", file=sys.stderr)
+        return 2
+    if not jobs:
+        print("No inputs to convert", file=sys.stderr)
+        return 2
+    
+    runner = BatchRunner(
+        config,
+        workers=args.workers,
+        decode_jobs=args.decode_jobs or args.workers,
+        asr_jobs=args.asr_jobs or (1 if args.engine == 'whisper' else args.workers),
+        report_path=args.report,
+        force=args.force,
+        log_level=[logging.WARNING, logging.INFO, logging.DEBUG][min(args.verbose, 2)]
+    )
+    print(f"Converting {len(jobs)} inputs with {runner.workers} workers "
+          f"(decode {runner.decode_jobs}, asr {runner.asr_jobs})")
+    return 0 if runner.run(jobs) else 1
+
+def main(argv: List[str] = None) -> int:
+    """Entry point"""
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=[logging.WARNING, logging.INFO, logging.DEBUG][min(args.verbose, 2)],
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    if args.command == 'convert':
+        return cmd_convert(args)
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
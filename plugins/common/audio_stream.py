@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Audio Stream Decoder
+Fixed-size numpy frames decoded from an ffmpeg PCM pipe with flat memory use,
+and memory-mapped 16-bit PCM sources that need no decoding at all
+"""
+
+import os
+import mmap
+import shutil
+import struct
+import logging
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+
+from plugins.common.ffmpeg_utils import FFmpegTools, PRIORITY_NORMAL
+
+logger = logging.getLogger(__name__)
+
+# numpy dtype and ffmpeg sample format per supported sample type
+SAMPLE_FORMATS = {
+    'int16': (np.dtype('<i2'), 's16le'),
+    'float32': (np.dtype('<f4'), 'f32le')
+}
+
+# WAV format tags of integer PCM (the extensible header carries the real tag in its sub-format)
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+def decode_stream(path, sr: int = 16000, channels: int = 1, frame_ms: float = 20.0,
+                  overlap_ms: float = 0.0, start: Optional[float] = None, end: Optional[float] = None,
+                  dtype: str = 'int16', pad_last: bool = False,
+                  priority: int = PRIORITY_NORMAL, audio_filter: Optional[str] = None) -> Iterator[np.ndarray]:
+    """
+    Decode any audio/video input into fixed-size PCM frames
+    
+    ffmpeg writes PCM to a pipe which is read straight into one reused
+    buffer, so peak memory is one frame regardless of input duration.
+    Every yielded array is a view of that buffer and is only valid until
+    the next iteration; copy it if it must outlive the loop. Closing the
+    generator early stops the decode.
+    
+    Args:
+        path: Path to input file
+        sr: Output sample rate in Hz
+        channels: Output channel count
+        frame_ms: Frame length in milliseconds
+        overlap_ms: Overlap between consecutive frames in milliseconds
+        start: Optional start time in seconds (input-side seek)
+        end: Optional end time in seconds
+        dtype: 'int16' or 'float32' (float samples are in [-1, 1])
+        pad_last: Zero-pad the last partial frame instead of yielding it short
+        priority: Scheduler priority of the decode
+        audio_filter: Optional ffmpeg -af filtergraph applied while decoding
+        
+    Yields:
+        numpy views of shape (samples,) for mono or (samples, channels)
+    """
+    if dtype not in SAMPLE_FORMATS:
+        raise ValueError(f"Unsupported sample type: {dtype}")
+    sample_dtype, sample_format = SAMPLE_FORMATS[dtype]
+    
+    frame_samples = max(1, int(round(sr * frame_ms / 1000.0)))
+    overlap_samples = int(round(sr * overlap_ms / 1000.0))
+    if not 0 <= overlap_samples < frame_samples:
+        raise ValueError("overlap_ms must be non-negative and shorter than frame_ms")
+    hop_samples = frame_samples - overlap_samples
+    
+    sample_bytes = sample_dtype.itemsize * channels
+    buffer = np.zeros(frame_samples * channels, dtype=sample_dtype)
+    raw = memoryview(buffer).cast('B')
+    frames = buffer.reshape(frame_samples, channels) if channels > 1 else buffer
+    
+    with FFmpegTools().pcm_pipe(Path(path), sr, channels, sample_format, priority,
+                                start, end, audio_filter) as stream:
+        frame_bytes = frame_samples * sample_bytes
+        carried = 0  # bytes of overlap kept from the previous frame
+        filled = 0  # bytes currently held in the buffer
+        while True:
+            read = stream.readinto(raw[filled:frame_bytes])
+            if not read:
+                break
+            filled += read
+            if filled < frame_bytes:
+                continue
+            
+            yield frames
+            
+            # Keep the overlap at the front of the buffer for the next frame
+            if overlap_samples:
+                frames[:overlap_samples] = frames[hop_samples:]
+            carried = filled = overlap_samples * sample_bytes
+        
+        # Trailing partial frame, only if it holds samples not yielded yet
+        samples = filled // sample_bytes
+        if samples > carried // sample_bytes:
+            if pad_last:
+                frames[samples:] = 0
+                yield frames
+            else:
+                yield frames[:samples]
+
+def wav_layout(path) -> Optional[Dict]:
+    """
+    Locate the PCM payload of a WAV file
+    
+    Args:
+        path: Path to a file that may be a RIFF/WAVE file
+        
+    Returns:
+        Dictionary with offset, size, sample_rate, channels and sample_width
+        of the data chunk, or None if the file is not integer PCM WAV
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(12)
+            if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+                return None
+            file_size = os.fstat(f.fileno()).st_size
+            fmt = None
+            while True:
+                chunk = f.read(8)
+                if len(chunk) < 8:
+                    return None
+                chunk_id, chunk_size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+                
+                if chunk_id == b'fmt ':
+                    body = f.read(chunk_size)
+                    if len(body) < 16:
+                        return None
+                    tag, channels, sample_rate, _, _, bits = struct.unpack('<HHIIHH', body[:16])
+                    if tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                        tag = struct.unpack('<H', body[24:26])[0]
+                    fmt = (tag, channels, sample_rate, bits)
+                    f.seek(chunk_size % 2, 1)
+                elif chunk_id == b'data':
+                    if fmt is None or fmt[0] != WAVE_FORMAT_PCM:
+                        return None
+                    offset = f.tell()
+                    return {
+                        'offset': offset,
+                        # Streamed WAVs carry a placeholder size, trust the file instead
+                        'size': min(chunk_size, file_size - offset),
+                        'sample_rate': fmt[2],
+                        'channels': fmt[1],
+                        'sample_width': fmt[3] // 8
+                    }
+                else:
+                    f.seek(chunk_size + chunk_size % 2, 1)
+    except (OSError, struct.error):
+        return None
+
+class MappedPCM:
+    """
+    Read-only memory map of 16-bit PCM, raw or the payload of a WAV file
+    
+    Chunks are memoryview slices of the map and samples are a numpy view of
+    it, so the audio is neither decoded nor copied in Python and the page
+    cache holds the only copy however long the file is.
+    """
+    
+    def __init__(self, path, sample_rate: int = 16000, channels: int = 1,
+                 offset: int = 0, size: Optional[int] = None):
+        """
+        Map a PCM file
+        
+        Args:
+            path: Path to the file
+            sample_rate: Sample rate in Hz
+            channels: Interleaved channel count
+            offset: Byte offset of the first sample
+            size: Payload size in bytes (to end of file if None)
+        """
+        self.path = Path(path)
+        self.sample_rate = int(sample_rate)
+        self.channels = int(channels)
+        self.frame_bytes = 2 * self.channels
+        
+        with open(self.path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            available = max(0, file_size - offset)
+            size = available if size is None else min(size, available)
+            size -= size % self.frame_bytes
+            # mmap keeps its own descriptor, the file can be closed right away
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.size = size
+        self._view = memoryview(self._map)[offset:offset + size] if self._map else memoryview(b'')
+    
+    @classmethod
+    def open_wav(cls, path) -> Optional['MappedPCM']:
+        """Map the payload of a 16-bit PCM WAV file, None for any other file"""
+        layout = wav_layout(path)
+        if layout is None or layout['sample_width'] != 2:
+            return None
+        return cls(path, layout['sample_rate'], layout['channels'], layout['offset'], layout['size'])
+    
+    @property
+    def duration(self) -> float:
+        """Duration in seconds"""
+        return self.size / self.frame_bytes / self.sample_rate
+    
+    def samples(self, start: Optional[float] = None, end: Optional[float] = None) -> np.ndarray:
+        """
+        Zero-copy numpy view of the samples of a time range
+        
+        Args:
+            start: Optional start time in seconds
+            end: Optional end time in seconds
+            
+        Returns:
+            int16 array of shape (samples,) for mono or (samples, channels)
+        """
+        first, last = self._byte_range(start, end)
+        samples = np.frombuffer(self._view[first:last], dtype='<i2')
+        return samples.reshape(-1, self.channels) if self.channels > 1 else samples
+    
+    def chunks(self, chunk_size: int, start: Optional[float] = None,
+               end: Optional[float] = None) -> Iterator[memoryview]:
+        """
+        Zero-copy slices of a time range
+        
+        Args:
+            chunk_size: Bytes per chunk (rounded down to whole sample frames)
+            start: Optional start time in seconds
+            end: Optional end time in seconds
+            
+        Yields:
+            memoryview chunks (the last may be short)
+        """
+        chunk_size = max(self.frame_bytes, chunk_size - chunk_size % self.frame_bytes)
+        first, last = self._byte_range(start, end)
+        for position in range(first, last, chunk_size):
+            yield self._view[position:min(position + chunk_size, last)]
+    
+    def _byte_range(self, start: Optional[float], end: Optional[float]):
+        """Byte offsets in the payload of a time range, aligned to sample frames"""
+        def to_byte(seconds: Optional[float], default: int) -> int:
+            if seconds is None:
+                return default
+            return min(self.size, max(0, int(round(seconds * self.sample_rate))) * self.frame_bytes)
+        return to_byte(start, 0), to_byte(end, self.size)
+    
+    def close(self):
+        """Unmap the file (deferred until outstanding views are gone)"""
+        try:
+            self._view.release()
+            if self._map is not None:
+                self._map.close()
+        except BufferError:
+            # Chunks or sample views are still referenced, the map is freed with the last of them
+            pass
+    
+    def __enter__(self) -> 'MappedPCM':
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+def spool_pcm(path, output_path, sr: int = 16000, channels: int = 1,
+              priority: int = PRIORITY_NORMAL) -> MappedPCM:
+    """
+    Decode any audio/video input to raw 16-bit PCM in a file and map it
+    
+    Used when the same audio is read several times (e.g. windows of a long
+    input): one decode replaces one per reader. Also used for paced readers
+    (NLS sending), so the decode's scheduler slot is held only while ffmpeg
+    runs at full speed.
+    
+    Args:
+        path: Path to input file
+        output_path: Raw PCM file to write (usually in a scratch space)
+        sr: Output sample rate in Hz
+        channels: Output channel count
+        priority: Scheduler priority of the decode
+        
+    Returns:
+        MappedPCM of the spooled file
+    """
+    with FFmpegTools().pcm_pipe(Path(path), sr, channels, 's16le', priority) as stream, \
+            open(output_path, 'wb') as f:
+        shutil.copyfileobj(stream, f, 1 << 20)
+    return MappedPCM(output_path, sr, channels)
@@ -6,16 +6,595 @@ Provides FFmpeg-based video and audio processing tools
 """
 
 import os
+import re
+import math
 import subprocess
 import logging
 import platform
+import sqlite3
+import threading
+import heapq
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Dict, Optional, Tuple, List
 import json
 import shlex
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+from plugins.config import FFMPEG_CONFIG, STATUS_DIR
+from plugins.common.silence import CUT_FRAME_RATE, cut_intervals
+from plugins.common.scratch import scratch_manager
 
 logger = logging.getLogger(__name__)
 
+# True peak ceiling (dBTP) used by loudnorm
+LOUDNORM_TRUE_PEAK = -1.5
+
+# Peak level (dBFS) reached by the peak-normalizing engines (pydub's normalize headroom)
+PEAK_NORMALIZE_TARGET = -0.1
+
+# Log lines of the ebur128/silencedetect analysis filters
+_SILENCE_START_RE = re.compile(r'silence_start:\s*(-?[\d.]+)')
+_SILENCE_END_RE = re.compile(r'silence_end:\s*(-?[\d.]+)')
+_SUMMARY_VALUE_RE = re.compile(r'^\s*(I|LRA|Peak):\s+(-?[\d.]+|-?inf|nan)\s')
+
+# Output profiles of the audio extraction stage, selected by the audio_codec setting
+AUDIO_CODEC_PROFILES = {
+    'mp3': {'suffix': '.mp3', 'encoder': 'libmp3lame'},
+    'opus': {'suffix': '.ogg', 'encoder': 'libopus'},      # VBR speech tuning, .webm via opus_container
+    'aac_he': {'suffix': '.m4a', 'encoder': 'libfdk_aac'}  # HE-AAC, native LC-AAC if fdk is not built in
+}
+
+def audio_codec_profile(audio_config: Dict) -> str:
+    """Configured output profile, MP3 for unknown values"""
+    codec = str(audio_config.get('audio_codec', 'mp3')).lower()
+    if codec not in AUDIO_CODEC_PROFILES:
+        logger.warning(f"Unknown audio codec '{codec}', using mp3")
+        return 'mp3'
+    return codec
+
+def audio_output_suffix(audio_config: Dict) -> str:
+    """File suffix of the configured output profile"""
+    codec = audio_codec_profile(audio_config)
+    if codec == 'opus' and audio_config.get('opus_container', 'ogg') == 'webm':
+        return '.webm'
+    return AUDIO_CODEC_PROFILES[codec]['suffix']
+
+@lru_cache(maxsize=4)
+def _available_encoders(ffmpeg_path: str) -> frozenset:
+    """Encoders compiled into an ffmpeg binary (empty if they cannot be listed)"""
+    try:
+        result = subprocess.run([ffmpeg_path, "-hide_banner", "-encoders"],
+                                capture_output=True, text=True, timeout=10)
+        names = set()
+        for line in result.stdout.splitlines():
+            parts = line.split()
+            # Encoder lines look like " A....D libopus   libopus Opus"
+            if len(parts) >= 2 and len(parts[0]) == 6 and parts[0][0] in 'AVS':
+                names.add(parts[1])
+        return frozenset(names)
+    except Exception:
+        return frozenset()
+
+# Stream/format fields requested by fast probe (only what get_video_info uses)
+FAST_PROBE_ENTRIES = (
+    "format=duration,size,bit_rate,format_name:"
+    "stream=codec_type,codec_name,width,height,r_frame_rate,bit_rate,sample_rate,channels,duration"
+)
+
+class ProbeCache:
+    """
+    Two-level cache for ffprobe results
+    
+    Level 1 is an in-process LRU keyed by (path, size, mtime_ns); level 2 is a
+    SQLite table in the status directory that survives restarts. A changed
+    size or mtime invalidates both levels automatically.
+    """
+    
+    def __init__(self, max_entries: int = 256, db_path: Optional[Path] = None,
+                 table: str = 'probe_cache'):
+        """
+        Initialize probe cache
+        
+        Args:
+            max_entries: Maximum number of entries kept in memory
+            db_path: Optional SQLite database path for persisted entries
+            table: SQLite table holding the persisted entries
+        """
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.table = table
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+        self._db_ready = False
+    
+    def _init_db(self) -> bool:
+        """Create the persisted cache table on first use"""
+        if self._db_ready or not self.db_path:
+            return self._db_ready
+        try:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            with sqlite3.connect(str(self.db_path)) as conn:
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                    "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+                    "fast INTEGER, info TEXT)"
+                )
+            self._db_ready = True
+        except Exception as e:
+            logger.warning(f"Probe cache persistence disabled: {str(e)}")
+            self.db_path = None
+        return self._db_ready
+    
+    @staticmethod
+    def make_key(path: Path) -> Optional[Tuple[str, int, int]]:
+        """Build cache key (path, size, mtime_ns), None if file is missing"""
+        try:
+            stat = path.stat()
+            return (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            return None
+    
+    def get(self, path: Path, fast: bool = False) -> Optional[Dict]:
+        """
+        Look up cached probe info
+        
+        Args:
+            path: Media file path
+            fast: Whether a fast probe result is acceptable
+            
+        Returns:
+            Copy of cached info dictionary, or None on miss
+        """
+        key = self.make_key(path)
+        if key is None:
+            return None
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (fast or not entry[1]):
+                self._entries.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return dict(entry[0])
+        
+        entry = self._load(key)
+        if entry is not None and (fast or not entry[1]):
+            with self._lock:
+                self._store_memory(key, entry)
+                self._stats['disk_hits'] += 1
+            return dict(entry[0])
+        
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+    
+    def put(self, path: Path, info: Dict, fast: bool = False):
+        """Store probe info for a file"""
+        key = self.make_key(path)
+        if key is None or not info:
+            return
+        
+        entry = (dict(info), fast)
+        with self._lock:
+            self._store_memory(key, entry)
+        self._save(key, entry)
+    
+    def invalidate(self, path: Path):
+        """Drop all cached entries for a file"""
+        resolved = str(path.resolve())
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == resolved]:
+                del self._entries[key]
+        
+        if self._init_db():
+            try:
+                with sqlite3.connect(str(self.db_path)) as conn:
+                    conn.execute(f"DELETE FROM {self.table} WHERE path = ?", (resolved,))
+            except Exception as e:
+                logger.warning(f"Failed to invalidate probe cache entry: {str(e)}")
+    
+    def get_stats(self) -> Dict:
+        """Get hit/miss counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((lookups - stats['misses']) / lookups, 3) if lookups else 0.0
+        return stats
+    
+    def _store_memory(self, key: Tuple[str, int, int], entry: Tuple[Dict, bool]):
+        """Insert into the LRU (caller holds the lock)"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def _load(self, key: Tuple[str, int, int]) -> Optional[Tuple[Dict, bool]]:
+        """Load a persisted entry matching the key"""
+        if not self._init_db():
+            return None
+        try:
+            with sqlite3.connect(str(self.db_path)) as conn:
+                row = conn.execute(
+                    f"SELECT fast, info FROM {self.table} WHERE path = ? AND size = ? AND mtime_ns = ?",
+                    key
+                ).fetchone()
+            if row:
+                return json.loads(row[1]), bool(row[0])
+        except Exception as e:
+            logger.warning(f"Failed to read probe cache: {str(e)}")
+        return None
+    
+    def _save(self, key: Tuple[str, int, int], entry: Tuple[Dict, bool]):
+        """Persist an entry"""
+        if not self._init_db():
+            return
+        try:
+            with sqlite3.connect(str(self.db_path)) as conn:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (path, size, mtime_ns, fast, info) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    key + (int(entry[1]), json.dumps(entry[0], ensure_ascii=False))
+                )
+        except Exception as e:
+            logger.warning(f"Failed to write probe cache: {str(e)}")
+
+# Process-wide probe cache shared by all FFmpegTools instances
+probe_cache = ProbeCache(
+    max_entries=FFMPEG_CONFIG.get('probe_cache_size', 256),
+    db_path=STATUS_DIR / 'probe_cache.sqlite3' if FFMPEG_CONFIG.get('probe_cache_persist', True) else None
+)
+
+# Loudness/silence analysis results, persisted next to the probe results
+analysis_cache = ProbeCache(
+    max_entries=FFMPEG_CONFIG.get('probe_cache_size', 256),
+    db_path=STATUS_DIR / 'probe_cache.sqlite3' if FFMPEG_CONFIG.get('probe_cache_persist', True) else None,
+    table='audio_analysis'
+)
+
+def _parse_progress_block(block: Dict[str, str], duration: Optional[float] = None) -> Dict:
+    """
+    Convert one ``-progress`` key=value block into a structured event
+    
+    Args:
+        block: Raw key/value pairs of one progress report
+        duration: Optional total media duration used to compute percent
+        
+    Returns:
+        Progress event dictionary
+    """
+    def _to_float(value, default=0.0):
+        try:
+            return float(str(value).rstrip('xX').strip())
+        except (TypeError, ValueError):
+            return default
+    
+    # out_time_us is authoritative; out_time_ms is also microseconds despite its name
+    out_time_us = block.get('out_time_us') or block.get('out_time_ms')
+    out_time = _to_float(out_time_us) / 1000000 if out_time_us not in (None, 'N/A') else 0.0
+    
+    bitrate = block.get('bitrate', '')
+    event = {
+        'out_time': max(out_time, 0.0),
+        'speed': _to_float(block.get('speed')),
+        'bitrate_kbps': _to_float(bitrate.replace('kbits/s', '')) if bitrate not in ('', 'N/A') else 0.0,
+        'fps': _to_float(block.get('fps')),
+        'frame': int(_to_float(block.get('frame'))),
+        'total_size': int(_to_float(block.get('total_size'))),
+        'finished': block.get('progress') == 'end',
+        'percent': None
+    }
+    
+    if duration and duration > 0:
+        event['percent'] = min(100.0, round(event['out_time'] / duration * 100, 1))
+    
+    return event
+
+def run_ffmpeg_process(cmd: List[str], duration: Optional[float] = None, progress_handler=None,
+                       progress_interval: float = 0.5, stderr_lines: int = 50,
+                       stdout_handler=None, stderr_handler=None, stdin_handler=None,
+                       timeout: Optional[float] = None) -> Dict:
+    """
+    Run an ffmpeg command with a machine-readable progress channel
+    
+    ``-progress pipe:1 -nostats`` is injected after the executable so progress
+    arrives as key=value blocks on stdout. stdout and stderr are drained on
+    background threads, so the process can never block on a full pipe, and
+    only the last ``stderr_lines`` stderr lines are kept for error reports.
+    When ``stdout_handler`` is given, stdout carries media data instead: it is
+    handed to the handler as raw bytes and no progress channel is requested.
+    ``stderr_handler`` receives every decoded stderr line, for filters that
+    report their results in the log (ebur128, silencedetect).
+    ``stdin_handler`` writes the input (e.g. ``-i pipe:0`` PCM) on its own
+    thread; stdin is closed when it returns.
+    
+    Args:
+        cmd: Full ffmpeg command (executable first)
+        duration: Optional total duration in seconds, used for percent
+        progress_handler: Optional callable receiving progress event dictionaries
+        progress_interval: Minimum seconds between progress events
+        stderr_lines: Number of stderr lines kept in the ring buffer
+        stdout_handler: Optional callable consuming the raw stdout stream
+        stderr_handler: Optional callable receiving each stderr line
+        stdin_handler: Optional callable writing to the binary stdin stream
+        timeout: Optional timeout in seconds
+        
+    Returns:
+        Dictionary with returncode, stderr tail, elapsed seconds and last progress event
+    """
+    cmd = [str(part) for part in cmd]
+    if stdout_handler is None:
+        cmd = cmd[:1] + ["-progress", "pipe:1", "-nostats"] + cmd[1:]
+    
+    logger.info(f"执行 FFmpeg 命令: {' '.join(cmd)}")
+    
+    stderr_tail = deque(maxlen=stderr_lines)
+    state = {'last_event': None, 'last_emit': 0.0}
+    start_time = time.monotonic()
+    
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if stdin_handler else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    
+    def _emit(event: Dict):
+        state['last_event'] = event
+        if progress_handler is None:
+            return
+        now = time.monotonic()
+        if event['finished'] or now - state['last_emit'] >= progress_interval:
+            state['last_emit'] = now
+            try:
+                progress_handler(event)
+            except Exception as e:
+                logger.warning(f"Progress handler failed: {str(e)}")
+    
+    def _drain_progress():
+        block = {}
+        for raw_line in process.stdout:
+            line = raw_line.decode('utf-8', errors='replace').strip()
+            if '=' not in line:
+                continue
+            key, value = line.split('=', 1)
+            block[key.strip()] = value.strip()
+            if key == 'progress':
+                _emit(_parse_progress_block(block, duration))
+                block = {}
+    
+    def _drain_stdout():
+        try:
+            stdout_handler(process.stdout)
+        finally:
+            # Keep draining if the handler stopped early so ffmpeg never blocks
+            for _ in iter(lambda: process.stdout.read(65536), b''):
+                pass
+    
+    def _drain_stderr():
+        for raw_line in process.stderr:
+            line = raw_line.decode('utf-8', errors='replace').rstrip()
+            if line:
+                stderr_tail.append(line)
+                if stderr_handler is not None:
+                    stderr_handler(line)
+    
+    def _feed_stdin():
+        try:
+            stdin_handler(process.stdin)
+        except BrokenPipeError:
+            pass  # ffmpeg exited early, its return code tells why
+        except Exception as e:
+            stderr_tail.append(f"Input feed failed: {str(e)}")
+            process.kill()
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+    
+    readers = [
+        threading.Thread(target=_drain_stdout if stdout_handler else _drain_progress, daemon=True),
+        threading.Thread(target=_drain_stderr, daemon=True)
+    ]
+    if stdin_handler:
+        readers.append(threading.Thread(target=_feed_stdin, daemon=True))
+    for reader in readers:
+        reader.start()
+    
+    try:
+        returncode = process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        returncode = process.wait()
+        stderr_tail.append(f"FFmpeg timed out after {timeout} seconds")
+    
+    for reader in readers:
+        reader.join()
+    
+    return {
+        'returncode': returncode,
+        'stderr': '\n'.join(stderr_tail),
+        'elapsed': round(time.monotonic() - start_time, 3),
+        'progress': state['last_event']
+    }
+
+# Job priorities for the FFmpeg scheduler (lower runs first)
+PRIORITY_HIGH = 0      # Interactive requests (frame grabs, timeline)
+PRIORITY_NORMAL = 5    # Conversion jobs
+PRIORITY_LOW = 10      # Batch/background work
+
+class _SlotPool:
+    """Bounded slot pool with a priority-ordered wait queue"""
+    
+    def __init__(self, name: str, slots: int):
+        self.name = name
+        self.slots = max(1, int(slots))
+        self.active = 0
+        self._waiters = []
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self.stats = {'completed': 0, 'total_wait': 0.0, 'total_run': 0.0, 'max_wait': 0.0}
+    
+    def acquire(self, priority: int) -> float:
+        """Wait for a free slot, returns seconds spent queued"""
+        start = time.monotonic()
+        with self._condition:
+            self._sequence += 1
+            ticket = (priority, self._sequence)
+            heapq.heappush(self._waiters, ticket)
+            while self.active >= self.slots or self._waiters[0] != ticket:
+                self._condition.wait()
+            heapq.heappop(self._waiters)
+            self.active += 1
+            # Wake the next waiter in case more slots are free
+            self._condition.notify_all()
+        return time.monotonic() - start
+    
+    def release(self, wait: float, run: float):
+        """Free a slot and record timings"""
+        with self._condition:
+            self.active -= 1
+            self.stats['completed'] += 1
+            self.stats['total_wait'] += wait
+            self.stats['total_run'] += run
+            self.stats['max_wait'] = max(self.stats['max_wait'], wait)
+            self._condition.notify_all()
+    
+    def snapshot(self) -> Dict:
+        """Current pool state and averaged timings"""
+        with self._condition:
+            completed = self.stats['completed']
+            return {
+                'slots': self.slots,
+                'active': self.active,
+                'queued': len(self._waiters),
+                'completed': completed,
+                'avg_wait': round(self.stats['total_wait'] / completed, 3) if completed else 0.0,
+                'avg_run': round(self.stats['total_run'] / completed, 3) if completed else 0.0,
+                'max_wait': round(self.stats['max_wait'], 3)
+            }
+
+class FFmpegScheduler:
+    """
+    Process-wide FFmpeg execution service
+    
+    Heavy jobs (encode/decode) and light jobs (probe/frame grab) run in
+    separate bounded slot pools so a burst of conversions cannot starve
+    interactive requests. Waiters are served by priority, then FIFO. Each
+    heavy job gets ``-threads`` set from the CPU budget of its slot.
+    """
+    
+    def __init__(self, heavy_slots: int = 0, light_slots: int = 4, cpu_count: int = None):
+        """
+        Initialize scheduler
+        
+        Args:
+            heavy_slots: Concurrent heavy jobs (0 = derive from CPU count)
+            light_slots: Concurrent light jobs
+            cpu_count: Available CPU cores (defaults to os.cpu_count())
+        """
+        self.cpu_count = cpu_count or os.cpu_count() or 1
+        if not heavy_slots:
+            heavy_slots = max(1, self.cpu_count // 2)
+        self.pools = {
+            'heavy': _SlotPool('heavy', heavy_slots),
+            'light': _SlotPool('light', light_slots)
+        }
+    
+    def threads_for(self, kind: str) -> int:
+        """Thread budget of one job of the given kind"""
+        if kind == 'light':
+            return 1
+        return max(1, self.cpu_count // self.pools['heavy'].slots)
+    
+    def slot(self, kind: str = 'heavy', priority: int = PRIORITY_NORMAL, label: str = ''):
+        """
+        Context manager holding a slot for arbitrary work (e.g. ffprobe)
+        
+        Args:
+            kind: 'heavy' or 'light'
+            priority: Job priority (lower runs first)
+            label: Description used in logs
+        """
+        return _SchedulerSlot(self, kind, priority, label)
+    
+    def run(self, cmd: List[str], kind: str = 'heavy', priority: int = PRIORITY_NORMAL,
+            duration: Optional[float] = None, progress_handler=None, **kwargs) -> Dict:
+        """
+        Queue and run an ffmpeg command
+        
+        Args:
+            cmd: Full ffmpeg command (executable first)
+            kind: 'heavy' or 'light'
+            priority: Job priority (lower runs first)
+            duration: Optional total duration in seconds, used for percent
+            progress_handler: Optional callable receiving progress event dictionaries
+            **kwargs: Extra options passed to run_ffmpeg_process
+            
+        Returns:
+            Runner result extended with kind, threads, queue_wait and run_time
+        """
+        cmd = [str(part) for part in cmd]
+        threads = self.threads_for(kind)
+        if '-threads' not in cmd:
+            cmd = cmd[:1] + ["-threads", str(threads)] + cmd[1:]
+        
+        with self.slot(kind, priority, Path(cmd[-1]).name) as slot:
+            result = run_ffmpeg_process(cmd, duration, progress_handler, **kwargs)
+        
+        result.update({
+            'kind': kind,
+            'threads': threads,
+            'queue_wait': slot.queue_wait,
+            'run_time': slot.run_time
+        })
+        return result
+    
+    def get_stats(self) -> Dict:
+        """Per-pool slot usage and timings"""
+        return {kind: pool.snapshot() for kind, pool in self.pools.items()}
+
+class _SchedulerSlot:
+    """Slot held for the duration of a with-block"""
+    
+    def __init__(self, scheduler: FFmpegScheduler, kind: str, priority: int, label: str):
+        if kind not in scheduler.pools:
+            raise ValueError(f"Unknown FFmpeg job kind: {kind}")
+        self.pool = scheduler.pools[kind]
+        self.priority = priority
+        self.label = label
+        self.queue_wait = 0.0
+        self.run_time = 0.0
+        self._start = 0.0
+    
+    def __enter__(self):
+        self.queue_wait = round(self.pool.acquire(self.priority), 3)
+        self._start = time.monotonic()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.run_time = round(time.monotonic() - self._start, 3)
+        self.pool.release(self.queue_wait, self.run_time)
+        logger.info(
+            f"FFmpeg {self.pool.name} job {self.label}: "
+            f"queue_wait={self.queue_wait}s run_time={self.run_time}s"
+        )
+        return False
+
+# Process-wide scheduler shared by all FFmpegTools instances
+ffmpeg_scheduler = FFmpegScheduler(
+    heavy_slots=FFMPEG_CONFIG.get('heavy_slots', 0),
+    light_slots=FFMPEG_CONFIG.get('light_slots', 4)
+)
+
 class FFmpegTools:
     """FFmpeg tools wrapper"""
     
@@ -69,35 +648,78 @@ class FFmpegTools:
         except (subprocess.CalledProcessError, FileNotFoundError):
             return None
     
-    def get_video_info(self, video_path: Path) -> Dict:
+    def run_ffmpeg(self, args: List[str], duration: Optional[float] = None,
+                   progress_handler=None, kind: str = 'heavy',
+                   priority: int = PRIORITY_NORMAL, **kwargs) -> Dict:
+        """
+        Run ffmpeg with the given arguments through the shared scheduler
+        
+        Args:
+            args: FFmpeg arguments (without the executable)
+            duration: Optional total duration in seconds, used for percent
+            progress_handler: Optional callable receiving progress event dictionaries
+            kind: 'heavy' (encode/decode) or 'light' (frame grab)
+            priority: Job priority (lower runs first)
+            **kwargs: Extra options passed to run_ffmpeg_process
+            
+        Returns:
+            Dictionary with returncode, stderr tail, timings and last progress event
+        """
+        return ffmpeg_scheduler.run(
+            [str(self.ffmpeg_path)] + list(args), kind, priority,
+            duration, progress_handler, **kwargs
+        )
+    
+    def get_video_info(self, video_path: Path, fast: bool = False, use_cache: bool = True) -> Dict:
         """
         Get video file information using ffprobe
         
         Args:
             video_path: Path to video file
+            fast: Only probe the fields we use, with bounded probesize/analyzeduration
+            use_cache: Consult and update the shared probe cache
             
         Returns:
             Dictionary containing video information
         """
+        video_path = Path(video_path)
+        if use_cache:
+            cached = probe_cache.get(video_path, fast)
+            if cached is not None:
+                logger.debug(f"Probe cache hit: {video_path.name}")
+                return cached
+        
         try:
-            cmd = [
-                str(self.ffprobe_path),
-                "-v", "quiet",
-                "-print_format", "json",
-                "-show_format",
-                "-show_streams",
-                str(video_path)
-            ]
+            if fast:
+                cmd = [
+                    str(self.ffprobe_path),
+                    "-v", "quiet",
+                    "-probesize", str(FFMPEG_CONFIG.get('probe_size', 5000000)),
+                    "-analyzeduration", str(FFMPEG_CONFIG.get('analyze_duration', 5000000)),
+                    "-print_format", "json",
+                    "-show_entries", FAST_PROBE_ENTRIES,
+                    str(video_path)
+                ]
+            else:
+                cmd = [
+                    str(self.ffprobe_path),
+                    "-v", "quiet",
+                    "-print_format", "json",
+                    "-show_format",
+                    "-show_streams",
+                    str(video_path)
+                ]
             
             # Print the command before execution
             logger.info(f"执行 FFprobe 命令: {' '.join(cmd)}")
             
-            result = subprocess.run(
-                cmd, 
-                capture_output=True, 
-                text=True, 
-                check=True
-            )
+            with ffmpeg_scheduler.slot('light', PRIORITY_HIGH, video_path.name):
+                result = subprocess.run(
+                    cmd, 
+                    capture_output=True, 
+                    text=True, 
+                    check=True
+                )
             
             probe_data = json.loads(result.stdout)
             
@@ -133,13 +755,22 @@ class FFmpegTools:
                 })
             
             if audio_stream:
+                # Stream duration can differ from the container's (or be missing, e.g. Matroska)
+                try:
+                    audio_duration = float(audio_stream.get('duration', 0))
+                except (TypeError, ValueError):
+                    audio_duration = 0.0
                 info.update({
+                    'audio_duration': audio_duration,
                     'audio_codec': audio_stream.get('codec_name', ''),
                     'audio_sample_rate': int(audio_stream.get('sample_rate', 0)),
                     'audio_channels': int(audio_stream.get('channels', 0)),
                     'audio_bitrate': int(audio_stream.get('bit_rate', 0)) if audio_stream.get('bit_rate') else 0
                 })
             
+            if use_cache:
+                probe_cache.put(video_path, info, fast)
+            
             logger.info(f"Video info retrieved: {video_path.name}")
             return info
             
@@ -171,24 +802,38 @@ class FFmpegTools:
             if progress_callback:
                 progress_callback(0, "Preparing audio extraction...")
             
-            # Build FFmpeg command
-            cmd = [
-                str(self.ffmpeg_path),
+            # Long inputs: decode time shards in parallel, then encode once
+            if audio_config.get('sharded', True):
+                if video_info is None:
+                    video_info = self.get_video_info(video_path)
+                shards = self.plan_audio_shards(
+                    float(video_info.get('duration', 0)),
+                    float(audio_config.get('shard_min_duration', 600))
+                )
+                if len(shards) > 1:
+                    success, message = self.extract_audio_sharded(
+                        video_path, output_path, audio_config, shards, progress_callback, video_info
+                    )
+                    if success:
+                        return success, message
+                    logger.warning(f"Sharded extraction failed, falling back to single pass: {message}")
+            
+            # Build FFmpeg arguments
+            args = [
                 "-i", str(video_path),
                 "-vn",  # No video
-                "-acodec", "libmp3lame",  # MP3 codec
-                "-ab", audio_config.get('audio_bitrate', '8k'),
+                *self.audio_encoder_args(audio_config),  # MP3/Opus/AAC profile
                 "-ac", str(audio_config.get('audio_channels', 1)),
                 "-ar", str(audio_config.get('audio_sample_rate', 8000)),
                 "-y",  # Overwrite output file
                 str(output_path)
             ]
             
-            # Add additional parameters if configured
-            if audio_config.get('normalize_audio', False):
-                # Add audio normalization filter
-                cmd.insert(-2, "-af")
-                cmd.insert(-2, "loudnorm")
+            # Add audio filtergraph (silence removal, loudness normalization, resampling)
+            audio_filter = self.build_audio_filter(audio_config)
+            if audio_filter:
+                args.insert(-2, "-af")
+                args.insert(-2, audio_filter)
             
             if progress_callback:
                 progress_callback(20, "Starting audio extraction...")
@@ -201,49 +846,27 @@ class FFmpegTools:
             logger.info(f"Video info: {video_info}")
             total_duration = video_info.get('duration', 0)
             
-            # Print the command before execution
-            logger.info(f"执行 FFmpeg 命令: {' '.join(cmd)}")
+            def on_progress(event: Dict):
+                if progress_callback and event['percent'] is not None:
+                    progress = min(20 + int(event['percent'] * 0.6), 80)
+                    progress_callback(
+                        progress,
+                        f"Extracting audio... {event['out_time']:.1f}s/{total_duration:.1f}s "
+                        f"({event['speed']:.1f}x)"
+                    )
             
             # Run FFmpeg with progress monitoring
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                universal_newlines=True
-            )
-            
-            # Monitor progress
-            progress = 20
-            while True:
-                output = process.stderr.readline()
-                if output == '' and process.poll() is not None:
-                    break
-                
-                if output and progress_callback:
-                    # Parse time progress from FFmpeg output
-                    if 'time=' in output:
-                        try:
-                            time_str = output.split('time=')[1].split()[0]
-                            current_time = self._parse_time(time_str)
-                            if total_duration > 0:
-                                progress = min(20 + int((current_time / total_duration) * 60), 80)
-                                progress_callback(progress, f"Extracting audio... {current_time:.1f}s/{total_duration:.1f}s")
-                        except:
-                            pass
-            
-            # Wait for process to complete
-            return_code = process.wait()
+            result = self.run_ffmpeg(args, total_duration, on_progress)
+            return_code = result['returncode']
             
             if return_code == 0:
                 if progress_callback:
                     progress_callback(100, "Audio extraction completed!")
                 
-                logger.info(f"Audio extracted successfully: {output_path.name}")
+                logger.info(f"Audio extracted successfully: {output_path.name} ({result['elapsed']}s)")
                 return True, "Audio extraction completed successfully"
             else:
-                error_output = process.stderr.read()
-                error_msg = f"FFmpeg failed with return code {return_code}: {error_output}"
+                error_msg = f"FFmpeg failed with return code {return_code}: {result['stderr']}"
                 logger.error(error_msg)
                 return False, error_msg
                 
@@ -252,6 +875,633 @@ class FFmpegTools:
             logger.error(error_msg)
             return False, error_msg
     
+    def build_audio_filter(self, audio_config: Dict) -> str:
+        """
+        Build the -af filtergraph for the configured post-processing
+        
+        Silence removal runs first so loudness is measured on speech only,
+        then loudnorm, then a resample back to the target rate (loudnorm
+        upsamples internally). Downmixing is done by -ac in the same run.
+        
+        With ``silence_cuts`` (planned from the silencedetect analysis by
+        plan_audio_processing) the audio is resampled, split into 10 ms
+        frames and exactly those spans are kept, so a TimeMap can describe
+        the output. Without it silenceremove detects the silences itself.
+        
+        Args:
+            audio_config: Audio configuration parameters
+            
+        Returns:
+            Filtergraph string (empty if no filter is needed)
+        """
+        filters = []
+        
+        cuts = audio_config.get('silence_cuts')
+        if audio_config.get('remove_silence', False) and cuts:
+            sample_rate = int(audio_config.get('audio_sample_rate', 8000))
+            # Frame k starts at k/CUT_FRAME_RATE; half-frame bounds keep frames [start, end)
+            selected = '+'.join(f"between(t,{(start - 0.5) / CUT_FRAME_RATE:.3f},{(end - 0.5) / CUT_FRAME_RATE:.3f})"
+                                for start, end in cuts['intervals'])
+            filters += [
+                f"aresample={sample_rate}",
+                f"asetnsamples=n={max(1, sample_rate // CUT_FRAME_RATE)}:p=0",
+                "asetpts=N/SR/TB",  # t counts samples from 0, whatever the source start time
+                f"aselect='{selected}'",
+                "asetpts=N/SR/TB"
+            ]
+        elif audio_config.get('remove_silence', False):
+            threshold = audio_config.get('silence_threshold', '-40dB')
+            min_duration = audio_config.get('silence_min_duration', 1.0)
+            keep = audio_config.get('silence_keep', 0.2)
+            filters.append(
+                f"silenceremove=start_periods=1:start_threshold={threshold}:start_silence={keep}:"
+                f"stop_periods=-1:stop_duration={min_duration}:stop_threshold={threshold}:stop_silence={keep}"
+            )
+        
+        if audio_config.get('normalize_audio', False):
+            filters.append(f"loudnorm=I={audio_config.get('loudnorm_target', -16)}:TP={LOUDNORM_TRUE_PEAK}:LRA=11")
+            filters.append(f"aresample={audio_config.get('audio_sample_rate', 8000)}")
+        
+        return ','.join(filters)
+    
+    def has_encoder(self, name: str) -> bool:
+        """Whether this ffmpeg build has an encoder (assumed present if the list is unavailable)"""
+        encoders = _available_encoders(str(self.ffmpeg_path))
+        return not encoders or name in encoders
+    
+    def audio_encoder_args(self, audio_config: Dict) -> List[str]:
+        """
+        Encoder arguments of the configured output profile
+        
+        MP3 uses LAME at a constant bitrate. Opus runs VBR with the 'voip'
+        application, which favours speech intelligibility at 8-64 kbps and
+        encodes faster than LAME. HE-AAC needs libfdk_aac; builds without it
+        get the native AAC-LC encoder at the same bitrate.
+        
+        Args:
+            audio_config: Audio configuration parameters
+            
+        Returns:
+            Codec, bitrate and tuning arguments (channels/sample rate not included)
+        """
+        bitrate = audio_config.get('audio_bitrate', '64k')
+        codec = audio_codec_profile(audio_config)
+        
+        if codec == 'opus':
+            return ["-acodec", "libopus", "-b:a", bitrate, "-vbr", "on", "-application", "voip"]
+        
+        if codec == 'aac_he':
+            if self.has_encoder('libfdk_aac'):
+                return ["-acodec", "libfdk_aac", "-profile:a", "aac_he", "-b:a", bitrate]
+            logger.warning("libfdk_aac is not available, encoding AAC-LC instead of HE-AAC")
+            return ["-acodec", "aac", "-b:a", bitrate]
+        
+        return ["-acodec", "libmp3lame", "-ab", bitrate]
+    
+    def analyze_audio(self, input_path: Path, audio_config: Dict, video_info: Dict = None,
+                      progress_callback=None, use_cache: bool = True) -> Optional[Dict]:
+        """
+        Measure loudness and silence of the audio track in one decode pass
+        
+        ebur128 (integrated loudness, loudness range, true peak) and
+        silencedetect (with the configured threshold and minimum duration)
+        run in one filter chain into a null muxer. Results are cached per
+        input file and silence parameters.
+        
+        Args:
+            input_path: Path to input media file
+            audio_config: Audio configuration parameters
+            video_info: Optional pre-fetched video information
+            progress_callback: Optional callback function for progress updates
+            use_cache: Consult and update the analysis cache
+            
+        Returns:
+            Dictionary with the measurements, or None if the analysis failed
+        """
+        input_path = Path(input_path)
+        params = {
+            'silence_threshold': str(audio_config.get('silence_threshold', '-40dB')),
+            'silence_min_duration': float(audio_config.get('silence_min_duration', 1.0))
+        }
+        if use_cache:
+            cached = analysis_cache.get(input_path)
+            if cached is not None and cached.get('params') == params:
+                logger.info(f"Using cached audio analysis: {input_path.name}")
+                return cached
+        
+        try:
+            if video_info is None:
+                video_info = self.get_video_info(input_path, fast=True)
+            duration = float(video_info.get('duration', 0))
+            
+            summary = {}
+            silences = []
+            state = {'in_summary': False, 'silence_start': None}
+            
+            def on_stderr(line: str):
+                if 'Summary:' in line:
+                    state['in_summary'] = True
+                    return
+                if state['in_summary']:
+                    match = _SUMMARY_VALUE_RE.match(line)
+                    if match:
+                        summary.setdefault(match.group(1), match.group(2))
+                    return
+                match = _SILENCE_START_RE.search(line)
+                if match:
+                    state['silence_start'] = max(0.0, float(match.group(1)))
+                    return
+                match = _SILENCE_END_RE.search(line)
+                if match and state['silence_start'] is not None:
+                    silences.append((state['silence_start'], float(match.group(1))))
+                    state['silence_start'] = None
+            
+            def on_progress(event: Dict):
+                if progress_callback and event['percent'] is not None:
+                    progress_callback(
+                        min(int(event['percent']), 99),
+                        f"Analyzing audio... {event['out_time']:.1f}s/{duration:.1f}s"
+                    )
+            
+            args = [
+                "-hide_banner",
+                "-v", "info",
+                "-i", str(input_path),
+                "-map", "0:a:0",
+                "-vn", "-sn", "-dn",
+                "-af", f"ebur128=peak=true:framelog=verbose,"
+                       f"silencedetect=noise={params['silence_threshold']}:d={params['silence_min_duration']}",
+                "-f", "null", "-"
+            ]
+            result = self.run_ffmpeg(args, duration, on_progress, stderr_handler=on_stderr)
+            if result['returncode'] != 0:
+                logger.warning(f"Audio analysis failed: {result['stderr']}")
+                return None
+            
+            # Older ffmpeg versions do not close a silence running until EOF
+            if state['silence_start'] is not None and duration > state['silence_start']:
+                silences.append((state['silence_start'], duration))
+            
+            def _value(key: str) -> Optional[float]:
+                try:
+                    value = float(summary[key])
+                except (KeyError, ValueError):
+                    return None
+                return value if np.isfinite(value) else None
+            
+            silence_seconds = sum(end - start for start, end in silences)
+            analysis = {
+                'integrated_lufs': _value('I'),
+                'loudness_range': _value('LRA'),
+                'true_peak_dbfs': _value('Peak'),
+                'duration': duration,
+                'silences': [[round(start, 3), round(end, 3)] for start, end in silences],
+                'silence_seconds': round(silence_seconds, 3),
+                'silence_ratio': round(silence_seconds / duration, 4) if duration > 0 else 0.0,
+                'params': params
+            }
+            
+            if use_cache:
+                analysis_cache.put(input_path, analysis)
+            
+            logger.info(f"Audio analysis: {input_path.name} I={analysis['integrated_lufs']} LUFS, "
+                        f"peak={analysis['true_peak_dbfs']} dBFS, silence={analysis['silence_ratio']:.1%} "
+                        f"({result['elapsed']}s)")
+            return analysis
+            
+        except Exception as e:
+            logger.warning(f"Audio analysis failed: {str(e)}")
+            return None
+    
+    def plan_audio_processing(self, audio_config: Dict, analysis: Optional[Dict]) -> Tuple[Dict, Dict]:
+        """
+        Turn off processing stages that would not change the audio
+        
+        The loudnorm filter (every engine decodes through it) is skipped when
+        the integrated loudness is already within ``loudnorm_tolerance`` LU
+        of the target and the true peak is under the loudnorm ceiling. The
+        'streaming' and 'pydub' engines then apply a pydub-style peak gain,
+        planned separately as ``peak_gain``: it is skipped only when loudnorm
+        is and the source peak is already within ``peak_tolerance`` dB of the
+        -0.1 dBFS headroom. Silence removal is skipped when the silence it
+        would cut is below ``silence_skip_ratio`` of the duration; otherwise
+        the detected silences become ``silence_cuts`` for the filtergraph.
+        
+        Args:
+            audio_config: Audio configuration parameters
+            analysis: Result of analyze_audio (None keeps every stage)
+            
+        Returns:
+            Tuple of (effective audio configuration, decisions per stage)
+        """
+        config = dict(audio_config)
+        decisions = {}
+        
+        if config.get('normalize_audio', False):
+            applied, reason = True, "no analysis available"
+            peak = analysis.get('true_peak_dbfs') if analysis else None
+            if analysis:
+                target = float(config.get('loudnorm_target', -16))
+                tolerance = float(config.get('loudnorm_tolerance', 1.0))
+                loudness = analysis.get('integrated_lufs')
+                peak_text = f"{peak:.1f} dBTP" if peak is not None else "unknown"
+                if loudness is None:
+                    applied, reason = False, "no measurable loudness"
+                elif abs(loudness - target) <= tolerance and (peak is None or peak <= LOUDNORM_TRUE_PEAK):
+                    applied, reason = False, f"{loudness:.1f} LUFS already within {tolerance:g} LU of {target:g}, true peak {peak_text}"
+                else:
+                    reason = f"{loudness:.1f} LUFS vs target {target:g}, true peak {peak_text}"
+            config['normalize_audio'] = applied
+            decisions['normalize_audio'] = {'applied': applied, 'reason': reason}
+            
+            if config.get('engine', 'filtergraph') != 'filtergraph':
+                # pydub-style normalize() after the decode: a single gain bringing the peak to -0.1 dBFS
+                gain_applied, gain_reason = True, reason
+                if applied:
+                    gain_reason = "loudnorm changes the peak"
+                elif analysis:
+                    peak_tolerance = float(config.get('peak_tolerance', 0.5))
+                    if peak is None:
+                        gain_applied, gain_reason = False, "no measurable peak"
+                    elif abs(peak - PEAK_NORMALIZE_TARGET) <= peak_tolerance:
+                        gain_applied, gain_reason = False, (f"peak {peak:.1f} dBFS already within "
+                                                            f"{peak_tolerance:g} dB of {PEAK_NORMALIZE_TARGET:g}")
+                    else:
+                        gain_reason = f"peak {peak:.1f} dBFS vs target {PEAK_NORMALIZE_TARGET:g}"
+                config['peak_gain'] = gain_applied
+                decisions['peak_gain'] = {'applied': gain_applied, 'reason': gain_reason}
+        
+        if config.get('remove_silence', False):
+            applied, reason = True, "no analysis available"
+            if analysis:
+                keep = float(config.get('silence_keep', 0.2))
+                min_ratio = float(config.get('silence_skip_ratio', 0.01))
+                duration = analysis.get('duration') or 0
+                removable = sum(max(0.0, end - start - keep) for start, end in analysis.get('silences', []))
+                ratio = removable / duration if duration > 0 else 0.0
+                if ratio < min_ratio:
+                    applied, reason = False, f"{removable:.1f}s removable silence ({ratio:.1%}) below {min_ratio:.1%}"
+                else:
+                    reason = f"{removable:.1f}s removable silence ({ratio:.1%})"
+                    # The filtergraph cuts exactly the detected silences, which keeps the time map exact
+                    intervals = cut_intervals(analysis.get('silences', []), duration, keep)
+                    if len(intervals):
+                        config['silence_cuts'] = {
+                            'intervals': intervals.tolist(),
+                            'total': int(math.ceil(duration * CUT_FRAME_RATE))
+                        }
+            config['remove_silence'] = applied
+            decisions['remove_silence'] = {'applied': applied, 'reason': reason}
+        
+        return config, decisions
+    
+    def plan_audio_shards(self, duration: float,
+                          min_shard_duration: float = 600) -> List[Tuple[float, Optional[float]]]:
+        """
+        Split a duration into time shards for parallel decoding
+        
+        The shard count scales with the heavy scheduler slots (i.e. cores) and
+        the duration, each shard being at least ``min_shard_duration`` long.
+        
+        Args:
+            duration: Input duration in seconds
+            min_shard_duration: Minimum shard length in seconds
+            
+        Returns:
+            List of (start, length) tuples; the last length is None (read to end)
+        """
+        if duration <= 0 or min_shard_duration <= 0:
+            return []
+        
+        count = max(1, min(ffmpeg_scheduler.pools['heavy'].slots, int(duration // min_shard_duration)))
+        length = duration / count
+        return [(i * length, length if i < count - 1 else None) for i in range(count)]
+    
+    def extract_audio_sharded(self, video_path: Path, output_path: Path, audio_config: Dict,
+                              shards: List[Tuple[float, Optional[float]]],
+                              progress_callback=None, video_info: Dict = None) -> Tuple[bool, str]:
+        """
+        Extract audio by decoding time shards concurrently
+        
+        Every shard seeks on the input side (-ss before -i), then is decoded,
+        downmixed and resampled to lossless FLAC in its own ffmpeg process.
+        The shards are joined with the concat demuxer and encoded once, so the
+        audio filtergraph (loudnorm, silenceremove) still sees the whole program
+        and no encoder delay is inserted at the boundaries. The summed shard
+        durations must match the audio stream duration (the container duration
+        when the probe has none) before the final encode runs.
+        
+        Args:
+            video_path: Path to input video file
+            output_path: Path to output audio file
+            audio_config: Audio configuration parameters
+            shards: List of (start, length) tuples from plan_audio_shards
+            progress_callback: Optional progress callback function
+            video_info: Pre-fetched video info to avoid duplicate calls
+            
+        Returns:
+            Tuple of (success, message)
+        """
+        if video_info is None:
+            video_info = self.get_video_info(video_path)
+        total_duration = float(video_info.get('duration', 0))
+        channels = str(audio_config.get('audio_channels', 1))
+        sample_rate = str(audio_config.get('audio_sample_rate', 8000))
+        
+        # Shard FLACs go to a private scratch job, counted against the scratch quotas
+        # (raw 16-bit PCM size is an upper bound for FLAC)
+        scratch = scratch_manager.job(f"shards-{video_path.stem}")
+        
+        try:
+            shard_paths = []
+            for index, (start, length) in enumerate(shards):
+                length_hint = length if length is not None else max(0.0, total_duration - start)
+                shard_paths.append(scratch.allocate(
+                    f"shard_{index:03d}.flac",
+                    int(length_hint * int(sample_rate) * int(channels) * 2) + 64 * 1024
+                ))
+            
+            logger.info(f"Extracting audio in {len(shards)} shards: {video_path.name}")
+            shard_done = [0.0] * len(shards)
+            progress_lock = threading.Lock()
+            
+            def run_shard(index: int) -> Dict:
+                start, length = shards[index]
+                args = ["-v", "error", "-ss", f"{start:.3f}"]
+                if length is not None:
+                    args += ["-t", f"{length:.3f}"]
+                args += [
+                    "-i", str(video_path),
+                    "-map", "0:a:0",
+                    "-vn",
+                    "-ac", channels,
+                    "-ar", sample_rate,
+                    "-c:a", "flac",
+                    "-threads", "1",  # 每个分片单线程，并行度由分片数决定
+                    "-y", str(shard_paths[index])
+                ]
+                
+                def on_progress(event: Dict):
+                    with progress_lock:
+                        shard_done[index] = event['out_time']
+                        done = sum(shard_done)
+                    if progress_callback and total_duration > 0:
+                        progress_callback(
+                            min(20 + int(done / total_duration * 50), 70),
+                            f"Decoding {len(shards)} shards... {done:.1f}s/{total_duration:.1f}s"
+                        )
+                
+                length_hint = length if length is not None else total_duration - start
+                return self.run_ffmpeg(args, length_hint, on_progress)
+            
+            if progress_callback:
+                progress_callback(20, f"Decoding audio in {len(shards)} shards...")
+            
+            # Each worker thread only waits on its own ffmpeg process
+            with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+                results = list(pool.map(run_shard, range(len(shards))))
+            
+            for index, result in enumerate(results):
+                if result['returncode'] != 0:
+                    return False, f"Shard {index} failed with return code {result['returncode']}: {result['stderr']}"
+            
+            # Correctness check: shards must cover the audio stream without gaps or overlap
+            decoded = sum((result['progress'] or {}).get('out_time', 0) for result in results)
+            expected = float(video_info.get('audio_duration') or total_duration)
+            tolerance = max(0.5, expected * 0.001)
+            if abs(decoded - expected) > tolerance:
+                return False, (f"Shard durations do not add up: {decoded:.3f}s decoded, "
+                               f"{expected:.3f}s expected")
+            
+            # Shards may sit on different scratch tiers, so the list holds absolute paths
+            concat_list = scratch.allocate('shards.txt', 256 * len(shards))
+            with open(concat_list, 'w', encoding='utf-8') as f:
+                for shard_path in shard_paths:
+                    escaped = str(shard_path.resolve()).replace("'", "'\\''")
+                    f.write(f"file '{escaped}'\n")
+            
+            args = [
+                "-v", "error",
+                "-f", "concat",
+                "-safe", "0",
+                "-i", str(concat_list),
+                *self.audio_encoder_args(audio_config),
+                "-ac", channels,
+                "-ar", sample_rate,
+                "-y", str(output_path)
+            ]
+            audio_filter = self.build_audio_filter(audio_config)
+            if audio_filter:
+                args.insert(-2, "-af")
+                args.insert(-2, audio_filter)
+            
+            def on_encode_progress(event: Dict):
+                if progress_callback and event['percent'] is not None:
+                    progress_callback(min(70 + int(event['percent'] * 0.1), 80),
+                                      f"Encoding joined audio... {event['out_time']:.1f}s/{decoded:.1f}s")
+            
+            result = self.run_ffmpeg(args, decoded, on_encode_progress)
+            if result['returncode'] != 0:
+                return False, f"FFmpeg failed with return code {result['returncode']}: {result['stderr']}"
+            
+            if progress_callback:
+                progress_callback(100, "Audio extraction completed!")
+            
+            logger.info(f"Audio extracted in {len(shards)} shards: {output_path.name} "
+                        f"(decoded {decoded:.1f}s of {expected:.1f}s)")
+            return True, "Audio extraction completed successfully"
+            
+        except Exception as e:
+            return False, f"Sharded audio extraction failed: {str(e)}"
+        finally:
+            scratch.cleanup()
+    
+    def copy_audio_stream(self, video_path: Path, output_path: Path,
+                          progress_callback=None, video_info: Dict = None) -> Tuple[bool, str]:
+        """
+        Remux the first audio stream without re-encoding (-c:a copy)
+        
+        Args:
+            video_path: Path to input video file
+            output_path: Path to output audio file (container chosen by suffix)
+            progress_callback: Optional progress callback function
+            video_info: Pre-fetched video info to avoid duplicate calls
+            
+        Returns:
+            Tuple of (success, message)
+        """
+        try:
+            logger.info(f"Copying audio stream from: {video_path.name}")
+            
+            if video_info is None:
+                video_info = self.get_video_info(video_path)
+            total_duration = video_info.get('duration', 0)
+            
+            args = [
+                "-i", str(video_path),
+                "-map", "0:a:0",
+                "-vn",
+                "-c:a", "copy",
+                "-y",
+                str(output_path)
+            ]
+            
+            def on_progress(event: Dict):
+                if progress_callback and event['percent'] is not None:
+                    progress_callback(
+                        min(20 + int(event['percent'] * 0.6), 80),
+                        f"Copying audio stream... {event['out_time']:.1f}s/{total_duration:.1f}s"
+                    )
+            
+            result = self.run_ffmpeg(args, total_duration, on_progress)
+            
+            if result['returncode'] == 0:
+                if progress_callback:
+                    progress_callback(100, "Audio stream copied!")
+                logger.info(f"Audio stream copied: {output_path.name} ({result['elapsed']}s)")
+                return True, "Audio stream copy completed successfully"
+            
+            error_msg = f"FFmpeg failed with return code {result['returncode']}: {result['stderr']}"
+            logger.error(error_msg)
+            return False, error_msg
+            
+        except Exception as e:
+            error_msg = f"Audio stream copy failed: {str(e)}"
+            logger.error(error_msg)
+            return False, error_msg
+    
+    @contextmanager
+    def audio_pipe(self, input_path: Path, output_args: List[str], priority: int = PRIORITY_NORMAL,
+                   start: Optional[float] = None, end: Optional[float] = None,
+                   audio_filter: Optional[str] = None):
+        """
+        Decode the audio track and write it to ffmpeg's stdout
+        
+        The decode holds a heavy scheduler slot while the context is open, so
+        rate-limited consumers should copy the stream to a file first.
+        Leaving the context early (or on an exception) kills ffmpeg; reading
+        to EOF and leaving normally raises RuntimeError if ffmpeg failed.
+        
+        Args:
+            input_path: Path to input video/audio file
+            output_args: Output options (codec, channels, rate, -f muxer), without the output target
+            priority: Job priority (lower runs first)
+            start: Optional start time in seconds (input-side seek)
+            end: Optional end time in seconds
+            audio_filter: Optional -af filtergraph applied before the output conversion
+            
+        Yields:
+            Binary stdout stream of the ffmpeg process
+        """
+        seek_args = []
+        if start:
+            seek_args += ["-ss", f"{start:.6f}"]
+        if end is not None:
+            seek_args += ["-t", f"{max(0.0, end - (start or 0.0)):.6f}"]
+        
+        with ffmpeg_scheduler.slot('heavy', priority, Path(input_path).name):
+            cmd = [
+                str(self.ffmpeg_path),
+                "-threads", str(ffmpeg_scheduler.threads_for('heavy')),
+                "-v", "error"
+            ] + seek_args + [
+                "-i", str(input_path),
+                "-vn"
+            ] + (["-af", audio_filter] if audio_filter else []) + list(output_args) + [
+                "pipe:1"
+            ]
+            logger.info(f"执行 FFmpeg 命令: {' '.join(cmd)}")
+            
+            stderr_tail = deque(maxlen=50)
+            process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+            
+            def _drain_stderr():
+                for raw_line in process.stderr:
+                    line = raw_line.decode('utf-8', errors='replace').rstrip()
+                    if line:
+                        stderr_tail.append(line)
+            
+            stderr_reader = threading.Thread(target=_drain_stderr, daemon=True)
+            stderr_reader.start()
+            
+            completed = False
+            try:
+                yield process.stdout
+                completed = True
+            finally:
+                if not completed and process.poll() is None:
+                    process.kill()
+                process.stdout.close()
+                returncode = process.wait()
+                stderr_reader.join()
+            
+            if returncode != 0:
+                raise RuntimeError(f"FFmpeg audio pipe failed with return code {returncode}: "
+                                   + '\n'.join(stderr_tail))
+    
+    @contextmanager
+    def pcm_pipe(self, input_path: Path, sample_rate: int = 16000, channels: int = 1,
+                 sample_format: str = 's16le', priority: int = PRIORITY_NORMAL,
+                 start: Optional[float] = None, end: Optional[float] = None,
+                 audio_filter: Optional[str] = None):
+        """
+        Decode the audio track to raw PCM on ffmpeg's stdout (see audio_pipe)
+        
+        Args:
+            input_path: Path to input video/audio file
+            sample_rate: Output sample rate in Hz
+            channels: Output channel count
+            sample_format: 's16le' or 'f32le'
+            priority: Job priority (lower runs first)
+            start: Optional start time in seconds (input-side seek)
+            end: Optional end time in seconds
+            audio_filter: Optional -af filtergraph applied before the format conversion
+            
+        Yields:
+            Binary stdout stream of the ffmpeg process
+        """
+        if sample_format not in ('s16le', 'f32le'):
+            raise ValueError(f"Unsupported PCM sample format: {sample_format}")
+        
+        output_args = [
+            "-ac", str(channels),
+            "-ar", str(sample_rate),
+            "-acodec", f"pcm_{sample_format}",
+            "-f", sample_format
+        ]
+        with self.audio_pipe(input_path, output_args, priority, start, end, audio_filter) as stream:
+            yield stream
+    
+    def iter_pcm(self, input_path: Path, chunk_size: int = 65536, sample_rate: int = 16000,
+                 channels: int = 1, sample_format: str = 's16le', priority: int = PRIORITY_NORMAL):
+        """
+        Decode the audio track to raw PCM on a pipe and yield it in chunks
+        
+        No intermediate file is written. Closing the generator early kills ffmpeg.
+        
+        Args:
+            input_path: Path to input video/audio file
+            chunk_size: Bytes per yielded chunk
+            sample_rate: Output sample rate in Hz
+            channels: Output channel count
+            sample_format: 's16le' or 'f32le'
+            priority: Job priority (lower runs first)
+            
+        Yields:
+            bytes chunks of PCM (the last one may be shorter)
+        """
+        with self.pcm_pipe(input_path, sample_rate, channels, sample_format, priority) as stream:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    
     def validate_video_file(self, video_path: Path) -> Tuple[bool, str]:
         """
         Validate video file using FFprobe
@@ -311,18 +1561,37 @@ class FFmpegTools:
             return 0.0
 
 # Convenience functions
-def get_video_info(video_path: str) -> Dict:
+def get_video_info(video_path: str, fast: bool = False) -> Dict:
     """
     Convenience function to get video information
     
     Args:
         video_path: Path to video file
+        fast: Use fast probe mode
         
     Returns:
         Dictionary containing video information
     """
     tools = FFmpegTools()
-    return tools.get_video_info(Path(video_path))
+    return tools.get_video_info(Path(video_path), fast=fast)
+
+def get_probe_cache_stats() -> Dict:
+    """
+    Get probe cache hit/miss counters
+    
+    Returns:
+        Dictionary of cache statistics
+    """
+    return probe_cache.get_stats()
+
+def get_scheduler_stats() -> Dict:
+    """
+    Get FFmpeg scheduler slot usage, queue wait and run times
+    
+    Returns:
+        Dictionary of per-pool statistics
+    """
+    return ffmpeg_scheduler.get_stats()
 
 def extract_audio(video_path: str, output_path: str, audio_config: Dict, 
                  progress_callback=None, video_info: Dict = None) -> Tuple[bool, str]:
@@ -357,60 +1626,68 @@ def validate_video_file(video_path: str) -> Tuple[bool, str]:
     tools = FFmpegTools()
     return tools.validate_video_file(Path(video_path)) 
 
-def generate_video_thumbnails(input_path: str, output_dir: str, interval: int = 10) -> List[Dict]:
+def get_ffmpeg_executable() -> str:
+    """
+    获取FFmpeg可执行文件路径
+    
+    Returns:
+        str: FFmpeg可执行文件路径
+    """
+    return str(FFmpegTools().ffmpeg_path)
+
+def generate_video_thumbnails(input_path: str, output_dir: str, interval: int = 10,
+                              progress_handler=None) -> List[Dict]:
     """
-    生成视频缩略图
+    生成视频缩略图（单次解码，只解码关键帧）
     
     Args:
         input_path: 输入视频文件路径
         output_dir: 输出目录
         interval: 缩略图间隔（秒）
+        progress_handler: 可选的进度事件回调（接收结构化进度字典）
         
     Returns:
         List[Dict]: 缩略图信息列表
     """
-    import os
-    from pathlib import Path
-    
     try:
         # 确保输出目录存在
         Path(output_dir).mkdir(parents=True, exist_ok=True)
         
-        # 获取视频信息
-        video_info = get_video_info(input_path)
+        tools = FFmpegTools()
+        
+        # 获取视频信息（只需时长，使用快速探测）
+        video_info = tools.get_video_info(Path(input_path), fast=True)
         duration = float(video_info.get('duration', 0))
         
-        thumbnails = []
+        # 一次FFmpeg调用生成全部缩略图，第n张对应时间 n * interval
+        args = [
+            '-v', 'error',
+            '-skip_frame', 'nokey',  # 只解码关键帧
+            '-i', input_path,
+            '-an',
+            '-vf', f'fps=1/{interval},scale=160:90',
+            '-vsync', 'vfr',
+            '-start_number', '0',
+            '-y',  # 覆盖输出文件
+            os.path.join(output_dir, 'thumb_%04d.jpg')
+        ]
+        
+        result = tools.run_ffmpeg(args, duration, progress_handler, priority=PRIORITY_HIGH)
+        if result['returncode'] != 0:
+            logger.error(f"生成缩略图失败: {result['stderr']}")
+            return []
         
-        # 生成缩略图
-        for i in range(0, int(duration), interval):
-            thumbnail_filename = f"thumb_{i:04d}.jpg"
+        thumbnails = []
+        for n, i in enumerate(range(0, int(duration), interval)):
+            thumbnail_filename = f"thumb_{n:04d}.jpg"
             thumbnail_path = os.path.join(output_dir, thumbnail_filename)
-            
-            # FFmpeg命令生成缩略图
-            cmd = [
-                get_ffmpeg_executable(),
-                '-i', input_path,
-                '-ss', str(i),  # 跳转到指定时间
-                '-vframes', '1',  # 只生成一帧
-                '-vf', 'scale=160:90',  # 缩放到160x90
-                '-y',  # 覆盖输出文件
-                thumbnail_path
-            ]
-            
-            try:
-                result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-                if os.path.exists(thumbnail_path):
-                    thumbnails.append({
-                        'time': i,
-                        'filename': thumbnail_filename,
-                        'path': thumbnail_path,
-                        'url': f'/uploads/thumbnails/{os.path.basename(output_dir)}/{thumbnail_filename}'
-                    })
-                    logger.info(f"生成缩略图成功: {thumbnail_filename} (时间: {i}s)")
-            except subprocess.CalledProcessError as e:
-                logger.error(f"生成缩略图失败 {thumbnail_filename}: {e.stderr}")
-                continue
+            if os.path.exists(thumbnail_path):
+                thumbnails.append({
+                    'time': i,
+                    'filename': thumbnail_filename,
+                    'path': thumbnail_path,
+                    'url': f'/uploads/thumbnails/{os.path.basename(output_dir)}/{thumbnail_filename}'
+                })
         
         logger.info(f"完成视频缩略图生成，共 {len(thumbnails)} 个缩略图")
         return thumbnails
@@ -419,7 +1696,8 @@ def generate_video_thumbnails(input_path: str, output_dir: str, interval: int =
         logger.error(f"生成视频缩略图失败: {str(e)}")
         return []
 
-def extract_video_frame(input_path: str, time_seconds: float, output_path: str, width: int = 160, height: int = 90) -> bool:
+def extract_video_frame(input_path: str, time_seconds: float, output_path: str, width: int = 160, height: int = 90,
+                        progress_handler=None) -> bool:
     """
     提取视频指定时间的帧
     
@@ -429,27 +1707,391 @@ def extract_video_frame(input_path: str, time_seconds: float, output_path: str,
         output_path: 输出图片路径
         width: 图片宽度
         height: 图片高度
+        progress_handler: 可选的进度事件回调（接收结构化进度字典）
         
     Returns:
         bool: 是否成功
     """
     try:
-        cmd = [
-            get_ffmpeg_executable(),
-            '-i', input_path,
-            '-ss', str(time_seconds),
+        from plugins.common.keyframes import keyframe_seek_args
+        
+        # 输入端跳到前一个关键帧，只解码剩余部分（耗时与视频长度无关）
+        input_seek, output_seek = keyframe_seek_args(input_path, time_seconds)
+        args = input_seek + [
+            '-i', input_path
+        ] + output_seek + [
             '-vframes', '1',
             '-vf', f'scale={width}:{height}',
             '-y',
             output_path
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        result = FFmpegTools().run_ffmpeg(args, None, progress_handler,
+                                          kind='light', priority=PRIORITY_HIGH)
+        if result['returncode'] != 0:
+            logger.error(f"提取视频帧失败: {result['stderr']}")
+            return False
         return os.path.exists(output_path)
         
-    except subprocess.CalledProcessError as e:
-        logger.error(f"提取视频帧失败: {e.stderr}")
-        return False
     except Exception as e:
         logger.error(f"提取视频帧失败: {str(e)}")
-        return False 
\ No newline at end of file
+        return False
+
+# 批量取帧时单次FFmpeg调用的最大输出帧数
+FRAMES_PER_RUN = 32
+
+# 每个解码窗口在最后一个时间点之后多解码的秒数
+FRAME_WINDOW_TAIL = 1.0
+
+def get_video_fingerprint(video_path) -> str:
+    """
+    获取视频文件指纹（解析后的路径 + 大小 + 修改时间的SHA1）
+    
+    指纹只标识这一个文件，不同视频即使首尾内容相同也不会共用帧缓存目录；
+    文件被替换后大小或修改时间变化，指纹随之失效，且不需要读取文件内容
+    
+    Args:
+        video_path: 视频文件路径
+        
+    Returns:
+        str: 40位十六进制指纹
+    """
+    path = Path(video_path).resolve()
+    stat = path.stat()
+    key = f"{path}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def _plan_frame_windows(times: List[float], keyframe_index) -> List[Dict]:
+    """
+    把排好序的时间点分组为解码窗口
+    
+    窗口从第一个时间点之前的关键帧开始；下一个时间点的关键帧落在当前窗口内时，
+    继续解码比重新跳转更便宜，因此并入同一窗口
+    """
+    windows = []
+    for t in times:
+        keyframe = keyframe_index.preceding(t) if keyframe_index else t
+        if windows and keyframe <= windows[-1]['end'] and len(windows[-1]['times']) < FRAMES_PER_RUN:
+            windows[-1]['times'].append(t)
+            windows[-1]['end'] = t
+        else:
+            windows.append({'start': keyframe, 'end': t, 'times': [t]})
+    return windows
+
+def extract_video_frames(input_path: str, timestamps: List[float], output_dir: str,
+                         width: int = 160, height: int = 90, progress_handler=None) -> List[Dict]:
+    """
+    批量提取视频帧（多个时间点共用一次解码）
+    
+    时间点按关键帧分成解码窗口，每个窗口在输入端跳到关键帧后只解码到最后一个时间点；
+    一次FFmpeg调用包含多个窗口，每个时间点由 select 表达式取其后的第一帧。
+    结果按 (视频指纹, 时间, 尺寸) 缓存在 output_dir/<指纹>/ 下。
+    
+    Args:
+        input_path: 输入视频文件路径
+        timestamps: 时间点列表（秒）
+        output_dir: 帧缓存目录
+        width: 图片宽度
+        height: 图片高度
+        progress_handler: 可选的进度事件回调（接收结构化进度字典）
+        
+    Returns:
+        List[Dict]: 按请求顺序的帧信息列表（time, path），超出视频时长的时间点不返回
+    """
+    try:
+        from plugins.common.keyframes import get_keyframe_index
+        
+        cache_dir = Path(output_dir) / get_video_fingerprint(input_path)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        
+        def frame_path(t: float) -> Path:
+            return cache_dir / f"{int(round(t * 1000))}_{width}x{height}.jpg"
+        
+        requested = [round(max(0.0, float(t)), 3) for t in timestamps]
+        missing = sorted(t for t in set(requested) if not frame_path(t).exists())
+        
+        if missing:
+            tools = FFmpegTools()
+            windows = _plan_frame_windows(missing, get_keyframe_index(input_path))
+            
+            # 每次FFmpeg调用最多输出 FRAMES_PER_RUN 帧
+            batches, batch = [], []
+            for window in windows:
+                if batch and sum(len(w['times']) for w in batch) + len(window['times']) > FRAMES_PER_RUN:
+                    batches.append(batch)
+                    batch = []
+                batch.append(window)
+            if batch:
+                batches.append(batch)
+            
+            for batch in batches:
+                args = ['-v', 'error']
+                for window in batch:
+                    span = window['end'] - window['start'] + FRAME_WINDOW_TAIL
+                    args += ['-ss', f"{window['start']:.6f}", '-t', f"{span:.6f}", '-i', str(input_path)]
+                
+                filter_parts = []
+                outputs = []
+                for k, window in enumerate(batch):
+                    labels = [f"w{k}_{j}" for j in range(len(window['times']))]
+                    if len(labels) > 1:
+                        filter_parts.append(f"[{k}:v]split={len(labels)}" + ''.join(f"[{label}]" for label in labels))
+                        sources = [f"[{label}]" for label in labels]
+                    else:
+                        sources = [f"[{k}:v]"]
+                    for j, t in enumerate(window['times']):
+                        # 窗口内时间从跳转点（关键帧）开始计
+                        offset = t - window['start']
+                        filter_parts.append(f"{sources[j]}select='gte(t,{offset:.6f})',scale={width}:{height}[f{k}_{j}]")
+                        outputs += ['-map', f"[f{k}_{j}]", '-frames:v', '1', '-update', '1',
+                                    '-q:v', '4', '-y', str(frame_path(t))]
+                
+                args += ['-filter_complex', ';'.join(filter_parts)] + outputs
+                duration = sum(w['end'] - w['start'] + FRAME_WINDOW_TAIL for w in batch)
+                result = tools.run_ffmpeg(args, duration, progress_handler, priority=PRIORITY_HIGH)
+                if result['returncode'] != 0:
+                    logger.error(f"批量提取视频帧失败: {result['stderr']}")
+            
+            logger.info(f"批量提取视频帧完成: {len(missing)} 帧, {len(windows)} 个窗口, {len(batches)} 次调用")
+        
+        frames = []
+        for t in requested:
+            path = frame_path(t)
+            if path.exists():
+                frames.append({'time': t, 'path': str(path)})
+        return frames
+        
+    except Exception as e:
+        logger.error(f"批量提取视频帧失败: {str(e)}")
+        return []
+
+# 波形峰值生成锁（按输出目录）
+_waveform_locks = {}
+_waveform_locks_guard = threading.Lock()
+
+def get_waveform_lock(output_dir: Path) -> threading.Lock:
+    """获取输出目录对应的波形生成锁"""
+    key = str(output_dir.resolve())
+    with _waveform_locks_guard:
+        if key not in _waveform_locks:
+            _waveform_locks[key] = threading.Lock()
+        return _waveform_locks[key]
+
+def load_waveform_index(output_dir: Path, source: Optional[Dict] = None) -> Optional[Dict]:
+    """读取波形索引，源文件变化时返回 None"""
+    index_path = output_dir / 'peaks.json'
+    if not index_path.exists():
+        return None
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if source is not None and index.get('source') != source:
+            return None
+        return index
+    except Exception as e:
+        logger.warning(f"读取波形索引失败 {index_path}: {str(e)}")
+        return None
+
+class WaveformPeakBuilder:
+    """
+    Incremental min/max peak pyramid builder
+    
+    Raw mono s16le PCM is fed in arbitrary byte chunks; the finest level is
+    reduced block by block so the full signal is never held in memory.
+    Coarser levels are reduced from the finest one when writing.
+    """
+    
+    def __init__(self, sample_rate: int = None, levels: List[int] = None, bits: int = None):
+        """
+        Initialize builder
+        
+        Args:
+            sample_rate: Sample rate of the fed PCM
+            levels: Samples per pixel of every level (multiples of the smallest)
+            bits: 8 or 16 bit peak values
+        """
+        self.sample_rate = int(sample_rate or FFMPEG_CONFIG.get('waveform_sample_rate', 8000))
+        levels = sorted(int(level) for level in (levels or FFMPEG_CONFIG.get('waveform_levels', [32, 128, 512, 2048, 8192])))
+        self.base = levels[0]
+        self.levels = [level for level in levels if level % self.base == 0]
+        self.bits = 16 if int(bits or FFMPEG_CONFIG.get('waveform_bits', 8)) == 16 else 8
+        self.samples = 0
+        self._blocks = []
+        self._carry = np.empty(0, dtype=np.int16)
+        self._byte_carry = b''
+    
+    @property
+    def duration(self) -> float:
+        """Seconds of audio fed so far"""
+        return self.samples / self.sample_rate
+    
+    def feed(self, data: bytes):
+        """
+        Add raw s16le PCM bytes
+        
+        Args:
+            data: PCM bytes (may split a sample)
+        """
+        if self._byte_carry:
+            data = self._byte_carry + data
+        usable_bytes = len(data) - len(data) % 2
+        self._byte_carry = bytes(data[usable_bytes:])
+        samples = np.frombuffer(data, dtype='<i2', count=usable_bytes // 2)
+        self.samples += samples.size
+        
+        if self._carry.size:
+            samples = np.concatenate((self._carry, samples))
+        usable = samples.size - samples.size % self.base
+        if usable:
+            blocks = samples[:usable].reshape(-1, self.base)
+            self._blocks.append(np.stack((blocks.min(axis=1), blocks.max(axis=1)), axis=1))
+        self._carry = samples[usable:].copy()
+    
+    def write(self, output_dir: Path, source: Dict) -> Dict:
+        """
+        Write every level and the peaks.json index
+        
+        Args:
+            output_dir: Waveform data directory
+            source: Identity (size, mtime_ns) of the source file
+            
+        Returns:
+            Waveform index dictionary
+        """
+        blocks = list(self._blocks)
+        if self._carry.size:
+            blocks.append(np.array([[self._carry.min(), self._carry.max()]], dtype=np.int16))
+        base_peaks = np.concatenate(blocks) if blocks else np.zeros((0, 2), dtype=np.int16)
+        
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        level_entries = []
+        for level in self.levels:
+            factor = level // self.base
+            peaks = base_peaks
+            if factor > 1 and len(base_peaks):
+                # 补齐到 factor 的整数倍后归约（补齐部分用边缘值，不影响 min/max）
+                pad = (-len(base_peaks)) % factor
+                padded = np.concatenate((base_peaks, np.repeat(base_peaks[-1:], pad, axis=0)))
+                grouped = padded.reshape(-1, factor, 2)
+                peaks = np.stack((grouped[:, :, 0].min(axis=1), grouped[:, :, 1].max(axis=1)), axis=1)
+            if self.bits == 8:
+                peaks = (peaks >> 8).astype(np.int8)
+            file_name = f"peaks_{level}.bin"
+            np.ascontiguousarray(peaks).tofile(output_dir / file_name)
+            level_entries.append({'samples_per_pixel': level, 'length': int(len(peaks)), 'file': file_name})
+        
+        index = {
+            'sample_rate': self.sample_rate,
+            'bits': self.bits,
+            'duration': self.duration,
+            'levels': level_entries,
+            'source': source
+        }
+        # 索引最后写入，作为生成完成的标志
+        with open(output_dir / 'peaks.json', 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        
+        logger.info(f"完成波形峰值写入: {output_dir}, {len(base_peaks)} 个基础峰值, 级别: {self.levels}")
+        return index
+
+def generate_waveform_peaks(input_path: str, output_dir: str, progress_handler=None) -> Dict:
+    """
+    生成多分辨率波形峰值金字塔
+    
+    音频只解码一次（管道输出单声道 s16le），按最细级别逐块计算每像素的 min/max，
+    更粗的级别由细级别归约得到。每个级别存为 (n, 2) 的 int8/int16 原始数组文件
+    peaks_<每像素采样数>.bin，可直接 np.memmap；peaks.json 记录级别和源文件信息。
+    源文件未变化时直接返回已有索引。
+    
+    Args:
+        input_path: 输入视频/音频文件路径
+        output_dir: 波形数据目录
+        progress_handler: 可选的进度回调（参数为已解码秒数）
+        
+    Returns:
+        Dict: 波形索引（失败时为空字典）
+    """
+    output_dir = Path(output_dir)
+    try:
+        stat = Path(input_path).stat()
+        source = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        
+        index = load_waveform_index(output_dir, source)
+        if index is not None:
+            return index
+        
+        with get_waveform_lock(output_dir):
+            index = load_waveform_index(output_dir, source)
+            if index is not None:
+                return index
+            
+            builder = WaveformPeakBuilder()
+            for chunk in FFmpegTools().iter_pcm(Path(input_path), builder.base * 4096, builder.sample_rate,
+                                                1, 's16le', PRIORITY_HIGH):
+                builder.feed(chunk)
+                if progress_handler:
+                    progress_handler(builder.duration)
+            
+            return builder.write(output_dir, source)
+        
+    except Exception as e:
+        logger.error(f"生成波形峰值失败: {str(e)}")
+        return {}
+
+def read_waveform_peaks(output_dir: str, start: float, end: float, pixels: int) -> Dict:
+    """
+    读取缩放窗口内的波形峰值
+    
+    选择每像素采样数不超过窗口所需值的最粗级别，对内存映射文件切片，
+    再按整数倍归约到约 pixels 列，返回的数据量只与 pixels 有关。
+    
+    Args:
+        output_dir: 波形数据目录
+        start: 窗口开始时间（秒）
+        end: 窗口结束时间（秒）
+        pixels: 窗口宽度（像素）
+        
+    Returns:
+        Dict: 窗口峰值（min/max 列表及每列对应的时长），没有波形数据时为空字典
+    """
+    index = load_waveform_index(Path(output_dir))
+    if not index or not index.get('levels'):
+        return {}
+    
+    sample_rate = index['sample_rate']
+    start = max(0.0, float(start))
+    end = max(start, float(end))
+    pixels = max(1, int(pixels))
+    needed = (end - start) * sample_rate / pixels
+    
+    candidates = [level for level in index['levels'] if level['samples_per_pixel'] <= needed]
+    level = candidates[-1] if candidates else index['levels'][0]
+    samples_per_pixel = level['samples_per_pixel']
+    
+    dtype = np.int16 if index.get('bits') == 16 else np.int8
+    if level['length'] == 0:
+        peaks = np.zeros((0, 2), dtype=dtype)
+    else:
+        peaks = np.memmap(Path(output_dir) / level['file'], dtype=dtype, mode='r', shape=(level['length'], 2))
+    
+    first = min(level['length'], int(start * sample_rate // samples_per_pixel))
+    last = min(level['length'], int(np.ceil(end * sample_rate / samples_per_pixel)))
+    window = np.asarray(peaks[first:last])
+    
+    # 在所选级别上再按整数倍归约，使列数接近 pixels
+    factor = max(1, int(needed // samples_per_pixel))
+    if factor > 1 and len(window):
+        pad = (-len(window)) % factor
+        padded = np.concatenate((window, np.repeat(window[-1:], pad, axis=0)))
+        grouped = padded.reshape(-1, factor, 2)
+        window = np.stack((grouped[:, :, 0].min(axis=1), grouped[:, :, 1].max(axis=1)), axis=1)
+    
+    return {
+        'start': first * samples_per_pixel / sample_rate,
+        'pixel_duration': samples_per_pixel * factor / sample_rate,
+        'bits': index.get('bits', 8),
+        'duration': index.get('duration', 0),
+        'min': window[:, 0].tolist(),
+        'max': window[:, 1].tolist()
+    }
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Keyframe Index
+Per-video keyframe timestamps used to seek on the input side to the nearest preceding keyframe
+"""
+
+import json
+import bisect
+import logging
+import subprocess
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from plugins.common.ffmpeg_utils import FFmpegTools, ffmpeg_scheduler, PRIORITY_NORMAL
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = '.keyframes.json'
+
+# Loaded indexes, keyed by resolved video path
+_index_cache = OrderedDict()
+_index_cache_size = 64
+_index_cache_lock = threading.Lock()
+
+# Locks guarding index builds per video
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+def _get_build_lock(video_path: Path) -> threading.Lock:
+    """Get the build lock for a video"""
+    key = str(video_path.resolve())
+    with _build_locks_guard:
+        if key not in _build_locks:
+            _build_locks[key] = threading.Lock()
+        return _build_locks[key]
+
+class KeyframeIndex:
+    """
+    Keyframe index of one video
+    
+    Built once from the demuxer (ffprobe packet pts with the key flag, no
+    decoding) and stored next to the video as ``<name>.keyframes.json``.
+    Timestamps are relative to the file start time, i.e. directly usable
+    with ``-ss``. The index is rebuilt when the video file changes.
+    """
+    
+    def __init__(self, video_path: Path, keyframes: List[float], source: Dict):
+        """
+        Initialize index
+        
+        Args:
+            video_path: Path to the indexed video
+            keyframes: Sorted keyframe timestamps in seconds
+            source: Identity (size, mtime_ns) of the indexed file
+        """
+        self.video_path = Path(video_path)
+        self.keyframes = keyframes
+        self.source = source
+    
+    @staticmethod
+    def index_path(video_path: Path) -> Path:
+        """Location of the stored index for a video"""
+        video_path = Path(video_path)
+        return video_path.with_name(video_path.name + INDEX_SUFFIX)
+    
+    @staticmethod
+    def source_key(video_path: Path) -> Dict:
+        """Identity of the video file used to invalidate stored indexes"""
+        stat = Path(video_path).stat()
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    
+    @classmethod
+    def load(cls, video_path: Path) -> Optional['KeyframeIndex']:
+        """Load the stored index if it is still valid"""
+        index_path = cls.index_path(video_path)
+        if not index_path.exists():
+            return None
+        
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('source') != cls.source_key(video_path):
+                return None
+            return cls(video_path, data.get('keyframes', []), data['source'])
+        except Exception as e:
+            logger.warning(f"Failed to read keyframe index {index_path}: {str(e)}")
+            return None
+    
+    @classmethod
+    def build(cls, video_path: Path) -> Optional['KeyframeIndex']:
+        """
+        Build and store the index with a demux-only ffprobe pass
+        
+        Args:
+            video_path: Path to the video
+            
+        Returns:
+            KeyframeIndex, or None if the video has no readable video stream
+        """
+        video_path = Path(video_path)
+        source = cls.source_key(video_path)
+        cmd = [
+            str(FFmpegTools().ffprobe_path),
+            "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "packet=pts_time,dts_time,flags:format=start_time",
+            "-of", "compact",
+            str(video_path)
+        ]
+        logger.info(f"执行 FFprobe 命令: {' '.join(cmd)}")
+        
+        keyframes = []
+        start_time = 0.0
+        # A full demux of the file: queued behind interactive frame grabs
+        with ffmpeg_scheduler.slot('light', PRIORITY_NORMAL, video_path.name):
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+            completed = False
+            try:
+                for line in process.stdout:
+                    section, _, rest = line.strip().partition('|')
+                    fields = dict(item.split('=', 1) for item in rest.split('|') if '=' in item)
+                    if section == 'packet':
+                        if 'K' not in fields.get('flags', ''):
+                            continue
+                        timestamp = fields.get('pts_time', 'N/A')
+                        if timestamp == 'N/A':
+                            timestamp = fields.get('dts_time', 'N/A')
+                        if timestamp != 'N/A':
+                            keyframes.append(float(timestamp))
+                    elif section == 'format' and fields.get('start_time', 'N/A') != 'N/A':
+                        start_time = float(fields['start_time'])
+                completed = True
+            finally:
+                if not completed and process.poll() is None:
+                    process.kill()
+                process.stdout.close()
+                returncode = process.wait()
+        
+        if returncode != 0 or not keyframes:
+            logger.warning(f"No keyframes indexed for {video_path.name} (ffprobe return code {returncode})")
+            return None
+        
+        keyframes = sorted(round(max(0.0, t - start_time), 6) for t in keyframes)
+        with open(cls.index_path(video_path), 'w', encoding='utf-8') as f:
+            json.dump({'source': source, 'start_time': start_time, 'keyframes': keyframes}, f)
+        
+        logger.info(f"Keyframe index built: {video_path.name}, {len(keyframes)} keyframes")
+        return cls(video_path, keyframes, source)
+    
+    def preceding(self, time_seconds: float) -> float:
+        """Nearest keyframe at or before the given time"""
+        position = bisect.bisect_right(self.keyframes, time_seconds + 1e-6)
+        return self.keyframes[position - 1] if position else 0.0
+    
+    def seek_args(self, time_seconds: float) -> Tuple[List[str], List[str]]:
+        """
+        Split a seek into an input-side jump and an output-side remainder
+        
+        Args:
+            time_seconds: Target time in seconds
+            
+        Returns:
+            Tuple of (args placed before -i, args placed after -i)
+        """
+        keyframe = self.preceding(time_seconds)
+        input_args = ["-ss", f"{keyframe:.6f}"] if keyframe > 0 else []
+        remainder = time_seconds - keyframe
+        output_args = ["-ss", f"{remainder:.6f}"] if remainder > 1e-6 else []
+        return input_args, output_args
+
+def get_keyframe_index(video_path) -> Optional[KeyframeIndex]:
+    """
+    Get the keyframe index of a video, building and storing it on first use
+    
+    Args:
+        video_path: Path to the video
+        
+    Returns:
+        KeyframeIndex, or None if it cannot be built
+    """
+    video_path = Path(video_path)
+    key = str(video_path.resolve())
+    
+    try:
+        source = KeyframeIndex.source_key(video_path)
+    except OSError:
+        return None
+    
+    with _index_cache_lock:
+        index = _index_cache.get(key)
+        if index is not None and index.source == source:
+            _index_cache.move_to_end(key)
+            return index
+    
+    with _get_build_lock(video_path):
+        index = KeyframeIndex.load(video_path)
+        if index is None:
+            try:
+                index = KeyframeIndex.build(video_path)
+            except Exception as e:
+                logger.error(f"构建关键帧索引失败: {str(e)}")
+                return None
+        if index is None:
+            return None
+    
+    with _index_cache_lock:
+        _index_cache[key] = index
+        _index_cache.move_to_end(key)
+        while len(_index_cache) > _index_cache_size:
+            _index_cache.popitem(last=False)
+    return index
+
+def keyframe_seek_args(video_path, time_seconds: float) -> Tuple[List[str], List[str]]:
+    """
+    Seek arguments for decoding from the nearest preceding keyframe
+    
+    Falls back to a plain input-side seek when no index is available.
+    
+    Args:
+        video_path: Path to the video
+        time_seconds: Target time in seconds
+        
+    Returns:
+        Tuple of (args placed before -i, args placed after -i)
+    """
+    index = get_keyframe_index(video_path)
+    if index is None:
+        return ["-ss", f"{time_seconds:.6f}"], []
+    return index.seek_args(time_seconds)
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Media Preparation
+Decodes an upload once and writes every derived artifact (MP3, ASR PCM, waveform peaks,
+timeline sprites) from a single split filtergraph, tracked in a per-upload artifact registry
+"""
+
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from plugins.config import MP4_TO_MP3_CONFIG
+from plugins.common.ffmpeg_utils import (
+    FFmpegTools, WaveformPeakBuilder, PRIORITY_NORMAL, load_waveform_index, get_waveform_lock,
+    audio_output_suffix
+)
+from plugins.common.timeline import TimelineSpriteGenerator
+
+logger = logging.getLogger(__name__)
+
+ARTIFACTS_SUFFIX = '.artifacts.json'
+
+# Sample rate of the ASR PCM artifact
+ASR_SAMPLE_RATE = 16000
+
+_registry_lock = threading.Lock()
+
+def derived_paths(video_path: Path) -> Dict[str, Path]:
+    """
+    Canonical locations of the artifacts derived from an upload
+    
+    Args:
+        video_path: Path to the uploaded file
+        
+    Returns:
+        Dictionary with thumbnails, waveform and derived directories
+    """
+    video_path = Path(video_path)
+    subdir = video_path.name.replace('.', '_')
+    upload_dir = video_path.parent
+    return {
+        'thumbnails': upload_dir / 'thumbnails' / subdir,
+        'waveform': upload_dir / 'waveforms' / subdir,
+        'derived': upload_dir / 'derived' / subdir
+    }
+
+def _source_key(video_path: Path) -> Dict:
+    """Identity of the upload used to invalidate registered artifacts"""
+    stat = Path(video_path).stat()
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def _registry_path(video_path: Path) -> Path:
+    """Location of an upload's artifact registry"""
+    video_path = Path(video_path)
+    return video_path.with_name(video_path.name + ARTIFACTS_SUFFIX)
+
+def load_artifacts(video_path) -> Dict[str, Dict]:
+    """
+    Registered artifacts of an upload that are still valid
+    
+    An artifact is dropped when the upload changed since it was registered
+    or when its file is gone.
+    
+    Args:
+        video_path: Path to the uploaded file
+        
+    Returns:
+        Dictionary mapping artifact kind to its entry (with an absolute 'path')
+    """
+    video_path = Path(video_path)
+    registry_path = _registry_path(video_path)
+    if not registry_path.exists():
+        return {}
+    
+    try:
+        with open(registry_path, 'r', encoding='utf-8') as f:
+            registry = json.load(f)
+        if registry.get('source') != _source_key(video_path):
+            return {}
+    except Exception as e:
+        logger.warning(f"Failed to read artifact registry {registry_path}: {str(e)}")
+        return {}
+    
+    artifacts = {}
+    for kind, entry in registry.get('artifacts', {}).items():
+        path = video_path.parent / entry['path']
+        if path.exists():
+            artifacts[kind] = dict(entry, path=str(path))
+    return artifacts
+
+def register_artifacts(video_path, artifacts: Dict[str, Dict]):
+    """
+    Add or replace derived artifacts in an upload's registry
+    
+    Args:
+        video_path: Path to the uploaded file
+        artifacts: Dictionary mapping artifact kind to an entry with an absolute 'path'
+    """
+    video_path = Path(video_path)
+    source = _source_key(video_path)
+    created = datetime.now().isoformat()
+    
+    with _registry_lock:
+        registry = {'source': source, 'artifacts': {}}
+        registry_path = _registry_path(video_path)
+        if registry_path.exists():
+            try:
+                with open(registry_path, 'r', encoding='utf-8') as f:
+                    existing = json.load(f)
+                if existing.get('source') == source:
+                    registry = existing
+            except Exception as e:
+                logger.warning(f"Replacing unreadable artifact registry {registry_path}: {str(e)}")
+        
+        for kind, entry in artifacts.items():
+            registry['artifacts'][kind] = dict(
+                entry,
+                path=os.path.relpath(entry['path'], video_path.parent),
+                created=created
+            )
+        
+        with open(registry_path, 'w', encoding='utf-8') as f:
+            json.dump(registry, f, ensure_ascii=False, indent=2)
+
+def discard_artifact(video_path, kind: str):
+    """
+    Delete a derived artifact and drop it from the upload's registry
+    
+    Args:
+        video_path: Path to the uploaded file
+        kind: Artifact kind (mp3, asr_pcm, waveform, thumbnails)
+    """
+    video_path = Path(video_path)
+    
+    with _registry_lock:
+        registry_path = _registry_path(video_path)
+        if not registry_path.exists():
+            return
+        try:
+            with open(registry_path, 'r', encoding='utf-8') as f:
+                registry = json.load(f)
+        except Exception as e:
+            logger.warning(f"Failed to read artifact registry {registry_path}: {str(e)}")
+            return
+        
+        entry = registry.get('artifacts', {}).pop(kind, None)
+        if entry is None:
+            return
+        with open(registry_path, 'w', encoding='utf-8') as f:
+            json.dump(registry, f, ensure_ascii=False, indent=2)
+    
+    path = video_path.parent / entry['path']
+    if path.is_file():
+        path.unlink()
+        logger.info(f"Discarded {kind} artifact: {path.name}")
+
+def get_artifact(video_path, kind: str) -> Optional[Path]:
+    """
+    Path of one valid registered artifact
+    
+    Args:
+        video_path: Path to the uploaded file
+        kind: Artifact kind (mp3, asr_pcm, waveform, thumbnails)
+        
+    Returns:
+        Path, or None if the artifact is missing or stale
+    """
+    entry = load_artifacts(video_path).get(kind)
+    return Path(entry['path']) if entry else None
+
+class MediaPreparer:
+    """
+    Single-decode "prepare media" job
+    
+    One ffmpeg run decodes the upload once and splits it into:
+    - the downloadable MP3 (with the configured silence/loudness filters)
+    - 16 kHz mono PCM (WAV) for the ASR engines, unfiltered so timestamps match the source
+    - raw PCM on stdout, reduced to the waveform peak pyramid while decoding
+    - the timeline sprite levels (keyframes only)
+    Artifacts that are already valid are not produced again.
+    """
+    
+    def __init__(self, video_path: Path, audio_config: Dict = None):
+        """
+        Initialize preparer
+        
+        Args:
+            video_path: Path to the uploaded file
+            audio_config: MP3 encoding configuration (mp4_to_mp3 section)
+        """
+        self.video_path = Path(video_path)
+        self.audio_config = audio_config or MP4_TO_MP3_CONFIG.copy()
+        self.paths = derived_paths(self.video_path)
+        self.ffmpeg_tools = FFmpegTools()
+    
+    def prepare(self, mp3_path: Path = None, progress_callback=None) -> Tuple[bool, str, Dict]:
+        """
+        Produce every missing artifact in one ffmpeg run
+        
+        Args:
+            mp3_path: Output path of the MP3 (defaults to <upload stem>.mp3 next to the upload);
+                the suffix follows the configured audio codec profile
+            progress_callback: Optional callback function for progress updates
+            
+        Returns:
+            Tuple of (success, message, artifacts)
+        """
+        try:
+            mp3_path = Path(mp3_path) if mp3_path else self.video_path.with_suffix('.mp3')
+            mp3_path = mp3_path.with_suffix(audio_output_suffix(self.audio_config))
+            video_info = self.ffmpeg_tools.get_video_info(self.video_path, fast=True)
+            duration = float(video_info.get('duration', 0))
+            if not video_info.get('has_audio'):
+                return False, "No audio stream found", {}
+            
+            artifacts = load_artifacts(self.video_path)
+            source = _source_key(self.video_path)
+            sprites = TimelineSpriteGenerator(
+                self.video_path,
+                self.paths['thumbnails'],
+                url_prefix=f"/uploads/thumbnails/{self.paths['thumbnails'].name}"
+            )
+            
+            with sprites.generation_lock(), get_waveform_lock(self.paths['waveform']):
+                # The registry holds the config as JSON, compare it in that form
+                audio_config = json.loads(json.dumps(self.audio_config, ensure_ascii=False))
+                need_mp3 = ('mp3' not in artifacts or Path(artifacts['mp3']['path']) != mp3_path
+                            or artifacts['mp3'].get('audio_config') != audio_config)
+                need_pcm = 'asr_pcm' not in artifacts
+                need_peaks = load_waveform_index(self.paths['waveform'], source) is None
+                levels = sprites.missing_levels() if video_info.get('has_video') else []
+                
+                if not (need_mp3 or need_pcm or need_peaks or levels):
+                    logger.info(f"Media already prepared: {self.video_path.name}")
+                    return True, "Media already prepared", artifacts
+                
+                if progress_callback:
+                    progress_callback(0, "Preparing media in one decode pass...")
+                
+                args, audio_branches, output_args = ["-v", "error"], [], []
+                if levels:
+                    args += ["-skip_frame:v", "nokey"]  # 缩略图只需要关键帧
+                args += ["-i", str(self.video_path)]
+                
+                if need_mp3:
+                    audio_filter = self.ffmpeg_tools.build_audio_filter(self.audio_config) or 'anull'
+                    audio_branches.append(('mp3', audio_filter))
+                    output_args += [
+                        "-map", "[mp3]",
+                        *self.ffmpeg_tools.audio_encoder_args(self.audio_config),
+                        "-ac", str(self.audio_config.get('audio_channels', 1)),
+                        "-ar", str(self.audio_config.get('audio_sample_rate', 16000)),
+                        "-y", str(mp3_path)
+                    ]
+                
+                pcm_path = self.paths['derived'] / f"asr_{ASR_SAMPLE_RATE // 1000}k.wav"
+                if need_pcm:
+                    self.paths['derived'].mkdir(parents=True, exist_ok=True)
+                    audio_branches.append(('asr', f"aresample={ASR_SAMPLE_RATE},aformat=sample_fmts=s16:channel_layouts=mono"))
+                    output_args += ["-map", "[asr]", "-c:a", "pcm_s16le", "-y", str(pcm_path)]
+                
+                builder = WaveformPeakBuilder() if need_peaks else None
+                if builder:
+                    audio_branches.append(('peaks', f"aresample={builder.sample_rate},aformat=sample_fmts=s16:channel_layouts=mono"))
+                    output_args += ["-map", "[peaks]", "-c:a", "pcm_s16le", "-f", "s16le", "pipe:1"]
+                
+                filter_parts = []
+                if len(audio_branches) > 1:
+                    filter_parts.append(f"[0:a:0]asplit={len(audio_branches)}" +
+                                        ''.join(f"[a_{name}]" for name, _ in audio_branches))
+                    for name, chain in audio_branches:
+                        filter_parts.append(f"[a_{name}]{chain}[{name}]")
+                elif audio_branches:
+                    name, chain = audio_branches[0]
+                    filter_parts.append(f"[0:a:0]{chain}[{name}]")
+                
+                if levels:
+                    sprite_filters, sprite_outputs = sprites.render_outputs(levels, '[0:v:0]')
+                    filter_parts += sprite_filters
+                    output_args += sprite_outputs
+                
+                args += ["-filter_complex", ';'.join(filter_parts)] + output_args
+                
+                def consume_peaks(stream):
+                    last_report = 0.0
+                    for chunk in iter(lambda: stream.read(1 << 16), b''):
+                        builder.feed(chunk)
+                        if progress_callback and duration > 0 and builder.duration - last_report >= 5:
+                            last_report = builder.duration
+                            progress_callback(min(99, int(builder.duration / duration * 100)),
+                                              f"Preparing media... {builder.duration:.0f}s/{duration:.0f}s")
+                
+                run_options = {'stdout_handler': consume_peaks} if builder else {}
+                
+                def on_progress(event: Dict):
+                    if progress_callback and event['percent'] is not None:
+                        progress_callback(min(99, int(event['percent'])),
+                                          f"Preparing media... {event['out_time']:.0f}s/{duration:.0f}s")
+                
+                result = self.ffmpeg_tools.run_ffmpeg(args, duration, on_progress,
+                                                      priority=PRIORITY_NORMAL, **run_options)
+                if result['returncode'] != 0:
+                    return False, f"FFmpeg failed with return code {result['returncode']}: {result['stderr']}", {}
+                
+                produced = {}
+                if need_mp3:
+                    produced['mp3'] = {'path': str(mp3_path), 'audio_config': self.audio_config}
+                if need_pcm:
+                    produced['asr_pcm'] = {'path': str(pcm_path), 'sample_rate': ASR_SAMPLE_RATE, 'channels': 1}
+                if builder:
+                    builder.write(self.paths['waveform'], source)
+                    produced['waveform'] = {'path': str(self.paths['waveform'] / 'peaks.json')}
+                if levels:
+                    sprites.finish_render(levels, duration)
+                    produced['thumbnails'] = {'path': str(self.paths['thumbnails']), 'levels': sprites.levels}
+                
+                register_artifacts(self.video_path, produced)
+            
+            if progress_callback:
+                progress_callback(100, "Media prepared!")
+            
+            logger.info(f"Media prepared in one decode pass: {self.video_path.name} "
+                        f"({', '.join(produced)}, {result['elapsed']}s)")
+            return True, "Media prepared successfully", load_artifacts(self.video_path)
+        
+        except Exception as e:
+            error_msg = f"Media preparation failed: {str(e)}"
+            logger.error(error_msg)
+            return False, error_msg, {}
+
+def prepare_media(video_path: str, mp3_path: str = None, progress_callback=None) -> Tuple[bool, str, Dict]:
+    """
+    Convenience function to prepare every derived artifact of an upload
+    
+    Args:
+        video_path: Path to the uploaded file
+        mp3_path: Optional output path of the MP3
+        progress_callback: Optional callback function for progress updates
+        
+    Returns:
+        Tuple of (success, message, artifacts)
+    """
+    preparer = MediaPreparer(Path(video_path))
+    return preparer.prepare(Path(mp3_path) if mp3_path else None, progress_callback)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming Normalization
+Two-pass peak normalization and silence removal with memory bounded by one decode chunk
+"""
+
+import math
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from plugins.common.ffmpeg_utils import FFmpegTools, run_ffmpeg_process, PRIORITY_NORMAL
+from plugins.common.audio_stream import decode_stream
+from plugins.common.silence import TimeMap, frame_levels, silent_runs, keep_intervals
+
+logger = logging.getLogger(__name__)
+
+# Full scale of 16-bit PCM, as used by pydub's normalize()
+FULL_SCALE = 32768
+
+class StreamingNormalizer:
+    """
+    Bounded-memory replacement for the pydub post-processing
+    
+    Pass 1 decodes the track and keeps only the running peak, the sum of
+    squares and one RMS level per frame. Pass 2 decodes again, applies the gain (rounded and
+    clipped like AudioSegment.apply_gain), drops the silent spans and pipes
+    the PCM straight into the audio encoder. Memory use is one decode chunk
+    plus the level array (4 bytes per frame), whatever the input duration.
+    """
+    
+    def __init__(self, config: Dict, headroom_db: float = 0.1,
+                 chunk_ms: float = 1000.0, frame_ms: float = 10.0):
+        """
+        Initialize normalizer
+        
+        Args:
+            config: MP3 encoding configuration (mp4_to_mp3 section)
+            headroom_db: Peak headroom in dB (pydub's normalize default)
+            chunk_ms: Decode chunk length in milliseconds
+            frame_ms: Silence detection frame length in milliseconds
+        """
+        self.config = config
+        self.sample_rate = int(config.get('audio_sample_rate', 16000))
+        self.channels = int(config.get('audio_channels', 1))
+        self.headroom_db = headroom_db
+        self.frame = max(1, int(self.sample_rate * frame_ms / 1000.0))
+        # Whole frames per chunk so per-chunk levels concatenate exactly
+        self.chunk = self.frame * max(1, int(self.sample_rate * chunk_ms / 1000.0) // self.frame)
+        self.ffmpeg_tools = FFmpegTools()
+        # Same decode-side filters the pydub engine got from its temp MP3
+        self.audio_filter = self.ffmpeg_tools.build_audio_filter(dict(config, remove_silence=False)) or None
+        
+        self.gain = 1.0
+        self.intervals = None
+        self.total_samples = 0
+    
+    def _decode(self, input_path: Path):
+        """Decode the input as int16 chunks at the target rate and layout"""
+        return decode_stream(
+            input_path,
+            sr=self.sample_rate,
+            channels=self.channels,
+            frame_ms=self.chunk * 1000.0 / self.sample_rate,
+            priority=PRIORITY_NORMAL,
+            audio_filter=self.audio_filter
+        )
+    
+    def measure(self, input_path: Path, duration: float = 0, progress_callback=None) -> Dict:
+        """
+        Pass 1: measure the peak, the average level and the silent spans
+        
+        Args:
+            input_path: Path to input video/audio file
+            duration: Input duration in seconds, used for progress
+            progress_callback: Optional callback function for progress updates
+            
+        Returns:
+            Dictionary with peak, gain_db, duration and kept duration
+        """
+        remove_silence = self.config.get('remove_silence', False)
+        peak = 0
+        sum_squares = 0.0
+        levels = []
+        total = 0
+        reported = 0.0
+        
+        for chunk in self._decode(input_path):
+            if len(chunk):
+                peak = max(peak, int(chunk.max()), -int(chunk.min()))
+                sum_squares += float(np.square(chunk, dtype=np.float64).sum())
+            if remove_silence:
+                levels.append(frame_levels(chunk, self.frame))
+            total += len(chunk)
+            
+            seconds = total / self.sample_rate
+            if progress_callback and duration > 0 and seconds - reported >= 10:
+                reported = seconds
+                progress_callback(min(99, int(seconds / duration * 100)),
+                                  f"Measuring audio... {seconds:.0f}s/{duration:.0f}s")
+        
+        self.total_samples = total
+        self.gain = 1.0
+        # peak_gain is planned separately from the loudnorm decode filter (plan_audio_processing)
+        if self.config.get('peak_gain', self.config.get('normalize_audio', False)) and peak > 0:
+            self.gain = FULL_SCALE * 10 ** (-self.headroom_db / 20.0) / peak
+        gain_db = 20.0 * math.log10(self.gain)
+        
+        self.intervals = None
+        if remove_silence and total:
+            # Like the pydub engine: 16 dB below the average level (AudioSegment.dBFS). The pydub
+            # engine measures after the gain, which shifts level and threshold alike.
+            mean_square = sum_squares / (total * self.channels)
+            threshold = (10.0 * math.log10(mean_square) - 20.0 * math.log10(FULL_SCALE) - 16
+                         if mean_square > 0 else -math.inf)
+            silences = silent_runs(
+                np.concatenate(levels), self.frame, total, self.sample_rate,
+                threshold, float(self.config.get('silence_min_duration', 1.0))
+            )
+            intervals = keep_intervals(silences, total, int(float(self.config.get('silence_keep', 0.2)) * self.sample_rate))
+            if len(intervals):
+                self.intervals = intervals
+        
+        kept = int((self.intervals[:, 1] - self.intervals[:, 0]).sum()) if self.intervals is not None else total
+        return {
+            'peak': peak,
+            'gain_db': round(gain_db, 3),
+            'duration': total / self.sample_rate,
+            'kept_duration': kept / self.sample_rate
+        }
+    
+    def render(self, input_path: Path, output_path: Path, progress_callback=None) -> Optional[TimeMap]:
+        """
+        Pass 2: apply gain and cuts while encoding through a pipe
+        
+        Args:
+            input_path: Path to input video/audio file
+            output_path: Path to output audio file
+            progress_callback: Optional callback function for progress updates
+            
+        Returns:
+            Time map of the cuts, or None if nothing was cut
+        """
+        intervals = self.intervals
+        gain = self.gain
+        kept_seconds = (float((intervals[:, 1] - intervals[:, 0]).sum()) if intervals is not None
+                        else self.total_samples) / self.sample_rate
+        
+        def feed(stdin):
+            frames = self._decode(input_path)
+            offset = 0
+            position = 0
+            try:
+                for chunk in frames:
+                    if gain != 1.0:
+                        data = np.clip(np.floor(chunk * gain), -FULL_SCALE, FULL_SCALE - 1).astype('<i2')
+                    else:
+                        data = chunk
+                    end = offset + len(chunk)
+                    
+                    if intervals is None:
+                        stdin.write(data.tobytes())
+                    else:
+                        # Write the parts of the kept spans that fall inside this chunk
+                        while position < len(intervals) and intervals[position, 1] <= offset:
+                            position += 1
+                        span = position
+                        while span < len(intervals) and intervals[span, 0] < end:
+                            start = max(int(intervals[span, 0]), offset) - offset
+                            stop = min(int(intervals[span, 1]), end) - offset
+                            stdin.write(data[start:stop].tobytes())
+                            span += 1
+                    offset = end
+            finally:
+                frames.close()
+        
+        def on_progress(event: Dict):
+            if progress_callback and event['percent'] is not None:
+                progress_callback(min(99, int(event['percent'])),
+                                  f"Encoding normalized audio... {event['out_time']:.0f}s/{kept_seconds:.0f}s")
+        
+        cmd = [
+            str(self.ffmpeg_tools.ffmpeg_path),
+            "-v", "error",
+            "-f", "s16le",
+            "-ar", str(self.sample_rate),
+            "-ac", str(self.channels),
+            "-i", "pipe:0",
+            *self.ffmpeg_tools.audio_encoder_args(self.config),
+            "-y", str(output_path)
+        ]
+        # The decoder feeding stdin holds the heavy scheduler slot for the pair
+        result = run_ffmpeg_process(cmd, kept_seconds, on_progress, stdin_handler=feed)
+        if result['returncode'] != 0:
+            raise RuntimeError(f"FFmpeg failed with return code {result['returncode']}: {result['stderr']}")
+        
+        if intervals is None:
+            return None
+        time_map = TimeMap.from_intervals(intervals, self.sample_rate, self.total_samples)
+        return None if time_map.is_identity else time_map
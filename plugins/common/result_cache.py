@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Result Cache
+Content-addressed cache of conversion outputs keyed by input hash and effective configuration
+"""
+
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+import subprocess
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from plugins.config import (
+    APP_VERSION, CACHE_DIR, RESULT_CACHE_CONFIG, MP4_TO_MP3_CONFIG, MP3_TO_TXT_CONFIG
+)
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of cached results changes (2: entries are private copies, not hard links)
+CACHE_FORMAT = 2
+
+# ioctl cloning a file's extents on copy-on-write filesystems (btrfs, XFS)
+FICLONE = 0x40049409
+
+# Settings that change how a result is computed but not the result itself
+NON_OUTPUT_KEYS = {
+    'sharded', 'shard_min_duration', 'chunk_size', 'binary_frames', 'whisper_verbose'
+}
+
+@lru_cache(maxsize=1)
+def _ffmpeg_version() -> str:
+    """First line of `ffmpeg -version`, 'unknown' if FFmpeg cannot be run"""
+    try:
+        from plugins.common.ffmpeg_utils import FFmpegTools
+        result = subprocess.run(
+            [str(FFmpegTools().ffmpeg_path), "-version"],
+            capture_output=True, text=True, timeout=10
+        )
+        return result.stdout.splitlines()[0].strip() if result.stdout else 'unknown'
+    except Exception:
+        return 'unknown'
+
+def _package_version(name: str) -> str:
+    """Installed version of a Python package, 'unknown' if it is missing"""
+    try:
+        from importlib.metadata import version
+        return version(name)
+    except Exception:
+        return 'unknown'
+
+def _effective_section(defaults: Dict, overrides: Optional[Dict]) -> Dict:
+    """Defaults merged with the job's settings, minus the keys that do not affect output"""
+    section = dict(defaults, **(overrides or {}))
+    return {key: value for key, value in section.items() if key not in NON_OUTPUT_KEYS}
+
+def _clone_file(source: Path, target: Path):
+    """
+    Give target its own copy of source, reflinked where the filesystem supports it
+    
+    Never a hard link: outputs may be edited in place later (e.g. transcripts
+    saved from the workspace) and must not change the cache or other uploads.
+    The copy is written next to the target and renamed over it.
+    """
+    temp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    try:
+        cloned = False
+        if fcntl is not None:
+            try:
+                with open(source, 'rb') as src, open(temp, 'wb') as dst:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                shutil.copystat(source, temp)
+                cloned = True
+            except OSError:
+                pass
+        if not cloned:
+            shutil.copy2(source, temp)
+        os.replace(temp, target)
+    finally:
+        if temp.exists():
+            temp.unlink()
+
+class ResultCache:
+    """
+    Content-addressed conversion result cache
+    
+    An entry is keyed by the SHA-256 of the input content, the conversion
+    type and engine, the canonicalized effective configuration and the
+    versions of the tools that produced it. Result files are copied into
+    the cache and back out again (reflinked on copy-on-write filesystems),
+    so every upload owns its files and may edit them freely. Entries
+    are evicted least recently used first once the cache exceeds its size
+    bound; the index lives in a SQLite database next to the entries.
+    """
+    
+    def __init__(self, cache_dir: Path, max_size_mb: float = 2048, enabled: bool = True):
+        """
+        Initialize result cache
+        
+        Args:
+            cache_dir: Directory holding cached results and the index
+            max_size_mb: Size bound in megabytes
+            enabled: Whether lookups and stores are performed
+        """
+        self.entries_dir = Path(cache_dir) / 'results'
+        self.db_path = Path(cache_dir) / 'results.sqlite3'
+        self.max_bytes = int(float(max_size_mb) * 1024 * 1024)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        self._db_ready = False
+    
+    def _init_db(self) -> bool:
+        """Create the index tables on first use"""
+        if self._db_ready:
+            return True
+        try:
+            self.entries_dir.mkdir(parents=True, exist_ok=True)
+            with sqlite3.connect(str(self.db_path)) as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS entries ("
+                    "key TEXT PRIMARY KEY, conversion_type TEXT, size INTEGER, "
+                    "created REAL, last_used REAL, hits INTEGER, manifest TEXT)"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS content_hashes ("
+                    "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT)"
+                )
+            self._db_ready = True
+        except Exception as e:
+            logger.warning(f"Result cache disabled: {str(e)}")
+            self.enabled = False
+        return self._db_ready
+    
+    def content_hash(self, path: Path) -> str:
+        """
+        SHA-256 of a file's content
+        
+        The digest is remembered per (path, size, mtime_ns) so an unchanged
+        file is only read once.
+        
+        Args:
+            path: File to hash
+            
+        Returns:
+            Hex digest
+        """
+        path = Path(path)
+        stat = path.stat()
+        resolved = str(path.resolve())
+        
+        if self._init_db():
+            with sqlite3.connect(str(self.db_path)) as conn:
+                row = conn.execute(
+                    "SELECT sha256 FROM content_hashes WHERE path = ? AND size = ? AND mtime_ns = ?",
+                    (resolved, stat.st_size, stat.st_mtime_ns)
+                ).fetchone()
+            if row:
+                return row[0]
+        
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+        
+        if self._init_db():
+            with sqlite3.connect(str(self.db_path)) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO content_hashes (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                    (resolved, stat.st_size, stat.st_mtime_ns, sha256)
+                )
+        return sha256
+    
+    def make_key(self, input_path: Path, conversion_type: str, engine: str, config: Dict) -> str:
+        """
+        Cache key of a conversion
+        
+        Args:
+            input_path: Input file
+            conversion_type: Conversion type (mp4_to_mp3|mp3_to_txt|mp4_to_txt)
+            engine: Recognition engine (alibaba_nls|whisper)
+            config: Configuration the job runs with
+            
+        Returns:
+            Hex digest identifying the result
+        """
+        config = config or {}
+        effective = {}
+        versions = {'cache_format': CACHE_FORMAT, 'app': APP_VERSION, 'ffmpeg': _ffmpeg_version()}
+        
+        if conversion_type in ('mp4_to_mp3', 'mp4_to_txt'):
+            effective['mp4_to_mp3'] = _effective_section(MP4_TO_MP3_CONFIG, config.get('mp4_to_mp3'))
+        if conversion_type in ('mp3_to_txt', 'mp4_to_txt'):
+            effective['mp3_to_txt'] = _effective_section(MP3_TO_TXT_CONFIG, config.get('mp3_to_txt'))
+            if engine == 'whisper':
+                versions['faster_whisper'] = _package_version('faster-whisper')
+            else:
+                nls = config.get('alibaba_nls') or {}
+                # 只取影响识别结果的字段，不把密钥写进缓存键
+                effective['alibaba_nls'] = {key: nls.get(key) for key in ('app_key', 'region', 'endpoint')}
+        
+        payload = {
+            'content': self.content_hash(input_path),
+            'conversion_type': conversion_type,
+            'engine': engine if conversion_type != 'mp4_to_mp3' else None,
+            'config': effective,
+            'versions': versions
+        }
+        canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    
+    def _entry_dir(self, key: str) -> Path:
+        """Directory holding one entry's files"""
+        return self.entries_dir / key[:2] / key
+    
+    def lookup(self, key: str, output_dir: Path, stem: str) -> Optional[Dict]:
+        """
+        Restore a cached result into the output directory
+        
+        Args:
+            key: Cache key from make_key
+            output_dir: Directory the outputs are copied into
+            stem: File name stem of the outputs
+            
+        Returns:
+            Dictionary with output_file, files, message and metadata, or None on miss
+        """
+        if not self.enabled or not self._init_db():
+            return None
+        
+        with sqlite3.connect(str(self.db_path)) as conn:
+            row = conn.execute("SELECT manifest FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+        
+        manifest = json.loads(row[0])
+        entry_dir = self._entry_dir(key)
+        for item in manifest['files']:
+            cached = entry_dir / item['name']
+            try:
+                stat = cached.stat()
+                intact = stat.st_size == item['size'] and stat.st_mtime_ns == item['mtime_ns']
+            except OSError:
+                intact = False
+            if not intact:
+                # The cached copy was modified or removed, the entry cannot be trusted
+                logger.warning(f"Result cache entry {key[:12]} is damaged, dropping it")
+                self._remove(key)
+                with self._lock:
+                    self._stats['misses'] += 1
+                return None
+        
+        files = []
+        for item in manifest['files']:
+            target = Path(output_dir) / f"{stem}{item['suffix']}"
+            cached = entry_dir / item['name']
+            _clone_file(cached, target)
+            files.append(str(target))
+        
+        with sqlite3.connect(str(self.db_path)) as conn:
+            conn.execute(
+                "UPDATE entries SET last_used = ?, hits = hits + 1 WHERE key = ?",
+                (time.time(), key)
+            )
+        with self._lock:
+            self._stats['hits'] += 1
+        
+        logger.info(f"Result cache hit {key[:12]}: {', '.join(Path(f).name for f in files)}")
+        return {
+            'output_file': files[0],
+            'files': files,
+            'message': manifest.get('message', ''),
+            'metadata': manifest.get('metadata', {})
+        }
+    
+    def store(self, key: str, conversion_type: str, files: List[Path], stem: str,
+              message: str = '', metadata: Dict = None):
+        """
+        Add a finished conversion to the cache
+        
+        Args:
+            key: Cache key from make_key
+            conversion_type: Conversion type
+            files: Output files, the primary output first
+            stem: File name stem shared by the outputs
+            message: Result message of the conversion
+            metadata: Conversion metadata
+        """
+        if not self.enabled or not self._init_db():
+            return
+        
+        files = [Path(f) for f in files if f and Path(f).exists()]
+        if not files or any(not f.name.startswith(stem) for f in files):
+            return
+        
+        entry_dir = self._entry_dir(key)
+        try:
+            if entry_dir.exists():
+                shutil.rmtree(entry_dir)
+            entry_dir.mkdir(parents=True)
+            
+            items = []
+            for index, path in enumerate(files):
+                suffix = path.name[len(stem):]
+                name = f"{index}{suffix}"
+                _clone_file(path, entry_dir / name)
+                stat = (entry_dir / name).stat()
+                items.append({'name': name, 'suffix': suffix, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+            
+            manifest = {
+                'conversion_type': conversion_type,
+                'files': items,
+                'message': message,
+                'metadata': metadata or {}
+            }
+            with sqlite3.connect(str(self.db_path)) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, conversion_type, size, created, last_used, hits, manifest) "
+                    "VALUES (?, ?, ?, ?, ?, 0, ?)",
+                    (key, conversion_type, sum(item['size'] for item in items), time.time(), time.time(),
+                     json.dumps(manifest, ensure_ascii=False, default=str))
+                )
+            with self._lock:
+                self._stats['stores'] += 1
+            logger.info(f"Result cached {key[:12]}: {', '.join(path.name for path in files)}")
+        except Exception as e:
+            logger.warning(f"Failed to cache conversion result: {str(e)}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return
+        
+        self.evict()
+    
+    def evict(self):
+        """Drop least recently used entries until the cache fits its size bound"""
+        if not self._init_db():
+            return
+        with sqlite3.connect(str(self.db_path)) as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = conn.execute("SELECT key, size FROM entries ORDER BY last_used, created").fetchall()
+        
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._remove(key)
+            total -= size
+            with self._lock:
+                self._stats['evictions'] += 1
+            logger.debug(f"Evicted result cache entry {key[:12]} ({size} bytes)")
+    
+    def _remove(self, key: str):
+        """Delete one entry and its files"""
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+        with sqlite3.connect(str(self.db_path)) as conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+    
+    def get_stats(self) -> Dict:
+        """Get hit/miss counters and cache occupancy"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['enabled'] = self.enabled
+        stats['entries'] = 0
+        stats['size_bytes'] = 0
+        if self.enabled and self._init_db():
+            with sqlite3.connect(str(self.db_path)) as conn:
+                stats['entries'], stats['size_bytes'] = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+                ).fetchone()
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
+
+# Process-wide result cache shared by all conversion jobs
+result_cache = ResultCache(
+    CACHE_DIR,
+    max_size_mb=RESULT_CACHE_CONFIG.get('max_size_mb', 2048),
+    enabled=RESULT_CACHE_CONFIG.get('enabled', True)
+)
+
+def get_result_cache_stats() -> Dict:
+    """
+    Get result cache hit/miss counters
+    
+    Returns:
+        Dictionary of cache statistics
+    """
+    return result_cache.get_stats()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Scratch Space
+Per-job scratch directories on tmpfs or disk with byte quotas and guaranteed cleanup
+"""
+
+import os
+import re
+import uuid
+import shutil
+import atexit
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from plugins.config import SCRATCH_CONFIG, TMP_DIR
+
+logger = logging.getLogger(__name__)
+
+# Job directories are named job_<pid>_<token>[_<label>] so leftovers of dead processes can be found
+JOB_PREFIX = 'job_'
+_JOB_NAME_RE = re.compile(r'^job_(\d+)_([0-9a-f]+)')
+
+MB = 1024 * 1024
+
+class ScratchQuotaError(RuntimeError):
+    """Raised when an allocation would exceed the job or global scratch quota"""
+
+def audio_size_hint(duration: float, bitrate: str = '64k') -> int:
+    """
+    Expected size of an encoded audio file
+    
+    Args:
+        duration: Duration in seconds
+        bitrate: Encoder bitrate such as '64k'
+        
+    Returns:
+        Size in bytes (with some container slack)
+    """
+    text = str(bitrate).strip().lower()
+    scale = 1000 if text.endswith('k') else 1
+    try:
+        bits = float(text.rstrip('k')) * scale
+    except ValueError:
+        bits = 64000
+    return int(max(0.0, duration) * bits / 8) + 64 * 1024
+
+def _pid_alive(pid: int) -> bool:
+    """Whether a process with this pid exists"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _tree_size(path: Path) -> int:
+    """Bytes used by the files below a directory"""
+    total = 0
+    if not path.exists():
+        return 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+class ScratchSpace:
+    """
+    Scratch directory of one job
+    
+    Files are placed in a private directory, on tmpfs when the RAM budget
+    allows it and on disk otherwise, so concurrent jobs never share file
+    names. Use as a context manager (or call cleanup()) to remove
+    everything the job wrote, whether it succeeded or failed.
+    """
+    
+    def __init__(self, manager: 'ScratchManager', token: str, dirs: Dict[str, Optional[Path]]):
+        """
+        Initialize scratch space (use ScratchManager.job)
+        
+        Args:
+            manager: Manager enforcing the quotas
+            token: Unique job directory name
+            dirs: Directory per tier ('ram' may be None)
+        """
+        self.manager = manager
+        self.token = token
+        self.dirs = dirs
+        self.reserved = 0
+        self.ram_reserved = 0
+        self.closed = False
+    
+    def allocate(self, filename: str, size_hint: int = 0, prefer_ram: bool = True) -> Path:
+        """
+        Reserve room for an intermediate file and return its path
+        
+        Args:
+            filename: File name inside the job directory
+            size_hint: Expected size in bytes, counted against the quotas
+            prefer_ram: Whether the file may go to tmpfs
+            
+        Returns:
+            Path of the file (not created)
+        """
+        if self.closed:
+            raise RuntimeError(f"Scratch space {self.token} is already cleaned up")
+        tier = self.manager._reserve(self, int(size_hint), prefer_ram)
+        directory = self.dirs[tier]
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory / filename
+    
+    def usage(self) -> Dict[str, int]:
+        """Bytes currently written per tier"""
+        return {tier: _tree_size(path) for tier, path in self.dirs.items() if path is not None}
+    
+    def check(self):
+        """
+        Account for what was actually written and enforce the job quota
+        
+        Raises:
+            ScratchQuotaError: If the job uses more than its quota
+        """
+        used = sum(self.usage().values())
+        self.manager._reconcile(self, used)
+        if used > self.manager.job_quota:
+            raise ScratchQuotaError(
+                f"Scratch space {self.token} uses {used / MB:.1f} MB, quota is {self.manager.job_quota / MB:.0f} MB"
+            )
+    
+    def cleanup(self):
+        """Remove the job directories and release the reservations"""
+        if self.closed:
+            return
+        self.closed = True
+        for path in self.dirs.values():
+            if path is not None:
+                shutil.rmtree(path, ignore_errors=True)
+        self.manager._release(self)
+    
+    def __enter__(self) -> 'ScratchSpace':
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+        return False
+
+class ScratchManager:
+    """
+    Allocates per-job scratch spaces and enforces byte quotas
+    
+    Every job gets its own directory under the disk root and, when enabled,
+    under the tmpfs root. Allocations reserve their expected size against
+    the job quota and the global quota of all running jobs; files prefer
+    tmpfs until its budget (or its free space) runs out and then fall back
+    to disk. Directories left behind by crashed processes are removed on
+    first use and at interpreter exit.
+    """
+    
+    def __init__(self, disk_root: Path, ram_root: Optional[Path] = None, job_quota_mb: float = 4096,
+                 global_quota_mb: float = 16384, ram_quota_mb: float = 512):
+        """
+        Initialize manager
+        
+        Args:
+            disk_root: Directory holding on-disk job directories
+            ram_root: Optional tmpfs directory holding in-memory job directories
+            job_quota_mb: Scratch megabytes one job may reserve
+            global_quota_mb: Scratch megabytes all jobs may reserve together
+            ram_quota_mb: Megabytes of tmpfs all jobs may reserve together
+        """
+        self.disk_root = Path(disk_root)
+        self.ram_root = Path(ram_root) if ram_root else None
+        self.job_quota = int(float(job_quota_mb) * MB)
+        self.global_quota = int(float(global_quota_mb) * MB)
+        self.ram_quota = int(float(ram_quota_mb) * MB)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._recovered = False
+        self._stats = {
+            'jobs': 0, 'ram_allocations': 0, 'disk_allocations': 0,
+            'ram_fallbacks': 0, 'quota_rejections': 0, 'recovered_dirs': 0
+        }
+        atexit.register(self.cleanup_all)
+    
+    def _ram_available(self) -> bool:
+        """Whether the tmpfs root can be used at all"""
+        if self.ram_root is None:
+            return False
+        try:
+            self.ram_root.mkdir(parents=True, exist_ok=True)
+            return os.access(self.ram_root, os.W_OK)
+        except OSError:
+            return False
+    
+    def job(self, label: str = '') -> ScratchSpace:
+        """
+        Create the scratch space of a new job
+        
+        Args:
+            label: Optional readable suffix of the directory name
+            
+        Returns:
+            ScratchSpace (a context manager)
+        """
+        if not self._recovered:
+            self.recover()
+        
+        token = f"{JOB_PREFIX}{os.getpid()}_{uuid.uuid4().hex[:12]}"
+        label = re.sub(r'[^0-9A-Za-z-]+', '-', label).strip('-')[:40]
+        if label:
+            token += f"_{label}"
+        
+        dirs = {
+            'disk': self.disk_root / token,
+            'ram': self.ram_root / token if self._ram_available() else None
+        }
+        space = ScratchSpace(self, token, dirs)
+        with self._lock:
+            self._jobs[token] = space
+            self._stats['jobs'] += 1
+        return space
+    
+    def _reserve(self, space: ScratchSpace, size: int, prefer_ram: bool) -> str:
+        """Reserve bytes for one allocation and pick its tier"""
+        with self._lock:
+            if space.reserved + size > self.job_quota:
+                self._stats['quota_rejections'] += 1
+                raise ScratchQuotaError(
+                    f"Scratch space {space.token} would need {(space.reserved + size) / MB:.1f} MB, "
+                    f"quota is {self.job_quota / MB:.0f} MB"
+                )
+            reserved = sum(job.reserved for job in self._jobs.values())
+            if reserved + size > self.global_quota:
+                self._stats['quota_rejections'] += 1
+                raise ScratchQuotaError(
+                    f"Scratch quota exhausted: {reserved / MB:.1f} MB reserved by running jobs, "
+                    f"quota is {self.global_quota / MB:.0f} MB"
+                )
+            
+            tier = 'disk'
+            if prefer_ram and space.dirs.get('ram') is not None:
+                ram_reserved = sum(job.ram_reserved for job in self._jobs.values())
+                try:
+                    free = shutil.disk_usage(self.ram_root).free
+                except OSError:
+                    free = 0
+                if ram_reserved + size <= self.ram_quota and size < free:
+                    tier = 'ram'
+                else:
+                    self._stats['ram_fallbacks'] += 1
+            
+            space.reserved += size
+            if tier == 'ram':
+                space.ram_reserved += size
+            self._stats[f'{tier}_allocations'] += 1
+            return tier
+    
+    def _reconcile(self, space: ScratchSpace, used: int):
+        """Raise a job's reservation to what it actually wrote"""
+        with self._lock:
+            space.reserved = max(space.reserved, used)
+    
+    def _release(self, space: ScratchSpace):
+        """Forget a finished job"""
+        with self._lock:
+            self._jobs.pop(space.token, None)
+    
+    def recover(self) -> int:
+        """
+        Remove job directories whose owning process is gone
+        
+        Returns:
+            Number of directories removed
+        """
+        self._recovered = True
+        removed = 0
+        for root in (self.disk_root, self.ram_root):
+            if root is None or not root.is_dir():
+                continue
+            for entry in root.iterdir():
+                match = _JOB_NAME_RE.match(entry.name)
+                if not match or not entry.is_dir():
+                    continue
+                pid = int(match.group(1))
+                with self._lock:
+                    active = entry.name in self._jobs
+                if active or (pid != os.getpid() and _pid_alive(pid)):
+                    continue
+                shutil.rmtree(entry, ignore_errors=True)
+                removed += 1
+        
+        if removed:
+            logger.info(f"Removed {removed} scratch directories left by previous runs")
+            with self._lock:
+                self._stats['recovered_dirs'] += removed
+        return removed
+    
+    def cleanup_all(self):
+        """Remove the scratch spaces of every job still running in this process"""
+        with self._lock:
+            spaces = list(self._jobs.values())
+        for space in spaces:
+            space.cleanup()
+    
+    def get_stats(self) -> Dict:
+        """Get allocation counters and current reservations"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['active_jobs'] = len(self._jobs)
+            stats['reserved_mb'] = round(sum(job.reserved for job in self._jobs.values()) / MB, 1)
+            stats['ram_reserved_mb'] = round(sum(job.ram_reserved for job in self._jobs.values()) / MB, 1)
+        stats['tmpfs'] = str(self.ram_root) if self._ram_available() else None
+        return stats
+
+# Process-wide scratch manager shared by all conversion jobs
+scratch_manager = ScratchManager(
+    TMP_DIR / 'scratch',
+    ram_root=Path(SCRATCH_CONFIG['tmpfs_dir']) / 'sync_cut_scratch' if SCRATCH_CONFIG.get('use_tmpfs', True) else None,
+    job_quota_mb=SCRATCH_CONFIG.get('job_quota_mb', 4096),
+    global_quota_mb=SCRATCH_CONFIG.get('global_quota_mb', 16384),
+    ram_quota_mb=SCRATCH_CONFIG.get('tmpfs_quota_mb', 512)
+)
+
+def get_scratch_stats() -> Dict:
+    """
+    Get scratch space allocation counters
+    
+    Returns:
+        Dictionary of scratch statistics
+    """
+    return scratch_manager.get_stats()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Silence Removal
+Vectorized RMS silence detection and trimming with an original <-> trimmed time map
+"""
+
+import json
+import math
+import bisect
+import logging
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TIMEMAP_SUFFIX = '.timemap.json'
+
+# Grid of the FFmpeg silence cuts (frames per second): whole 10 ms frames are kept or dropped
+CUT_FRAME_RATE = 100
+
+def parse_db(value, default: float = -40.0) -> float:
+    """Parse a level such as '-40dB' or -40 into dBFS"""
+    text = str(value).strip().lower()
+    if text.endswith('db'):
+        text = text[:-2]
+    try:
+        return float(text)
+    except ValueError:
+        return default
+
+def frame_levels(samples: np.ndarray, frame: int) -> np.ndarray:
+    """
+    RMS level of consecutive fixed-size frames in dBFS
+    
+    Chunks of a longer stream can be measured separately and the results
+    concatenated, as long as every chunk but the last is a whole number of
+    frames.
+    
+    Args:
+        samples: Integer or float PCM, shape (n,) or (n, channels)
+        frame: Frame length in samples
+        
+    Returns:
+        Array with one level per frame (the last frame may be short)
+    """
+    total = len(samples)
+    if total == 0:
+        return np.empty(0, dtype=np.float32)
+    
+    if np.issubdtype(samples.dtype, np.integer):
+        full_scale = float(np.iinfo(samples.dtype).max) + 1.0
+    else:
+        full_scale = 1.0
+    
+    count = -(-total // frame)
+    power = np.zeros(count * frame, dtype=np.float32)
+    if samples.ndim > 1:
+        power[:total] = np.mean(np.square(samples, dtype=np.float32), axis=1)
+    else:
+        power[:total] = np.square(samples, dtype=np.float32)
+    power = power.reshape(count, frame).sum(axis=1)
+    power[:-1] /= frame
+    power[-1] /= total - (count - 1) * frame  # last frame may be short
+    
+    return 10.0 * np.log10(np.maximum(power, 1e-20)) - 20.0 * np.log10(full_scale)
+
+def silent_runs(levels: np.ndarray, frame: int, total: int, sample_rate: int,
+                threshold_db: float = -40.0, min_silence: float = 1.0) -> np.ndarray:
+    """
+    Runs of frames below the threshold lasting at least ``min_silence`` seconds
+    
+    Args:
+        levels: Per-frame levels from frame_levels
+        frame: Frame length in samples
+        total: Total number of samples
+        sample_rate: Sample rate in Hz
+        threshold_db: Level in dBFS below which a frame is silent
+        min_silence: Minimum silence length in seconds
+        
+    Returns:
+        Array of shape (k, 2) with [start, end) sample indices of each silence
+    """
+    silent = np.concatenate(([False], levels < threshold_db, [False]))
+    edges = np.diff(silent.astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    
+    long_enough = (ends - starts) * frame >= min_silence * sample_rate
+    runs = np.stack([starts[long_enough] * frame, ends[long_enough] * frame], axis=1).astype(np.int64)
+    runs[:, 1] = np.minimum(runs[:, 1], total)
+    return runs
+
+def find_silences(samples: np.ndarray, sample_rate: int, threshold_db: float = -40.0,
+                  min_silence: float = 1.0, frame_ms: float = 10.0) -> np.ndarray:
+    """
+    Locate silent runs from per-frame RMS levels
+    
+    The signal is cut into fixed frames, the RMS level of every frame is
+    computed in one vectorized pass and runs of frames below the threshold
+    that last at least ``min_silence`` seconds are reported.
+    
+    Args:
+        samples: Integer or float PCM, shape (n,) or (n, channels)
+        sample_rate: Sample rate in Hz
+        threshold_db: Level in dBFS below which a frame is silent
+        min_silence: Minimum silence length in seconds
+        frame_ms: RMS frame length in milliseconds
+        
+    Returns:
+        Array of shape (k, 2) with [start, end) sample indices of each silence
+    """
+    frame = max(1, int(sample_rate * frame_ms / 1000.0))
+    levels = frame_levels(samples, frame)
+    return silent_runs(levels, frame, len(samples), sample_rate, threshold_db, min_silence)
+
+def keep_intervals(silences: np.ndarray, total: int, keep: int) -> np.ndarray:
+    """
+    Sample ranges that survive when the given silences are cut
+    
+    ``keep`` samples of silence stay next to speech on each side of a cut;
+    silence touching the start or end of the file is cut up to the edge.
+    
+    Args:
+        silences: Array of shape (k, 2) from find_silences
+        total: Total number of samples
+        keep: Samples of silence kept around each cut
+        
+    Returns:
+        Array of shape (m, 2) with [start, end) sample indices to keep
+    """
+    if len(silences) == 0:
+        return np.array([[0, total]], dtype=np.int64)
+    
+    cut_start = np.where(silences[:, 0] == 0, 0, silences[:, 0] + keep)
+    cut_end = np.where(silences[:, 1] >= total, total, silences[:, 1] - keep)
+    valid = cut_end > cut_start
+    cut_start, cut_end = cut_start[valid], cut_end[valid]
+    
+    starts = np.concatenate(([0], cut_end))
+    ends = np.concatenate((cut_start, [total]))
+    nonempty = ends > starts
+    return np.stack([starts[nonempty], ends[nonempty]], axis=1).astype(np.int64)
+
+def cut_intervals(silences, duration: float, keep: float, frame_rate: int = CUT_FRAME_RATE) -> np.ndarray:
+    """
+    Spans kept when detected silences are cut, on a frame grid
+    
+    Used to cut the silences found by the silencedetect analysis inside
+    the FFmpeg filtergraph, so the time map matches the output exactly.
+    
+    Args:
+        silences: [start, end] pairs in seconds (e.g. from silencedetect)
+        duration: Duration of the audio in seconds
+        keep: Seconds of silence kept around each cut
+        frame_rate: Frames per second of the grid
+        
+    Returns:
+        Array of shape (m, 2) with [start, end) frame indices to keep
+    """
+    total = int(math.ceil(max(0.0, duration) * frame_rate))
+    runs = np.round(np.asarray(silences, dtype=np.float64).reshape(-1, 2) * frame_rate).astype(np.int64)
+    runs[:, 1] = np.minimum(runs[:, 1], total)
+    return keep_intervals(runs[runs[:, 1] > runs[:, 0]], total, int(round(keep * frame_rate)))
+
+class TimeMap:
+    """
+    Piecewise-linear map between original and trimmed timelines
+    
+    Each segment is a span of the original audio that was kept, stored as
+    (original_start, original_end, trimmed_start) in seconds. Stored next
+    to the trimmed file as ``<name>.timemap.json`` so transcripts of the
+    trimmed audio can be moved back onto the source timeline.
+    """
+    
+    def __init__(self, segments: List[Tuple[float, float, float]], original_duration: float):
+        """
+        Initialize time map
+        
+        Args:
+            segments: Kept spans as (original_start, original_end, trimmed_start)
+            original_duration: Duration of the untrimmed audio in seconds
+        """
+        self.segments = [tuple(float(v) for v in segment) for segment in segments]
+        self.original_duration = float(original_duration)
+        self._trimmed_starts = [segment[2] for segment in self.segments]
+    
+    @classmethod
+    def from_intervals(cls, intervals: np.ndarray, sample_rate: int, total: int) -> 'TimeMap':
+        """Build the map from the kept sample ranges"""
+        lengths = intervals[:, 1] - intervals[:, 0]
+        trimmed_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        segments = [
+            (start / sample_rate, end / sample_rate, trimmed / sample_rate)
+            for (start, end), trimmed in zip(intervals.tolist(), trimmed_starts.tolist())
+        ]
+        return cls(segments, total / sample_rate)
+    
+    @property
+    def trimmed_duration(self) -> float:
+        """Duration of the trimmed audio in seconds"""
+        return sum(end - start for start, end, _ in self.segments)
+    
+    @property
+    def is_identity(self) -> bool:
+        """Whether nothing was cut"""
+        return len(self.segments) <= 1 and all(
+            start == 0 and end >= self.original_duration for start, end, _ in self.segments
+        )
+    
+    def to_original(self, seconds: float) -> float:
+        """Map a time on the trimmed timeline to the original timeline"""
+        if not self.segments:
+            return seconds
+        position = max(0, bisect.bisect_right(self._trimmed_starts, seconds) - 1)
+        start, end, trimmed_start = self.segments[position]
+        return min(start + max(0.0, seconds - trimmed_start), end)
+    
+    def to_trimmed(self, seconds: float) -> float:
+        """Map a time on the original timeline to the trimmed timeline (cut spans collapse)"""
+        for start, end, trimmed_start in self.segments:
+            if seconds < start:
+                return trimmed_start
+            if seconds <= end:
+                return trimmed_start + (seconds - start)
+        return self.trimmed_duration
+    
+    @staticmethod
+    def path_for(audio_path: Path) -> Path:
+        """Location of the time map stored for a trimmed file"""
+        audio_path = Path(audio_path)
+        return audio_path.with_name(audio_path.name + TIMEMAP_SUFFIX)
+    
+    def save(self, audio_path: Path) -> Path:
+        """Store the map next to the trimmed file"""
+        path = self.path_for(audio_path)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'original_duration': round(self.original_duration, 6),
+                'trimmed_duration': round(self.trimmed_duration, 6),
+                'segments': [[round(v, 6) for v in segment] for segment in self.segments]
+            }, f)
+        return path
+    
+    @classmethod
+    def load_for(cls, audio_path: Path) -> Optional['TimeMap']:
+        """Load the map stored for a trimmed file, None if the file was not trimmed"""
+        path = cls.path_for(audio_path)
+        if not path.exists():
+            return None
+        try:
+            # A map older than the audio belongs to a previous version of the file
+            if path.stat().st_mtime < Path(audio_path).stat().st_mtime:
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return cls(data['segments'], data['original_duration'])
+        except Exception as e:
+            logger.warning(f"Failed to read time map {path}: {str(e)}")
+            return None
+    
+    @staticmethod
+    def discard(audio_path: Path):
+        """Remove a stale map when the file is rewritten without trimming"""
+        path = TimeMap.path_for(audio_path)
+        if path.exists():
+            path.unlink()
+
+def remove_silence(samples: np.ndarray, sample_rate: int, threshold_db: float = -40.0,
+                   min_silence: float = 1.0, keep: float = 0.2,
+                   frame_ms: float = 10.0) -> Tuple[np.ndarray, TimeMap]:
+    """
+    Cut long silences out of a PCM buffer
+    
+    Args:
+        samples: PCM samples, shape (n,) or (n, channels)
+        sample_rate: Sample rate in Hz
+        threshold_db: Level in dBFS below which audio counts as silence
+        min_silence: Minimum silence length in seconds to cut
+        keep: Seconds of silence kept around each cut
+        frame_ms: RMS frame length in milliseconds
+        
+    Returns:
+        Tuple of (trimmed samples, time map)
+    """
+    total = len(samples)
+    silences = find_silences(samples, sample_rate, threshold_db, min_silence, frame_ms)
+    intervals = keep_intervals(silences, total, int(keep * sample_rate))
+    if len(intervals) == 0:
+        # Nothing but silence: keep the audio rather than produce an empty file
+        intervals = np.array([[0, total]], dtype=np.int64)
+    time_map = TimeMap.from_intervals(intervals, sample_rate, total)
+    
+    if len(intervals) == 1 and intervals[0, 0] == 0 and intervals[0, 1] == total:
+        return samples, time_map
+    
+    # One gather for the whole output instead of concatenating chunk by chunk
+    trimmed = np.concatenate([samples[start:end] for start, end in intervals.tolist()], axis=0)
+    logger.info(f"Silence removed: {len(silences)} runs, "
+                f"{time_map.original_duration:.1f}s -> {time_map.trimmed_duration:.1f}s")
+    return trimmed, time_map
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Timeline Sprite Generator
+Builds video timeline sprite sheets (with WebVTT/JSON indexes) in a single decode pass
+"""
+
+import json
+import math
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from plugins.config import FFMPEG_CONFIG
+from plugins.common.ffmpeg_utils import FFmpegTools, PRIORITY_HIGH
+
+logger = logging.getLogger(__name__)
+
+# Locks guarding sprite generation per output directory
+_generation_locks = {}
+_generation_locks_guard = threading.Lock()
+
+def _get_generation_lock(output_dir: Path) -> threading.Lock:
+    """Get the lock for an output directory"""
+    key = str(output_dir.resolve())
+    with _generation_locks_guard:
+        if key not in _generation_locks:
+            _generation_locks[key] = threading.Lock()
+        return _generation_locks[key]
+
+class TimelineSpriteGenerator:
+    """
+    Timeline sprite sheet generator
+    
+    Every zoom level is one thumbnail interval (seconds per tile). Levels are
+    rendered lazily on first request: a single ffmpeg run decodes keyframes
+    only and feeds an fps/scale/tile filtergraph (split once per missing
+    level), writing sprite sheets plus an index. Rendered levels are reused
+    until the source file changes.
+    """
+    
+    def __init__(self, video_path: Path, output_dir: Path, url_prefix: str = '',
+                 config: Dict = None):
+        """
+        Initialize generator
+        
+        Args:
+            video_path: Path to source video
+            output_dir: Directory that holds sprite sheets and indexes
+            url_prefix: URL prefix under which output_dir is served
+            config: Optional FFmpeg configuration dictionary
+        """
+        self.video_path = Path(video_path)
+        self.output_dir = Path(output_dir)
+        self.url_prefix = url_prefix.rstrip('/')
+        self.config = config or FFMPEG_CONFIG.copy()
+        
+        self.levels = sorted(int(level) for level in self.config.get('timeline_levels', [2, 10, 60]))
+        columns, rows = str(self.config.get('timeline_grid', '10x10')).lower().split('x')
+        self.columns = int(columns)
+        self.rows = int(rows)
+        self.tile_width = int(self.config.get('thumbnail_width', 160))
+        self.tile_height = int(self.config.get('thumbnail_height', 90))
+        self.image_format = self.config.get('timeline_format', 'jpg').lower()
+        self.ffmpeg_tools = FFmpegTools()
+    
+    def generation_lock(self) -> threading.Lock:
+        """Lock guarding sprite generation in this generator's output directory"""
+        return _get_generation_lock(self.output_dir)
+    
+    def snap_level(self, interval: float) -> int:
+        """
+        Configured zoom level closest to a requested interval
+        
+        Args:
+            interval: Requested seconds per thumbnail
+            
+        Returns:
+            One of self.levels (the smaller one on a tie)
+            
+        Raises:
+            ValueError: If the interval is not positive
+        """
+        if not interval > 0:
+            raise ValueError(f"Timeline interval must be positive, got {interval}")
+        return min(self.levels, key=lambda level: (abs(level - interval), level))
+    
+    def get_level(self, interval: float, progress_handler=None) -> Dict:
+        """
+        Get the index of one zoom level, rendering it on first request
+        
+        Only configured levels are rendered: other intervals are snapped to
+        the closest one, so requests cannot create arbitrary sprite sets.
+        
+        Args:
+            interval: Seconds per thumbnail
+            progress_handler: Optional callable receiving progress event dictionaries
+            
+        Returns:
+            Level index dictionary (empty on failure)
+            
+        Raises:
+            ValueError: If the interval is not positive
+        """
+        interval = self.snap_level(interval)
+        index = self._load_index(interval)
+        if index is not None:
+            return index
+        
+        with _get_generation_lock(self.output_dir):
+            # Another request may have rendered it while we were waiting
+            index = self._load_index(interval)
+            if index is not None:
+                return index
+            
+            if not self._render([interval], progress_handler):
+                return {}
+            return self._load_index(interval) or {}
+    
+    def generate_all(self, progress_handler=None) -> Dict[int, Dict]:
+        """
+        Render every configured level that is not cached yet (one decode pass)
+        
+        Args:
+            progress_handler: Optional callable receiving progress event dictionaries
+            
+        Returns:
+            Dictionary mapping interval to level index
+        """
+        with _get_generation_lock(self.output_dir):
+            missing = self.missing_levels()
+            if missing:
+                self._render(missing, progress_handler)
+        
+        return {level: self._load_index(level) or {} for level in self.levels}
+    
+    def _level_dir(self, interval: int) -> Path:
+        """Directory of one zoom level"""
+        return self.output_dir / f"level_{interval}s"
+    
+    def _source_key(self) -> Dict:
+        """Identity of the source file used to invalidate cached levels"""
+        stat = self.video_path.stat()
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    
+    def _load_index(self, interval: int) -> Optional[Dict]:
+        """Load a cached level index if it is still valid"""
+        index_path = self._level_dir(interval) / 'index.json'
+        if not index_path.exists():
+            return None
+        
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('source') != self._source_key():
+                return None
+            return index
+        except Exception as e:
+            logger.warning(f"Failed to read timeline index {index_path}: {str(e)}")
+            return None
+    
+    def missing_levels(self) -> List[int]:
+        """Configured levels that are not rendered for the current source file"""
+        return [level for level in self.levels if self._load_index(level) is None]
+    
+    def render_outputs(self, intervals: List[int], source_label: str = '[0:v]',
+                       label_prefix: str = 'tl') -> Tuple[List[str], List[str]]:
+        """
+        Filtergraph branches and output arguments rendering the given levels
+        
+        Lets another ffmpeg invocation (e.g. the prepare-media job) render the
+        sprite sheets from its own decode of the video stream.
+        
+        Args:
+            intervals: Levels to render
+            source_label: Filtergraph label of the decoded video stream
+            label_prefix: Prefix keeping the branch labels unique
+            
+        Returns:
+            Tuple of (filtergraph parts, output arguments)
+        """
+        extension = self._extension()
+        grid = f"{self.columns}x{self.rows}"
+        scale = f"scale={self.tile_width}:{self.tile_height}"
+        
+        filter_parts = []
+        if len(intervals) > 1:
+            split_labels = ''.join(f"[{label_prefix}_s{i}]" for i in range(len(intervals)))
+            filter_parts.append(f"{source_label}split={len(intervals)}{split_labels}")
+        for i, interval in enumerate(intervals):
+            source = f"[{label_prefix}_s{i}]" if len(intervals) > 1 else source_label
+            filter_parts.append(f"{source}fps=1/{interval},{scale},tile={grid}[{label_prefix}_v{i}]")
+        
+        output_args = []
+        for i, interval in enumerate(intervals):
+            level_dir = self._level_dir(interval)
+            level_dir.mkdir(parents=True, exist_ok=True)
+            for stale in level_dir.glob('sprite_*'):
+                stale.unlink()
+            output_args += ["-map", f"[{label_prefix}_v{i}]", "-vsync", "vfr"]
+            if extension == 'webp':
+                output_args += ["-c:v", "libwebp", "-quality", "70"]
+            else:
+                output_args += ["-q:v", "5"]
+            output_args += ["-start_number", "0", "-y", str(level_dir / f"sprite_%03d.{extension}")]
+        
+        return filter_parts, output_args
+    
+    def finish_render(self, intervals: List[int], duration: float):
+        """Write the indexes of levels rendered by render_outputs"""
+        for interval in intervals:
+            self._write_index(interval, duration, self._extension())
+    
+    def _extension(self) -> str:
+        """Sprite sheet file extension"""
+        return 'webp' if self.image_format == 'webp' else 'jpg'
+    
+    def _render(self, intervals: List[int], progress_handler=None) -> bool:
+        """Render the given levels in one ffmpeg invocation"""
+        video_info = self.ffmpeg_tools.get_video_info(self.video_path, fast=True)
+        duration = float(video_info.get('duration', 0))
+        if duration <= 0:
+            logger.error(f"Cannot build timeline, unknown duration: {self.video_path.name}")
+            return False
+        
+        filter_parts, output_args = self.render_outputs(intervals)
+        args = [
+            "-v", "error",
+            "-skip_frame", "nokey",  # 只解码关键帧
+            "-i", str(self.video_path),
+            "-filter_complex", ';'.join(filter_parts)
+        ] + output_args
+        
+        result = self.ffmpeg_tools.run_ffmpeg(args, duration, progress_handler, priority=PRIORITY_HIGH)
+        if result['returncode'] != 0:
+            logger.error(f"生成时间轴雪碧图失败: {result['stderr']}")
+            return False
+        
+        self.finish_render(intervals, duration)
+        
+        logger.info(f"完成时间轴雪碧图生成: {self.video_path.name}, 级别: {intervals}")
+        return True
+    
+    def _write_index(self, interval: int, duration: float, extension: str):
+        """Write JSON and WebVTT indexes for a rendered level"""
+        level_dir = self._level_dir(interval)
+        per_sheet = self.columns * self.rows
+        count = max(1, math.ceil(duration / interval))
+        
+        thumbnails = []
+        vtt_lines = ["WEBVTT", ""]
+        for n in range(count):
+            sheet_name = f"sprite_{n // per_sheet:03d}.{extension}"
+            if not (level_dir / sheet_name).exists():
+                break
+            
+            position = n % per_sheet
+            x = (position % self.columns) * self.tile_width
+            y = (position // self.columns) * self.tile_height
+            start = n * interval
+            end = min((n + 1) * interval, duration)
+            url = f"{self.url_prefix}/{level_dir.name}/{sheet_name}"
+            
+            thumbnails.append({
+                'time': start,
+                'url': url,
+                'x': x,
+                'y': y,
+                'width': self.tile_width,
+                'height': self.tile_height
+            })
+            vtt_lines.append(f"{self._format_vtt_time(start)} --> {self._format_vtt_time(end)}")
+            vtt_lines.append(f"{url}#xywh={x},{y},{self.tile_width},{self.tile_height}")
+            vtt_lines.append("")
+        
+        index = {
+            'interval': interval,
+            'duration': duration,
+            'columns': self.columns,
+            'rows': self.rows,
+            'sheet_width': self.columns * self.tile_width,
+            'sheet_height': self.rows * self.tile_height,
+            'vtt_url': f"{self.url_prefix}/{level_dir.name}/thumbnails.vtt",
+            'thumbnails': thumbnails,
+            'source': self._source_key()
+        }
+        
+        with open(level_dir / 'thumbnails.vtt', 'w', encoding='utf-8') as f:
+            f.write('\n'.join(vtt_lines))
+        with open(level_dir / 'index.json', 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+    
+    @staticmethod
+    def _format_vtt_time(seconds: float) -> str:
+        """Format seconds as a WebVTT timestamp"""
+        milliseconds = int(round(seconds * 1000))
+        hours, milliseconds = divmod(milliseconds, 3600000)
+        minutes, milliseconds = divmod(milliseconds, 60000)
+        secs, milliseconds = divmod(milliseconds, 1000)
+        return f"{hours:02d}:{minutes:02d}:{secs:02d}.{milliseconds:03d}"
+
+def get_timeline_level(video_path: str, output_dir: str, interval: float = 10,
+                       url_prefix: str = '') -> Dict:
+    """
+    Convenience function to get (and lazily render) a timeline zoom level
+    
+    Args:
+        video_path: Path to source video
+        output_dir: Directory that holds sprite sheets and indexes
+        interval: Seconds per thumbnail (snapped to the closest configured level)
+        url_prefix: URL prefix under which output_dir is served
+        
+    Returns:
+        Level index dictionary (empty on failure)
+    """
+    generator = TimelineSpriteGenerator(Path(video_path), Path(output_dir), url_prefix)
+    return generator.get_level(interval)
@@ -51,6 +51,7 @@ DEBUG = _web_config.get('debug', os.getenv('DEBUG', 'False').lower() == 'true')
 HOST = _web_config.get('host', os.getenv('HOST', '0.0.0.0'))
 PORT = _web_config.get('port', int(os.getenv('PORT', 7000)))
 MAX_CONTENT_LENGTH = _web_config.get('max_content_length', int(os.getenv('MAX_CONTENT_LENGTH', 10737418240)))
+MAX_FRAME_TIMESTAMPS = _web_config.get('max_frame_timestamps', 500)
 
 # File upload settings - from config.yaml
 _file_upload_config = _config.get('file_upload', {})
@@ -63,10 +64,43 @@ _mp4_to_mp3_config = _config.get('mp4_to_mp3', {})
 MP4_TO_MP3_CONFIG = {
     'audio_bitrate': _mp4_to_mp3_config.get('audio_bitrate', '64k'),
     'audio_codec': _mp4_to_mp3_config.get('audio_codec', 'mp3'),
+    'opus_container': _mp4_to_mp3_config.get('opus_container', 'ogg'),
     'audio_channels': _mp4_to_mp3_config.get('audio_channels', 1),
     'audio_sample_rate': _mp4_to_mp3_config.get('audio_sample_rate', 16000),
     'normalize_audio': _mp4_to_mp3_config.get('normalize_audio', True),
-    'remove_silence': _mp4_to_mp3_config.get('remove_silence', True)
+    'remove_silence': _mp4_to_mp3_config.get('remove_silence', True),
+    'passthrough': _mp4_to_mp3_config.get('passthrough', False),
+    'passthrough_m4a': _mp4_to_mp3_config.get('passthrough_m4a', False),
+    'engine': _mp4_to_mp3_config.get('engine', 'filtergraph'),
+    'loudnorm_target': _mp4_to_mp3_config.get('loudnorm_target', -16),
+    'silence_threshold': _mp4_to_mp3_config.get('silence_threshold', '-40dB'),
+    'silence_min_duration': _mp4_to_mp3_config.get('silence_min_duration', 1.0),
+    'silence_keep': _mp4_to_mp3_config.get('silence_keep', 0.2),
+    'sharded': _mp4_to_mp3_config.get('sharded', True),
+    'shard_min_duration': _mp4_to_mp3_config.get('shard_min_duration', 600),
+    'analyze_audio': _mp4_to_mp3_config.get('analyze_audio', True),
+    'loudnorm_tolerance': _mp4_to_mp3_config.get('loudnorm_tolerance', 1.0),
+    'peak_tolerance': _mp4_to_mp3_config.get('peak_tolerance', 0.5),
+    'silence_skip_ratio': _mp4_to_mp3_config.get('silence_skip_ratio', 0.01)
+}
+
+# FFmpeg tool settings - from config.yaml
+_ffmpeg_config = _config.get('ffmpeg', {})
+FFMPEG_CONFIG = {
+    'probe_cache_size': _ffmpeg_config.get('probe_cache_size', 256),
+    'probe_cache_persist': _ffmpeg_config.get('probe_cache_persist', True),
+    'probe_size': _ffmpeg_config.get('probe_size', 5000000),
+    'analyze_duration': _ffmpeg_config.get('analyze_duration', 5000000),
+    'heavy_slots': _ffmpeg_config.get('heavy_slots', 0),
+    'light_slots': _ffmpeg_config.get('light_slots', 4),
+    'timeline_levels': _ffmpeg_config.get('timeline_levels', [2, 10, 60]),
+    'timeline_grid': _ffmpeg_config.get('timeline_grid', '10x10'),
+    'timeline_format': _ffmpeg_config.get('timeline_format', 'jpg'),
+    'thumbnail_width': _ffmpeg_config.get('thumbnail_width', 160),
+    'thumbnail_height': _ffmpeg_config.get('thumbnail_height', 90),
+    'waveform_sample_rate': _ffmpeg_config.get('waveform_sample_rate', 8000),
+    'waveform_levels': _ffmpeg_config.get('waveform_levels', [32, 128, 512, 2048, 8192]),
+    'waveform_bits': _ffmpeg_config.get('waveform_bits', 8)
 }
 
 # MP3 to TXT conversion settings - from config.yaml
@@ -79,6 +113,12 @@ MP3_TO_TXT_CONFIG = {
     'enable_voice_detection': _mp3_to_txt_config.get('enable_voice_detection', True),
     'max_sentence_silence': _mp3_to_txt_config.get('max_sentence_silence', 800),
     'chunk_size': _mp3_to_txt_config.get('chunk_size', 8192),
+    'opus_bitrate': _mp3_to_txt_config.get('opus_bitrate', '16k'),
+    'binary_frames': _mp3_to_txt_config.get('binary_frames', True),
+    'direct_pcm': _mp3_to_txt_config.get('direct_pcm', True),
+    'prepare_media': _mp3_to_txt_config.get('prepare_media', True),
+    'parallel_min_window': _mp3_to_txt_config.get('parallel_min_window', 300),
+    'split_search_window': _mp3_to_txt_config.get('split_search_window', 30),
     # Whisper specific settings
     'whisper_model_size': _mp3_to_txt_config.get('whisper_model_size', 'base'),
     'whisper_language': _mp3_to_txt_config.get('whisper_language', 'zh'),
@@ -93,7 +133,30 @@ ALIBABA_NLS_CONFIG = {
     'access_key_id': _alibaba_nls_config.get('access_key_id', os.getenv('ALIBABA_ACCESS_KEY_ID', '')),
     'access_key_secret': _alibaba_nls_config.get('access_key_secret', os.getenv('ALIBABA_ACCESS_KEY_SECRET', '')),
     'region': _alibaba_nls_config.get('region', os.getenv('ALIBABA_NLS_REGION', 'cn-shanghai')),
-    'endpoint': _alibaba_nls_config.get('endpoint', 'wss://nls-gateway.cn-shanghai.aliyuncs.com/ws/v1')
+    'endpoint': _alibaba_nls_config.get('endpoint', 'wss://nls-gateway.cn-shanghai.aliyuncs.com/ws/v1'),
+    'max_sessions': _alibaba_nls_config.get('max_sessions', 2),
+    'async_engine': _alibaba_nls_config.get('async_engine', True),
+    'connect_timeout': _alibaba_nls_config.get('connect_timeout', 15),
+    'idle_timeout': _alibaba_nls_config.get('idle_timeout', 30),
+    'session_timeout': _alibaba_nls_config.get('session_timeout', 3600),
+    'token_refresh_margin': _alibaba_nls_config.get('token_refresh_margin', 300)
+}
+
+# Conversion result cache settings - from config.yaml
+_result_cache_config = _config.get('result_cache', {})
+RESULT_CACHE_CONFIG = {
+    'enabled': _result_cache_config.get('enabled', True),
+    'max_size_mb': _result_cache_config.get('max_size_mb', 2048)
+}
+
+# Per-job scratch space settings - from config.yaml
+_scratch_config = _config.get('scratch', {})
+SCRATCH_CONFIG = {
+    'use_tmpfs': _scratch_config.get('use_tmpfs', True),
+    'tmpfs_dir': _scratch_config.get('tmpfs_dir', '/dev/shm'),
+    'tmpfs_quota_mb': _scratch_config.get('tmpfs_quota_mb', 512),
+    'job_quota_mb': _scratch_config.get('job_quota_mb', 4096),
+    'global_quota_mb': _scratch_config.get('global_quota_mb', 16384)
 }
 
 # Workspace subdirectories - from config.yaml or defaults
@@ -106,6 +169,7 @@ LOGS_DIR = PROJECT_ROOT / _paths_config.get('logs', 'workspace/logs')
 UPLOAD_DIR = PROJECT_ROOT / _paths_config.get('upload', 'workspace/upload')
 TMP_DIR = PROJECT_ROOT / _paths_config.get('tmp', 'workspace/tmp')
 STATUS_DIR = PROJECT_ROOT / _paths_config.get('status', 'workspace/status')
+CACHE_DIR = PROJECT_ROOT / _paths_config.get('cache', 'workspace/cache')
 
 def is_allowed_file(filename):
     """Check if file extension is allowed"""
@@ -123,14 +187,18 @@ def get_default_config():
             'host': HOST,
             'port': PORT,
             'debug': DEBUG,
-            'max_content_length': MAX_CONTENT_LENGTH
+            'max_content_length': MAX_CONTENT_LENGTH,
+            'max_frame_timestamps': MAX_FRAME_TIMESTAMPS
         },
         'file_upload': {
             'allowed_extensions': list(ALLOWED_EXTENSIONS)
         },
         'mp4_to_mp3': MP4_TO_MP3_CONFIG,
+        'ffmpeg': FFMPEG_CONFIG,
         'mp3_to_txt': MP3_TO_TXT_CONFIG,
         'alibaba_nls': ALIBABA_NLS_CONFIG,
+        'result_cache': RESULT_CACHE_CONFIG,
+        'scratch': SCRATCH_CONFIG,
         'paths': {
             'workspace': str(WORKSPACE_DIR.relative_to(PROJECT_ROOT)),
             'plugins': str(PLUGINS_DIR.relative_to(PROJECT_ROOT)),
@@ -139,15 +207,17 @@ def get_default_config():
             'logs': str(LOGS_DIR.relative_to(PROJECT_ROOT)),
             'upload': str(UPLOAD_DIR.relative_to(PROJECT_ROOT)),
             'tmp': str(TMP_DIR.relative_to(PROJECT_ROOT)),
-            'status': str(STATUS_DIR.relative_to(PROJECT_ROOT))
+            'status': str(STATUS_DIR.relative_to(PROJECT_ROOT)),
+            'cache': str(CACHE_DIR.relative_to(PROJECT_ROOT))
         }
     }
 
 def reload_config():
     """Reload configuration from file"""
-    global _config, APP_NAME, APP_VERSION, DEBUG, HOST, PORT, MAX_CONTENT_LENGTH
-    global ALLOWED_EXTENSIONS, MP4_TO_MP3_CONFIG, MP3_TO_TXT_CONFIG, ALIBABA_NLS_CONFIG
-    global WORKSPACE_DIR, PLUGINS_DIR, TOOLS_DIR, MODELS_DIR, LOGS_DIR, UPLOAD_DIR, TMP_DIR, STATUS_DIR
+    global _config, APP_NAME, APP_VERSION, DEBUG, HOST, PORT, MAX_CONTENT_LENGTH, MAX_FRAME_TIMESTAMPS
+    global ALLOWED_EXTENSIONS, MP4_TO_MP3_CONFIG, FFMPEG_CONFIG, MP3_TO_TXT_CONFIG, ALIBABA_NLS_CONFIG
+    global RESULT_CACHE_CONFIG, SCRATCH_CONFIG
+    global WORKSPACE_DIR, PLUGINS_DIR, TOOLS_DIR, MODELS_DIR, LOGS_DIR, UPLOAD_DIR, TMP_DIR, STATUS_DIR, CACHE_DIR
     
     _config = load_config_file()
     
@@ -160,6 +230,7 @@ def reload_config():
     HOST = _web_config.get('host', os.getenv('HOST', '0.0.0.0'))
     PORT = _web_config.get('port', int(os.getenv('PORT', 7000)))
     MAX_CONTENT_LENGTH = _web_config.get('max_content_length', int(os.getenv('MAX_CONTENT_LENGTH', 10737418240)))
+    MAX_FRAME_TIMESTAMPS = _web_config.get('max_frame_timestamps', 500)
     
     _file_upload_config = _config.get('file_upload', {})
     ALLOWED_EXTENSIONS = set(_file_upload_config.get('allowed_extensions', [
@@ -170,10 +241,42 @@ def reload_config():
     MP4_TO_MP3_CONFIG = {
         'audio_bitrate': _mp4_to_mp3_config.get('audio_bitrate', '64k'),
         'audio_codec': _mp4_to_mp3_config.get('audio_codec', 'mp3'),
+        'opus_container': _mp4_to_mp3_config.get('opus_container', 'ogg'),
         'audio_channels': _mp4_to_mp3_config.get('audio_channels', 1),
         'audio_sample_rate': _mp4_to_mp3_config.get('audio_sample_rate', 16000),
         'normalize_audio': _mp4_to_mp3_config.get('normalize_audio', True),
-        'remove_silence': _mp4_to_mp3_config.get('remove_silence', True)
+        'remove_silence': _mp4_to_mp3_config.get('remove_silence', True),
+        'passthrough': _mp4_to_mp3_config.get('passthrough', False),
+        'passthrough_m4a': _mp4_to_mp3_config.get('passthrough_m4a', False),
+        'engine': _mp4_to_mp3_config.get('engine', 'filtergraph'),
+        'loudnorm_target': _mp4_to_mp3_config.get('loudnorm_target', -16),
+        'silence_threshold': _mp4_to_mp3_config.get('silence_threshold', '-40dB'),
+        'silence_min_duration': _mp4_to_mp3_config.get('silence_min_duration', 1.0),
+        'silence_keep': _mp4_to_mp3_config.get('silence_keep', 0.2),
+        'sharded': _mp4_to_mp3_config.get('sharded', True),
+        'shard_min_duration': _mp4_to_mp3_config.get('shard_min_duration', 600),
+        'analyze_audio': _mp4_to_mp3_config.get('analyze_audio', True),
+        'loudnorm_tolerance': _mp4_to_mp3_config.get('loudnorm_tolerance', 1.0),
+        'peak_tolerance': _mp4_to_mp3_config.get('peak_tolerance', 0.5),
+        'silence_skip_ratio': _mp4_to_mp3_config.get('silence_skip_ratio', 0.01)
+    }
+    
+    _ffmpeg_config = _config.get('ffmpeg', {})
+    FFMPEG_CONFIG = {
+        'probe_cache_size': _ffmpeg_config.get('probe_cache_size', 256),
+        'probe_cache_persist': _ffmpeg_config.get('probe_cache_persist', True),
+        'probe_size': _ffmpeg_config.get('probe_size', 5000000),
+        'analyze_duration': _ffmpeg_config.get('analyze_duration', 5000000),
+        'heavy_slots': _ffmpeg_config.get('heavy_slots', 0),
+        'light_slots': _ffmpeg_config.get('light_slots', 4),
+        'timeline_levels': _ffmpeg_config.get('timeline_levels', [2, 10, 60]),
+        'timeline_grid': _ffmpeg_config.get('timeline_grid', '10x10'),
+        'timeline_format': _ffmpeg_config.get('timeline_format', 'jpg'),
+        'thumbnail_width': _ffmpeg_config.get('thumbnail_width', 160),
+        'thumbnail_height': _ffmpeg_config.get('thumbnail_height', 90),
+        'waveform_sample_rate': _ffmpeg_config.get('waveform_sample_rate', 8000),
+        'waveform_levels': _ffmpeg_config.get('waveform_levels', [32, 128, 512, 2048, 8192]),
+        'waveform_bits': _ffmpeg_config.get('waveform_bits', 8)
     }
     
     _mp3_to_txt_config = _config.get('mp3_to_txt', {})
@@ -184,7 +287,13 @@ def reload_config():
         'enable_inverse_text_normalization': _mp3_to_txt_config.get('enable_inverse_text_normalization', True),
         'enable_voice_detection': _mp3_to_txt_config.get('enable_voice_detection', True),
         'max_sentence_silence': _mp3_to_txt_config.get('max_sentence_silence', 800),
-        'chunk_size': _mp3_to_txt_config.get('chunk_size', 8192)
+        'chunk_size': _mp3_to_txt_config.get('chunk_size', 8192),
+        'opus_bitrate': _mp3_to_txt_config.get('opus_bitrate', '16k'),
+        'binary_frames': _mp3_to_txt_config.get('binary_frames', True),
+        'direct_pcm': _mp3_to_txt_config.get('direct_pcm', True),
+        'prepare_media': _mp3_to_txt_config.get('prepare_media', True),
+        'parallel_min_window': _mp3_to_txt_config.get('parallel_min_window', 300),
+        'split_search_window': _mp3_to_txt_config.get('split_search_window', 30)
     }
     
     _alibaba_nls_config = _config.get('alibaba_nls', {})
@@ -193,7 +302,28 @@ def reload_config():
         'access_key_id': _alibaba_nls_config.get('access_key_id', os.getenv('ALIBABA_ACCESS_KEY_ID', '')),
         'access_key_secret': _alibaba_nls_config.get('access_key_secret', os.getenv('ALIBABA_ACCESS_KEY_SECRET', '')),
         'region': _alibaba_nls_config.get('region', os.getenv('ALIBABA_NLS_REGION', 'cn-shanghai')),
-        'endpoint': _alibaba_nls_config.get('endpoint', 'wss://nls-gateway.cn-shanghai.aliyuncs.com/ws/v1')
+        'endpoint': _alibaba_nls_config.get('endpoint', 'wss://nls-gateway.cn-shanghai.aliyuncs.com/ws/v1'),
+        'max_sessions': _alibaba_nls_config.get('max_sessions', 2),
+        'async_engine': _alibaba_nls_config.get('async_engine', True),
+        'connect_timeout': _alibaba_nls_config.get('connect_timeout', 15),
+        'idle_timeout': _alibaba_nls_config.get('idle_timeout', 30),
+        'session_timeout': _alibaba_nls_config.get('session_timeout', 3600),
+        'token_refresh_margin': _alibaba_nls_config.get('token_refresh_margin', 300)
+    }
+    
+    _result_cache_config = _config.get('result_cache', {})
+    RESULT_CACHE_CONFIG = {
+        'enabled': _result_cache_config.get('enabled', True),
+        'max_size_mb': _result_cache_config.get('max_size_mb', 2048)
+    }
+    
+    _scratch_config = _config.get('scratch', {})
+    SCRATCH_CONFIG = {
+        'use_tmpfs': _scratch_config.get('use_tmpfs', True),
+        'tmpfs_dir': _scratch_config.get('tmpfs_dir', '/dev/shm'),
+        'tmpfs_quota_mb': _scratch_config.get('tmpfs_quota_mb', 512),
+        'job_quota_mb': _scratch_config.get('job_quota_mb', 4096),
+        'global_quota_mb': _scratch_config.get('global_quota_mb', 16384)
     }
     
     _paths_config = _config.get('paths', {})
@@ -204,4 +334,5 @@ def reload_config():
     LOGS_DIR = PROJECT_ROOT / _paths_config.get('logs', 'workspace/logs')
     UPLOAD_DIR = PROJECT_ROOT / _paths_config.get('upload', 'workspace/upload')
     TMP_DIR = PROJECT_ROOT / _paths_config.get('tmp', 'workspace/tmp')
-    STATUS_DIR = PROJECT_ROOT / _paths_config.get('status', 'workspace/status') 
\ No newline at end of file
+    STATUS_DIR = PROJECT_ROOT / _paths_config.get('status', 'workspace/status')
+    CACHE_DIR = PROJECT_ROOT / _paths_config.get('cache', 'workspace/cache') 
\ No newline at end of file
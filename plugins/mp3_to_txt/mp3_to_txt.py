@@ -11,10 +11,11 @@ import sys
 import json
 import logging
 import time
-import wave
+import shutil
 import threading
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, List, Optional, Tuple, Any, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import base64
 import hashlib
@@ -30,15 +31,164 @@ import ssl
 project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
+import numpy as np
 import websocket
-import requests
-
-from pydub import AudioSegment
 
 from plugins.config import MP3_TO_TXT_CONFIG, ALIBABA_NLS_CONFIG, TMP_DIR, LOGS_DIR
+from plugins.common.ffmpeg_utils import FFmpegTools
+from plugins.common.audio_stream import decode_stream, MappedPCM, spool_pcm
+from plugins.common.silence import TimeMap, find_silences, frame_levels
+from plugins.common.scratch import scratch_manager, ScratchQuotaError
+from plugins.mp3_to_txt.nls_token import get_token_manager
+from plugins.mp3_to_txt.nls_async import NLSAsyncEngine, get_async_engine
 
 logger = logging.getLogger(__name__)
 
+NO_RESULTS_MESSAGE = "No recognition results received"
+
+# Audio formats the client can stream: raw PCM, or Ogg Opus encoded on the fly by ffmpeg
+NLS_AUDIO_FORMATS = ('pcm', 'opus')
+
+# Window cuts are searched on a low-rate decode for silences of at least this length and level
+SPLIT_ANALYSIS_RATE = 8000
+SPLIT_MIN_SILENCE = 0.3
+SPLIT_THRESHOLD_DB = -40.0
+
+# NLS sessions open at once per access key, shared by every recognition in the process
+_session_slots = {}
+_session_slots_lock = threading.Lock()
+
+def session_slots(config: Dict) -> threading.BoundedSemaphore:
+    """
+    Semaphore bounding the concurrent NLS sessions of an access key
+    
+    Args:
+        config: Alibaba NLS configuration (access_key_id, max_sessions)
+        
+    Returns:
+        Process-wide BoundedSemaphore sized by the account's concurrency quota
+    """
+    key = config.get('access_key_id')
+    with _session_slots_lock:
+        if key not in _session_slots:
+            _session_slots[key] = threading.BoundedSemaphore(max(1, int(config.get('max_sessions', 2))))
+        return _session_slots[key]
+
+def _bitrate_bps(bitrate) -> int:
+    """Parse an encoder bitrate such as '16k' into bits per second"""
+    text = str(bitrate).strip().lower()
+    try:
+        return int(float(text.rstrip('k')) * (1000 if text.endswith('k') else 1))
+    except ValueError:
+        return 16000
+
+def wire_format(config: Dict) -> str:
+    """
+    Audio format actually streamed to NLS for a configuration
+    
+    Opus needs an ffmpeg built with libopus; without it PCM is sent.
+    
+    Args:
+        config: MP3 to TXT configuration (format)
+        
+    Returns:
+        One of NLS_AUDIO_FORMATS
+    """
+    audio_format = str(config.get('format', 'pcm')).lower()
+    if audio_format not in NLS_AUDIO_FORMATS:
+        logger.warning(f"Unsupported NLS audio format '{audio_format}', sending PCM")
+        return 'pcm'
+    if audio_format == 'opus' and not FFmpegTools().has_encoder('libopus'):
+        logger.warning("libopus is not available, sending PCM to NLS")
+        return 'pcm'
+    return audio_format
+
+def expected_bytes(duration: float, sample_rate: int, audio_format: str = 'pcm', opus_bitrate: str = '16k') -> int:
+    """Approximate size of the audio stream sent for a duration, used for progress"""
+    if audio_format == 'opus':
+        return int(max(0.0, duration) * _bitrate_bps(opus_bitrate) / 8)
+    return int(max(0.0, duration) * sample_rate) * 2
+
+def _file_chunks(path: Path, chunk_size: int) -> Iterator[bytes]:
+    """Chunks of a spooled audio file"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def _pipe_chunks(ffmpeg_tools: FFmpegTools, input_path: Path, output_args: List[str], chunk_size: int,
+                 start: Optional[float], end: Optional[float]) -> Iterator[bytes]:
+    """Chunks read straight from an ffmpeg pipe"""
+    with ffmpeg_tools.audio_pipe(input_path, output_args, start=start, end=end) as stream:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def _pcm_chunks(input_path: Path, sample_rate: int, chunk_size: int,
+                start: Optional[float], end: Optional[float]) -> Iterator[memoryview]:
+    """16-bit mono PCM chunks decoded on an ffmpeg pipe"""
+    frame_ms = chunk_size / 2 * 1000.0 / sample_rate
+    frames = decode_stream(input_path, sr=sample_rate, channels=1, frame_ms=frame_ms, start=start, end=end)
+    try:
+        for frame in frames:
+            yield memoryview(frame).cast('B')
+    finally:
+        frames.close()
+
+def audio_chunks(input_path: Path, sample_rate: int, chunk_size: int,
+                 start: Optional[float] = None, end: Optional[float] = None,
+                 audio_format: str = 'pcm', opus_bitrate: str = '16k',
+                 spool_path: Optional[Path] = None) -> Iterator[bytes]:
+    """
+    Audio of an input (or of a time window of it) in chunks for NLS
+    
+    PCM is 16-bit mono in chunks of chunk_size bytes. Opus is encoded by
+    ffmpeg into an Ogg stream (speech-tuned VBR) and cut into chunks that
+    hold about as much audio as a PCM chunk, so sending keeps its pace
+    while far fewer bytes go over the wire.
+    
+    Sending is paced, so a decode read straight from the pipe would hold
+    its heavy scheduler slot for the whole session. With ``spool_path``
+    the Opus stream is encoded into that file first, at full speed, and
+    the chunks are read from it (PCM is spooled with spool_pcm instead).
+    
+    Args:
+        input_path: Path to any audio/video input
+        sample_rate: Output sample rate in Hz
+        chunk_size: PCM chunk size in bytes
+        start: Optional window start in seconds
+        end: Optional window end in seconds
+        audio_format: 'pcm' or 'opus' (see wire_format)
+        opus_bitrate: Opus encoder bitrate
+        spool_path: Optional file (usually in a scratch space) to encode Opus into before sending
+        
+    Returns:
+        Iterator of audio chunks (the last may be short); PCM chunks are views
+        that are only valid until the next chunk is requested
+    """
+    if audio_format == 'opus':
+        ffmpeg_tools = FFmpegTools()
+        chunk_seconds = chunk_size / 2 / sample_rate
+        opus_chunk = max(256, int(_bitrate_bps(opus_bitrate) * chunk_seconds / 8))
+        output_args = [
+            "-ac", "1",
+            "-ar", str(sample_rate),
+            *ffmpeg_tools.audio_encoder_args({'audio_codec': 'opus', 'audio_bitrate': opus_bitrate}),
+            "-f", "ogg"
+        ]
+        if spool_path is None:
+            return _pipe_chunks(ffmpeg_tools, input_path, output_args, opus_chunk, start, end)
+        with ffmpeg_tools.audio_pipe(input_path, output_args, start=start, end=end) as stream, \
+                open(spool_path, 'wb') as f:
+            shutil.copyfileobj(stream, f, 1 << 20)
+        return _file_chunks(spool_path, opus_chunk)
+    
+    return _pcm_chunks(input_path, sample_rate, chunk_size, start, end)
+
 class AlibabaNLSRealTimeClient:
     """Alibaba Cloud NLS (Natural Language Service) Real-time Speech Recognition Client"""
     
@@ -51,8 +201,10 @@ class AlibabaNLSRealTimeClient:
         self.sentence_results = []
         self.is_connected = False
         self.recognition_completed = False
+        self.last_message_time = 0.0
         self.error_message = None
         self.task_id = None
+        self.audio_format = self.recognition_config['format']
         self.lock = threading.Lock()
         
         # Validate configuration
@@ -60,47 +212,13 @@ class AlibabaNLSRealTimeClient:
             raise ValueError("Alibaba Cloud access key ID and secret are required")
         if not self.config.get('app_key'):
             raise ValueError("Alibaba NLS app key is required")
+        
+        # Fetch the token now so it is ready by the time audio is decoded
+        get_token_manager(self.config).start()
     
     def _get_token(self) -> str:
-        """Get access token from Alibaba Cloud STS"""
-        try:
-            # Use STS to get token
-            url = "https://nls-meta.cn-shanghai.aliyuncs.com/pop/2018-05-18/tokens"
-            
-            # Build headers
-            headers = {
-                'Content-Type': 'application/json',
-                'Accept': 'application/json'
-            }
-            
-            # Build request data
-            data = {
-                'AccessKeyId': self.config['access_key_id'],
-                'Action': 'CreateToken',
-                'Version': '2019-02-28',
-                'RegionId': 'cn-shanghai',
-                'Format': 'JSON'
-            }
-            
-            # Make request
-            response = requests.post(url, headers=headers, json=data, timeout=10)
-            
-            if response.status_code == 200:
-                result = response.json()
-                token = result.get('Token', {}).get('Id')
-                if token:
-                    logger.info("Successfully obtained access token")
-                    return token
-                else:
-                    logger.error(f"Failed to get token from response: {result}")
-                    return None
-            else:
-                logger.error(f"Failed to get token: {response.status_code} - {response.text}")
-                return None
-                
-        except Exception as e:
-            logger.error(f"Error getting token: {str(e)}")
-            return None
+        """Get access token from the shared token manager (cached, refreshed in the background)"""
+        return get_token_manager(self.config).get_token()
     
     def _build_auth_url(self) -> str:
         """Build WebSocket URL with authentication"""
@@ -122,6 +240,11 @@ class AlibabaNLSRealTimeClient:
     
     def _on_message(self, ws, message):
         """Handle WebSocket messages"""
+        self.last_message_time = time.time()
+        self._handle_message(message)
+    
+    def _handle_message(self, message: str) -> bool:
+        """Apply one service message to the session state (both transports), True once recognition is over"""
         try:
             data = json.loads(message)
             header = data.get('header', {})
@@ -184,6 +307,8 @@ class AlibabaNLSRealTimeClient:
             logger.error(f"Error processing message: {str(e)}")
             self.error_message = f"Message processing error: {str(e)}"
             self.recognition_completed = True
+        
+        return self.recognition_completed
     
     def _on_error(self, ws, error):
         """Handle WebSocket errors"""
@@ -198,20 +323,16 @@ class AlibabaNLSRealTimeClient:
         if not self.recognition_completed:
             self.recognition_completed = True
     
-    def _on_open(self, ws):
-        """Handle WebSocket open"""
-        logger.info("WebSocket connection opened")
-        self.is_connected = True
-        
-        # Send start recognition message
-        start_message = {
+    def _start_message(self) -> Dict:
+        """StartTranscription message for the current audio format"""
+        return {
             "header": {
                 "message_id": str(int(time.time() * 1000)),
                 "name": "StartTranscription",
                 "namespace": "SpeechTranscriber"
             },
             "payload": {
-                "format": self.recognition_config['format'],
+                "format": self.audio_format,
                 "sample_rate": self.recognition_config['sample_rate'],
                 "enable_punctuation_prediction": self.recognition_config['enable_punctuation_prediction'],
                 "enable_inverse_text_normalization": self.recognition_config['enable_inverse_text_normalization'],
@@ -221,26 +342,66 @@ class AlibabaNLSRealTimeClient:
                 "enable_sample_rate_adaptive": True
             }
         }
+    
+    def _on_open(self, ws):
+        """Handle WebSocket open"""
+        logger.info("WebSocket connection opened")
+        self.is_connected = True
         
+        # Send start recognition message
         try:
-            ws.send(json.dumps(start_message))
+            ws.send(json.dumps(self._start_message()))
             logger.info("Start recognition message sent")
         except Exception as e:
             logger.error(f"Failed to send start message: {str(e)}")
             self.error_message = f"Failed to send start message: {str(e)}"
             self.recognition_completed = True
     
-    def recognize_audio(self, audio_data: bytes, progress_callback=None) -> Tuple[bool, str, List[Dict]]:
+    def _chunk_source(self, audio_data, total_bytes: int = None) -> Tuple[Iterator, int]:
+        """Iterator of audio chunks and the expected stream size"""
+        if isinstance(audio_data, (bytes, bytearray, memoryview)):
+            # Slices of a memoryview share the buffer instead of copying it
+            chunk_size = self.recognition_config['chunk_size']
+            audio_view = memoryview(audio_data).cast('B')
+            chunks = (audio_view[i:i + chunk_size] for i in range(0, len(audio_view), chunk_size))
+            return chunks, max(1, len(audio_view))
+        return iter(audio_data), max(1, total_bytes or 0)
+    
+    def _recognize_async(self, engine: NLSAsyncEngine, url: str, audio_data, progress_callback=None,
+                         total_bytes: int = None) -> Tuple[bool, str, List[Dict]]:
+        """Run the session on the shared asyncio engine and wait for its outcome (no polling)"""
+        chunks, total_bytes = self._chunk_source(audio_data, total_bytes)
+        error = engine.recognize(
+            url, json.dumps(self._start_message()), chunks, self._handle_message,
+            progress_callback, total_bytes, self.recognition_config.get('binary_frames', True)
+        )
+        if error and not self.error_message:
+            self.error_message = error
+        
+        if self.error_message:
+            return False, self.error_message, []
+        if not self.sentence_results:
+            return False, NO_RESULTS_MESSAGE, []
+        return True, "Recognition completed successfully", self.sentence_results
+    
+    def recognize_audio(self, audio_data, progress_callback=None,
+                        total_bytes: int = None, audio_format: str = None) -> Tuple[bool, str, List[Dict]]:
         """
         Recognize speech from audio data
         
         Args:
-            audio_data: PCM audio data
+            audio_data: Audio data, either bytes or an iterable of chunks
+                (e.g. streamed from an ffmpeg pipe)
             progress_callback: Optional progress callback function
+            total_bytes: Expected stream size, used for progress when audio_data is an iterable
+            audio_format: Format of audio_data announced to NLS (defaults to the configured format)
             
         Returns:
             Tuple of (success, message, results)
         """
+        # Stay within the account's concurrent session quota
+        slots = session_slots(self.config)
+        slots.acquire()
         try:
             logger.info("Starting real-time speech recognition")
             
@@ -248,8 +409,10 @@ class AlibabaNLSRealTimeClient:
             self.results = []
             self.sentence_results = []
             self.recognition_completed = False
+            self.last_message_time = 0.0
             self.error_message = None
             self.task_id = None
+            self.audio_format = audio_format or self.recognition_config['format']
             
             if progress_callback:
                 progress_callback(0, "Connecting to Alibaba NLS service...")
@@ -257,6 +420,10 @@ class AlibabaNLSRealTimeClient:
             # Build WebSocket URL
             url = self._build_auth_url()
             
+            engine = get_async_engine(self.config)
+            if engine is not None:
+                return self._recognize_async(engine, url, audio_data, progress_callback, total_bytes)
+            
             # Create WebSocket connection
             self.ws = websocket.WebSocketApp(
                 url,
@@ -275,7 +442,7 @@ class AlibabaNLSRealTimeClient:
             ws_thread.start()
             
             # Wait for connection
-            connection_timeout = 15
+            connection_timeout = self.config.get('connect_timeout', 15)
             start_time = time.time()
             while not self.is_connected and time.time() - start_time < connection_timeout:
                 if self.error_message:
@@ -289,34 +456,36 @@ class AlibabaNLSRealTimeClient:
                 progress_callback(20, "Sending audio data...")
             
             # Send audio data in chunks
-            chunk_size = self.recognition_config['chunk_size']
-            total_chunks = len(audio_data) // chunk_size + 1
+            chunks, total_bytes = self._chunk_source(audio_data, total_bytes)
+            binary_frames = self.recognition_config.get('binary_frames', True)
+            sent_bytes = 0
             
-            for i in range(0, len(audio_data), chunk_size):
+            for chunk_index, chunk in enumerate(chunks):
                 if self.error_message:
                     break
-                    
-                chunk = audio_data[i:i + chunk_size]
-                
-                # Send audio chunk
-                audio_message = {
-                    "header": {
-                        "message_id": str(int(time.time() * 1000)),
-                        "name": "RunTranscription",
-                        "namespace": "SpeechTranscriber"
-                    },
-                    "payload": {
-                        "audio": base64.b64encode(chunk).decode('utf-8')
-                    }
-                }
                 
                 try:
-                    self.ws.send(json.dumps(audio_message))
+                    if binary_frames:
+                        # Raw audio in a binary frame: no base64 inflation and no JSON envelope per chunk
+                        self.ws.send(chunk, opcode=websocket.ABNF.OPCODE_BINARY)
+                    else:
+                        audio_message = {
+                            "header": {
+                                "message_id": str(int(time.time() * 1000)),
+                                "name": "RunTranscription",
+                                "namespace": "SpeechTranscriber"
+                            },
+                            "payload": {
+                                "audio": base64.b64encode(chunk).decode('utf-8')
+                            }
+                        }
+                        self.ws.send(json.dumps(audio_message))
+                    sent_bytes += len(chunk)
                     
                     # Update progress
                     if progress_callback:
-                        progress = 20 + (i // chunk_size) * 60 // total_chunks
-                        progress_callback(progress, f"Processing audio chunk {i//chunk_size + 1}/{total_chunks}")
+                        progress = 20 + min(sent_bytes, total_bytes) * 60 // total_bytes
+                        progress_callback(progress, f"Processing audio chunk {chunk_index + 1}")
                     
                     # Small delay to avoid overwhelming the service
                     time.sleep(0.05)
@@ -326,6 +495,12 @@ class AlibabaNLSRealTimeClient:
                     self.error_message = f"Failed to send audio data: {str(e)}"
                     break
             
+            if isinstance(chunks, Iterator):
+                # Stop the producer (e.g. kill a still-running ffmpeg decode)
+                close = getattr(chunks, 'close', None)
+                if close:
+                    close()
+            
             if progress_callback:
                 progress_callback(80, "Finalizing recognition...")
             
@@ -344,11 +519,14 @@ class AlibabaNLSRealTimeClient:
             except Exception as e:
                 logger.error(f"Failed to send stop message: {str(e)}")
             
-            # Wait for completion
-            completion_timeout = 30
-            start_time = time.time()
-            while not self.recognition_completed and time.time() - start_time < completion_timeout:
+            # Wait for completion: give up after idle_timeout seconds without a service message
+            idle_timeout = self.config.get('idle_timeout', 30)
+            self.last_message_time = max(self.last_message_time, time.time())
+            while not self.recognition_completed and time.time() - self.last_message_time < idle_timeout:
                 time.sleep(0.1)
+            if not self.recognition_completed:
+                logger.warning(f"No message from Alibaba NLS for {idle_timeout:.0f}s, "
+                               f"keeping the results received so far")
             
             if progress_callback:
                 progress_callback(100, "Recognition completed!")
@@ -363,7 +541,7 @@ class AlibabaNLSRealTimeClient:
                 return False, self.error_message, []
             
             if not self.sentence_results:
-                return False, "No recognition results received", []
+                return False, NO_RESULTS_MESSAGE, []
             
             return True, "Recognition completed successfully", self.sentence_results
             
@@ -378,6 +556,189 @@ class AlibabaNLSRealTimeClient:
                     self.ws.close()
                 except:
                     pass
+            slots.release()
+
+class ParallelNLSRecognizer:
+    """
+    Recognize long audio with several concurrent NLS sessions
+    
+    One session is paced by its chunk sending, so a long file is cut into
+    windows at the silences closest to evenly spaced targets and each window
+    is decoded (input-side seek) and streamed through its own session. The
+    sentences are shifted by their window offsets and merged in order.
+    Sessions of all recognitions in the process share the slots of the
+    account's concurrency quota (alibaba_nls.max_sessions).
+    """
+    
+    def __init__(self, nls_config: Dict = None, config: Dict = None):
+        """
+        Initialize parallel recognizer
+        
+        Args:
+            nls_config: Alibaba NLS configuration
+            config: MP3 to TXT configuration (sample_rate, chunk_size, format, parallel_min_window, split_search_window)
+        """
+        self.nls_config = nls_config or ALIBABA_NLS_CONFIG.copy()
+        self.config = config or MP3_TO_TXT_CONFIG.copy()
+    
+    def session_count(self, duration: float) -> int:
+        """
+        Number of windows for an input, each at least parallel_min_window seconds long
+        
+        Args:
+            duration: Input duration in seconds
+            
+        Returns:
+            Session count (1 means a single ordinary session)
+        """
+        min_window = float(self.config.get('parallel_min_window', 300))
+        max_sessions = int(self.nls_config.get('max_sessions', 2))
+        if duration <= 0 or min_window <= 0:
+            return 1
+        return max(1, min(max_sessions, int(duration // min_window)))
+    
+    def _find_split(self, input_path: Path, target: float, duration: float,
+                    source: Optional[MappedPCM] = None) -> float:
+        """Time of the silence closest to target, or of the quietest 100 ms around it"""
+        search = float(self.config.get('split_search_window', 30))
+        start = max(0.0, target - search)
+        end = min(duration, target + search)
+        
+        if source is not None:
+            samples, rate = source.samples(start, end), source.sample_rate
+        else:
+            frames = [frame.copy() for frame in decode_stream(input_path, sr=SPLIT_ANALYSIS_RATE, channels=1,
+                                                              frame_ms=1000, start=start, end=end)]
+            samples, rate = (np.concatenate(frames) if frames else np.empty(0, dtype=np.int16)), SPLIT_ANALYSIS_RATE
+        if len(samples) == 0:
+            return target
+        
+        silences = find_silences(samples, rate, SPLIT_THRESHOLD_DB, SPLIT_MIN_SILENCE)
+        if len(silences):
+            middles = start + silences.mean(axis=1) / rate
+            return float(middles[np.argmin(np.abs(middles - target))])
+        
+        # No pause long enough: cut in the quietest frame
+        frame = rate // 10
+        levels = frame_levels(samples, frame)
+        return start + (int(np.argmin(levels)) + 0.5) * frame / rate
+    
+    def plan_windows(self, input_path: Path, duration: float, count: int,
+                     source: Optional[MappedPCM] = None) -> List[Tuple[float, Optional[float]]]:
+        """
+        Cut an input into windows at silences
+        
+        Args:
+            input_path: Path to input audio/video file
+            duration: Input duration in seconds
+            count: Desired number of windows
+            source: Optional mapped PCM of the input, searched instead of decoding
+            
+        Returns:
+            List of (start, end) tuples in seconds; the last end is None (read to end)
+        """
+        cuts = [0.0]
+        for index in range(1, count):
+            cut = self._find_split(input_path, duration * index / count, duration, source)
+            if cut > cuts[-1]:
+                cuts.append(cut)
+        return [(start, cuts[i + 1] if i + 1 < len(cuts) else None) for i, start in enumerate(cuts)]
+    
+    def recognize(self, input_path: Path, duration: float, progress_callback=None,
+                  source: Optional[MappedPCM] = None, scratch=None) -> Tuple[bool, str, List[Dict]]:
+        """
+        Recognize an input with concurrent sessions over silence-aligned windows
+        
+        Args:
+            input_path: Path to input audio/video file
+            duration: Input duration in seconds
+            progress_callback: Optional progress callback function
+            source: Optional mapped PCM of the input; windows are then sliced
+                from it instead of decoded separately
+            scratch: Optional ScratchSpace the Opus windows are encoded into before sending
+            
+        Returns:
+            Tuple of (success, message, results) with results on the input timeline
+        """
+        count = self.session_count(duration)
+        if progress_callback:
+            progress_callback(0, f"Splitting audio into {count} windows at silences...")
+        windows = self.plan_windows(input_path, duration, count, source)
+        logger.info(f"Recognizing {input_path.name} in {len(windows)} parallel windows: "
+                    + ", ".join(f"{start:.1f}-{(end if end is not None else duration):.1f}s" for start, end in windows))
+        
+        sample_rate = self.config['sample_rate']
+        audio_format = 'pcm' if source is not None else wire_format(self.config)
+        opus_bitrate = self.config.get('opus_bitrate', '16k')
+        window_progress = [0.0] * len(windows)
+        progress_lock = threading.Lock()
+        failed = threading.Event()
+        
+        def run_window(index: int) -> Tuple[bool, str, List[Dict]]:
+            start, end = windows[index]
+            if failed.is_set():
+                return False, "Cancelled after another window failed", []
+            
+            def on_progress(percent, message):
+                with progress_lock:
+                    window_progress[index] = percent
+                    done = sum(window_progress) / len(window_progress)
+                if progress_callback:
+                    progress_callback(10 + done * 0.9, f"Recognizing {len(windows)} windows in parallel... {done:.0f}%")
+            
+            length = (end if end is not None else duration) - start
+            client = AlibabaNLSRealTimeClient(self.nls_config)
+            if source is not None:
+                chunks = source.chunks(self.config['chunk_size'], start, end)
+            else:
+                spool_path = None
+                if scratch is not None:
+                    try:
+                        spool_path = scratch.allocate(f"window_{index:03d}.ogg",
+                                                      expected_bytes(length, sample_rate, audio_format, opus_bitrate))
+                    except ScratchQuotaError as e:
+                        logger.warning(f"Window {index + 1}: streaming Opus from the encoder instead of scratch: {str(e)}")
+                chunks = audio_chunks(input_path, sample_rate, self.config['chunk_size'], start, end,
+                                      audio_format, opus_bitrate, spool_path)
+            success, message, results = client.recognize_audio(
+                chunks,
+                on_progress,
+                total_bytes=expected_bytes(length, sample_rate, audio_format, opus_bitrate),
+                audio_format=audio_format
+            )
+            if not success:
+                if message == NO_RESULTS_MESSAGE:
+                    # Window without speech
+                    return True, message, []
+                failed.set()
+                return False, f"Window {index + 1} ({start:.1f}s): {message}", []
+            
+            offset = int(round(start * 1000))
+            return True, message, [
+                dict(result, begin_time=result.get('begin_time', 0) + offset,
+                     end_time=result.get('end_time', 0) + offset)
+                for result in results
+            ]
+        
+        if progress_callback:
+            progress_callback(10, f"Recognizing {len(windows)} windows in parallel...")
+        
+        # Each worker thread only waits on its own session; the session slots bound the real concurrency
+        with ThreadPoolExecutor(max_workers=len(windows)) as pool:
+            outcomes = list(pool.map(run_window, range(len(windows))))
+        
+        for success, message, _ in outcomes:
+            if not success:
+                return False, message, []
+        
+        results = sorted((result for _, _, window_results in outcomes for result in window_results),
+                         key=lambda result: result.get('begin_time', 0))
+        if not results:
+            return False, NO_RESULTS_MESSAGE, []
+        
+        if progress_callback:
+            progress_callback(100, "Recognition completed!")
+        return True, f"Recognition completed successfully ({len(windows)} parallel sessions)", results
 
 class MP3ToTXTConverter:
     """MP3 to TXT converter using Alibaba Cloud NLS"""
@@ -386,6 +747,7 @@ class MP3ToTXTConverter:
         """Initialize converter with configuration"""
         self.config = config or MP3_TO_TXT_CONFIG.copy()
         self.nls_client = AlibabaNLSRealTimeClient()
+        self.parallel_recognizer = ParallelNLSRecognizer(self.nls_client.config, self.config)
         self.tmp_dir = TMP_DIR
         self.tmp_dir.mkdir(exist_ok=True)
     
@@ -411,17 +773,43 @@ class MP3ToTXTConverter:
             if progress_callback:
                 progress_callback(0, "Loading audio file...")
             
-            # Load and prepare audio
-            audio_data = self._prepare_audio(input_path, progress_callback)
+            duration = float(FFmpegTools().get_video_info(input_path, fast=True).get('duration', 0))
+            sessions = self.parallel_recognizer.session_count(duration)
+            audio_format = wire_format(self.config)
             
-            if progress_callback:
-                progress_callback(30, "Starting speech recognition...")
-            
-            # Perform speech recognition
-            success, message, results = self.nls_client.recognize_audio(
-                audio_data, 
-                lambda p, m: progress_callback(30 + p * 0.6, m) if progress_callback else None
-            )
+            with scratch_manager.job(f"nls-{input_path.stem}") as scratch:
+                source = self._open_source(input_path, duration, audio_format, scratch, progress_callback)
+                mapped = source is not None
+                try:
+                    if sessions > 1:
+                        # Long input: concurrent sessions over windows cut at silences
+                        success, message, results = self.parallel_recognizer.recognize(
+                            input_path, source.duration if mapped else duration,
+                            lambda p, m: progress_callback(10 + p * 0.8, m) if progress_callback else None,
+                            source=source, scratch=scratch
+                        )
+                    else:
+                        if mapped:
+                            # Slices of the mapped file, nothing is decoded or copied
+                            audio_data, total_bytes = source.chunks(self.config['chunk_size']), source.size
+                        else:
+                            # Opus encoded into scratch (or PCM from the ffmpeg pipe if it did not fit)
+                            audio_data, total_bytes = self._stream_audio(input_path, progress_callback, duration,
+                                                                         audio_format, scratch)
+                        
+                        if progress_callback:
+                            progress_callback(30, "Starting speech recognition...")
+                        
+                        # Perform speech recognition
+                        success, message, results = self.nls_client.recognize_audio(
+                            audio_data, 
+                            lambda p, m: progress_callback(30 + p * 0.6, m) if progress_callback else None,
+                            total_bytes=total_bytes,
+                            audio_format=audio_format
+                        )
+                finally:
+                    if mapped:
+                        source.close()
             
             if not success:
                 return False, message, {}
@@ -429,6 +817,15 @@ class MP3ToTXTConverter:
             if progress_callback:
                 progress_callback(90, "Saving results...")
             
+            # Audio trimmed by silence removal: move timestamps back onto the source timeline
+            time_map = TimeMap.load_for(input_path)
+            if time_map is not None:
+                for result in results:
+                    for key in ('begin_time', 'end_time'):
+                        if key in result:
+                            result[key] = int(round(time_map.to_original(result[key] / 1000.0) * 1000))
+                logger.info(f"Timestamps remapped to the original timeline: {TimeMap.path_for(input_path).name}")
+            
             # Process results
             full_text = self._process_results(results)
             
@@ -450,6 +847,10 @@ class MP3ToTXTConverter:
                 'results_count': len(results),
                 'total_text_length': len(full_text),
                 'sentences_count': len(results),
+                'nls_sessions': sessions,
+                'nls_audio_format': audio_format,
+                'memory_mapped_source': mapped,
+                'time_map_applied': time_map is not None,
                 'config_used': self.config.copy(),
                 'timestamp': end_time.isoformat()
             }
@@ -467,24 +868,75 @@ class MP3ToTXTConverter:
             logger.error(error_msg)
             return False, error_msg, {}
     
-    def _prepare_audio(self, input_path: Path, progress_callback=None) -> bytes:
-        """Prepare audio for recognition"""
-        if progress_callback:
-            progress_callback(10, "Converting audio format...")
+    def _open_source(self, input_path: Path, duration: float, audio_format: str,
+                     scratch, progress_callback=None) -> Optional[MappedPCM]:
+        """
+        Memory-mapped PCM of the input when it can be sent without a decode per reader
         
-        # Load audio file
-        audio = AudioSegment.from_mp3(str(input_path))
+        A 16-bit mono WAV at the recognition sample rate (e.g. the ASR track
+        written by media preparation) is mapped as is. Other inputs are
+        decoded once into the job's scratch space and mapped, so the decode
+        holds its heavy scheduler slot only while ffmpeg runs, not while the
+        paced sessions send. If the scratch quota is exceeded the input is
+        streamed from an ffmpeg pipe instead (None).
+        
+        Args:
+            input_path: Path to input audio/video file
+            duration: Input duration in seconds
+            audio_format: Wire format, only PCM can be sent from a map
+            scratch: ScratchSpace of the conversion
+            progress_callback: Optional progress callback function
+            
+        Returns:
+            MappedPCM or None
+        """
+        if audio_format != 'pcm':
+            return None
         
-        # Convert to required format for NLS
-        audio = audio.set_frame_rate(self.config['sample_rate'])
-        audio = audio.set_channels(1)  # Mono
-        audio = audio.set_sample_width(2)  # 16-bit
+        sample_rate = self.config['sample_rate']
+        source = MappedPCM.open_wav(input_path)
+        if source is not None:
+            if source.sample_rate == sample_rate and source.channels == 1:
+                logger.info(f"Sending memory-mapped WAV without decoding: {input_path.name}")
+                return source
+            source.close()
         
         if progress_callback:
-            progress_callback(20, "Extracting audio data...")
+            progress_callback(5, "Decoding audio to scratch space...")
+        try:
+            pcm_path = scratch.allocate(f"{input_path.stem}.pcm", expected_bytes(duration, sample_rate))
+        except ScratchQuotaError as e:
+            logger.warning(f"Streaming PCM from the decoder instead of scratch: {str(e)}")
+            return None
+        source = spool_pcm(input_path, pcm_path, sr=sample_rate)
+        try:
+            scratch.check()
+        except ScratchQuotaError:
+            source.close()
+            raise
+        return source
+    
+    def _stream_audio(self, input_path: Path, progress_callback=None, duration: float = None,
+                      audio_format: str = 'pcm', scratch=None) -> Tuple[Iterator[bytes], int]:
+        """Decode any audio/video input to 16-bit mono PCM chunks on an ffmpeg pipe (Ogg Opus spooled to scratch)"""
+        if progress_callback:
+            progress_callback(10, "Decoding audio stream...")
+        
+        sample_rate = self.config['sample_rate']
+        if duration is None:
+            duration = float(FFmpegTools().get_video_info(input_path, fast=True).get('duration', 0))
+        opus_bitrate = self.config.get('opus_bitrate', '16k')
+        total_bytes = expected_bytes(duration, sample_rate, audio_format, opus_bitrate)
+        
+        spool_path = None
+        if audio_format == 'opus' and scratch is not None:
+            try:
+                spool_path = scratch.allocate(f"{input_path.stem}.ogg", total_bytes)
+            except ScratchQuotaError as e:
+                logger.warning(f"Streaming Opus from the encoder instead of scratch: {str(e)}")
         
-        # Export to PCM format
-        return audio.raw_data
+        return audio_chunks(input_path, sample_rate, self.config['chunk_size'],
+                            audio_format=audio_format, opus_bitrate=opus_bitrate, spool_path=spool_path), total_bytes
     
     def _process_results(self, results: List[Dict]) -> str:
         """Process recognition results into full text"""
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+NLS Async Engine
+Many Alibaba Cloud NLS recognition sessions multiplexed on one asyncio event loop
+"""
+
+import ssl
+import json
+import time
+import base64
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Iterator, Optional
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+logger = logging.getLogger(__name__)
+
+# Pause between audio chunks, same pacing as the thread transport
+SEND_INTERVAL = 0.05
+
+def _message(name: str, payload: Dict = None) -> str:
+    """JSON control message of the SpeechTranscriber namespace"""
+    message = {
+        "header": {
+            "message_id": str(int(time.time() * 1000)),
+            "name": name,
+            "namespace": "SpeechTranscriber"
+        }
+    }
+    if payload is not None:
+        message["payload"] = payload
+    return json.dumps(message)
+
+def _ssl_context() -> ssl.SSLContext:
+    """TLS settings of the thread transport (certificate checks disabled)"""
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+class _Session:
+    """State of one recognition session on the loop"""
+    
+    def __init__(self, url: str, start_message: str, chunks: Iterator, on_message: Callable[[str], bool],
+                 progress_callback, total_bytes: int, binary_frames: bool):
+        self.url = url
+        self.start_message = start_message
+        self.chunks = chunks
+        self.on_message = on_message
+        self.progress_callback = progress_callback
+        self.total_bytes = max(1, total_bytes or 0)
+        self.binary_frames = binary_frames
+        self.started = None
+        self.finished = None
+        self.last_message = 0.0
+    
+    def progress(self, percent: float, message: str):
+        if self.progress_callback:
+            self.progress_callback(percent, message)
+
+class NLSAsyncEngine:
+    """
+    One event loop thread running any number of NLS sessions
+    
+    A session is a coroutine that connects, starts transcription, streams
+    the audio and resolves when TranscriptionCompleted (or an error)
+    arrives; every state change is awaited instead of polled. Audio
+    iterators may block (ffmpeg pipes), so chunks are pulled on a small
+    reader pool. Callers in other threads use recognize(), which blocks on
+    a future (at most ``session_timeout`` seconds, then the session is
+    cancelled) and is the sync facade of AlibabaNLSRealTimeClient.
+    """
+    
+    def __init__(self, connect_timeout: float = 15, idle_timeout: float = 30, session_timeout: float = 3600,
+                 reader_threads: int = 32):
+        """
+        Initialize engine (the loop thread starts with the first session)
+        
+        Args:
+            connect_timeout: Seconds to connect and get TranscriptionStarted
+            idle_timeout: Seconds without a service message, once all audio is sent, before giving up
+            session_timeout: Seconds recognize() waits for a whole session before cancelling it (0 waits forever)
+            reader_threads: Threads pulling chunks from blocking audio iterators
+        """
+        self.connect_timeout = float(connect_timeout)
+        self.idle_timeout = float(idle_timeout)
+        self.session_timeout = float(session_timeout)
+        self._readers = ThreadPoolExecutor(max_workers=reader_threads, thread_name_prefix='nls-audio')
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'sessions': 0, 'active': 0, 'peak_active': 0, 'failed': 0, 'timed_out': 0}
+    
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the loop thread once"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='nls-async-loop', daemon=True)
+                self._thread.start()
+            return self._loop
+    
+    def submit(self, url: str, start_message: str, chunks: Iterator, on_message: Callable[[str], bool],
+               progress_callback=None, total_bytes: int = None, binary_frames: bool = True) -> Future:
+        """
+        Schedule a session on the loop
+        
+        Args:
+            url: Authenticated WebSocket URL
+            start_message: StartTranscription message
+            chunks: Iterator of audio chunks
+            on_message: Called on the loop thread with every service message,
+                returns True once recognition is over
+            progress_callback: Optional progress callback function (called on the loop thread)
+            total_bytes: Expected stream size, used for progress
+            binary_frames: Send audio as binary frames instead of base64 JSON messages
+            
+        Returns:
+            concurrent.futures.Future resolving to None or an error message
+        """
+        session = _Session(url, start_message, chunks, on_message, progress_callback, total_bytes, binary_frames)
+        return asyncio.run_coroutine_threadsafe(self._run(session), self._ensure_loop())
+    
+    def recognize(self, *args, **kwargs) -> Optional[str]:
+        """Blocking submit(): wait for the session and return its error message (None on success)"""
+        future = self.submit(*args, **kwargs)
+        try:
+            return future.result(self.session_timeout or None)
+        except FutureTimeout:
+            # Cancelling the task closes the socket and the audio source, the caller gets its slot back
+            future.cancel()
+            with self._lock:
+                self._stats['timed_out'] += 1
+            error = f"Recognition session did not finish within {self.session_timeout:.0f}s, cancelled"
+            logger.error(error)
+            return error
+    
+    async def _run(self, session: _Session) -> Optional[str]:
+        """Run a session and keep the counters"""
+        with self._lock:
+            self._stats['sessions'] += 1
+            self._stats['active'] += 1
+            self._stats['peak_active'] = max(self._stats['peak_active'], self._stats['active'])
+        try:
+            error = await self._session(session)
+        finally:
+            await self._close_chunks(session.chunks)
+            with self._lock:
+                self._stats['active'] -= 1
+        if error:
+            with self._lock:
+                self._stats['failed'] += 1
+            logger.error(error)
+        return error
+    
+    async def _session(self, session: _Session) -> Optional[str]:
+        """Connect, stream the audio and wait for the final result"""
+        loop = asyncio.get_running_loop()
+        session.started = loop.create_future()
+        session.finished = loop.create_future()
+        session.last_message = loop.time()
+        
+        try:
+            tls = _ssl_context() if session.url.startswith('wss://') else None
+            async with websockets.connect(session.url, ssl=tls, max_size=None,
+                                          open_timeout=self.connect_timeout) as ws:
+                receiver = asyncio.create_task(self._receive(ws, session))
+                try:
+                    await ws.send(session.start_message)
+                    try:
+                        await asyncio.wait_for(asyncio.shield(session.started), self.connect_timeout)
+                    except asyncio.TimeoutError:
+                        return "Failed to start recognition on Alibaba NLS service"
+                    
+                    session.progress(20, "Sending audio data...")
+                    sent_bytes = 0
+                    chunk_index = 0
+                    while not session.finished.done():
+                        chunk = await loop.run_in_executor(self._readers, next, session.chunks, None)
+                        if chunk is None:
+                            break
+                        if session.binary_frames:
+                            await ws.send(chunk)
+                        else:
+                            await ws.send(_message("RunTranscription",
+                                                   {"audio": base64.b64encode(chunk).decode('utf-8')}))
+                        sent_bytes += len(chunk)
+                        chunk_index += 1
+                        session.progress(20 + min(sent_bytes, session.total_bytes) * 60 // session.total_bytes,
+                                         f"Processing audio chunk {chunk_index}")
+                        await asyncio.sleep(SEND_INTERVAL)
+                    
+                    session.progress(80, "Finalizing recognition...")
+                    if not session.finished.done():
+                        await ws.send(_message("StopTranscription"))
+                        # Idle time counts from the last message or the end of the audio, whichever is later
+                        session.last_message = max(session.last_message, loop.time())
+                        if not await self._wait_idle(session):
+                            logger.warning(f"No message from Alibaba NLS for {self.idle_timeout:.0f}s, "
+                                           f"keeping the results received so far")
+                finally:
+                    receiver.cancel()
+        except Exception as e:
+            if session.finished.done():
+                return None
+            return f"WebSocket error: {str(e)}"
+        
+        session.progress(100, "Recognition completed!")
+        return None
+    
+    async def _receive(self, ws, session: _Session):
+        """Feed service messages to the session until it is over or the connection closes"""
+        try:
+            async for message in ws:
+                if not isinstance(message, str):
+                    continue
+                session.last_message = asyncio.get_running_loop().time()
+                done = session.on_message(message)
+                # The first reply to StartTranscription is TranscriptionStarted (or TaskFailed)
+                if not session.started.done():
+                    session.started.set_result(None)
+                if done:
+                    break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"WebSocket error: {str(e)}")
+        finally:
+            for future in (session.started, session.finished):
+                if not future.done():
+                    future.set_result(None)
+    
+    async def _wait_idle(self, session: _Session) -> bool:
+        """Wait for the session to finish, False after idle_timeout seconds without a message"""
+        loop = asyncio.get_running_loop()
+        while not session.finished.done():
+            remaining = session.last_message + self.idle_timeout - loop.time()
+            if remaining <= 0:
+                return False
+            await asyncio.wait({session.finished}, timeout=remaining)
+        return True
+    
+    async def _close_chunks(self, chunks: Iterator):
+        """Stop the audio producer (e.g. kill a still-running ffmpeg decode)"""
+        close = getattr(chunks, 'close', None)
+        if close:
+            try:
+                await asyncio.get_running_loop().run_in_executor(self._readers, close)
+            except Exception as e:
+                logger.debug(f"Failed to close audio source: {str(e)}")
+    
+    def get_stats(self) -> Dict:
+        """Get session counters"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['loop_running'] = self._thread is not None and self._thread.is_alive()
+        return stats
+
+_engine = None
+_engine_lock = threading.Lock()
+_missing_warned = False
+
+def get_async_engine(config: Dict) -> Optional[NLSAsyncEngine]:
+    """
+    Shared asyncio engine, None when disabled or the websockets package is missing
+    
+    Args:
+        config: Alibaba NLS configuration (async_engine, connect_timeout, idle_timeout, session_timeout)
+        
+    Returns:
+        NLSAsyncEngine or None (use the thread transport)
+    """
+    global _engine, _missing_warned
+    if not config.get('async_engine', True):
+        return None
+    if websockets is None:
+        if not _missing_warned:
+            logger.warning("websockets is not installed, NLS sessions use one thread each")
+            _missing_warned = True
+        return None
+    with _engine_lock:
+        if _engine is None:
+            _engine = NLSAsyncEngine(config.get('connect_timeout', 15), config.get('idle_timeout', 30),
+                                     config.get('session_timeout', 3600))
+        return _engine
+
+def get_async_engine_stats() -> Dict:
+    """
+    Get asyncio engine session counters
+    
+    Returns:
+        Dictionary of engine statistics (empty if the engine never ran)
+    """
+    return _engine.get_stats() if _engine is not None else {}
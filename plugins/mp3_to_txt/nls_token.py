@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+NLS Token Manager
+Process-wide cache of Alibaba Cloud NLS access tokens with expiry-aware background refresh
+"""
+
+import sys
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+# Add project root to path
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+import requests
+
+from plugins.config import ALIBABA_NLS_CONFIG
+
+logger = logging.getLogger(__name__)
+
+TOKEN_URL = "https://nls-meta.cn-shanghai.aliyuncs.com/pop/2018-05-18/tokens"
+
+# Lifetime assumed when the response carries no ExpireTime
+DEFAULT_TOKEN_TTL = 12 * 3600
+
+# Upper bound of the refresher's backoff after repeated failures
+MAX_RETRY_INTERVAL = 3600
+
+class NLSTokenManager:
+    """
+    Shared NLS access token with background refresh
+    
+    The token and its ExpireTime are cached for the whole process. A daemon
+    thread refreshes it ``refresh_margin`` seconds before it expires (and
+    retries failures after ``retry_interval`` seconds, doubling up to an
+    hour while they keep failing), so recognitions
+    normally get a valid token without any network round trip. Only one
+    refresh runs at a time; callers that need a token while it is being
+    fetched wait for that fetch instead of starting their own.
+    """
+    
+    def __init__(self, config: Dict, refresh_margin: float = 300, retry_interval: float = 30):
+        """
+        Initialize token manager
+        
+        Args:
+            config: Alibaba NLS configuration (access_key_id, access_key_secret, region)
+            refresh_margin: Seconds before expiry at which the token is renewed
+            retry_interval: Seconds between attempts after a failed refresh
+        """
+        self.config = config
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self.token = None
+        self.expire_time = 0.0
+        self._condition = threading.Condition()
+        self._refreshing = False
+        self._wake = threading.Event()
+        self._thread = None
+        self._next_refresh = 0.0
+        self._stats = {'hits': 0, 'waits': 0, 'fetches': 0, 'failures': 0}
+    
+    def _fetch(self) -> Tuple[Optional[str], float]:
+        """Request a new token from the NLS meta service"""
+        headers = {
+            'Content-Type': 'application/json',
+            'Accept': 'application/json'
+        }
+        data = {
+            'AccessKeyId': self.config['access_key_id'],
+            'Action': 'CreateToken',
+            'Version': '2019-02-28',
+            'RegionId': self.config.get('region', 'cn-shanghai'),
+            'Format': 'JSON'
+        }
+        
+        response = requests.post(TOKEN_URL, headers=headers, json=data, timeout=10)
+        if response.status_code != 200:
+            logger.error(f"Failed to get token: {response.status_code} - {response.text}")
+            return None, 0.0
+        
+        result = response.json()
+        token = result.get('Token', {}).get('Id')
+        if not token:
+            logger.error(f"Failed to get token from response: {result}")
+            return None, 0.0
+        
+        expire_time = float(result.get('Token', {}).get('ExpireTime') or time.time() + DEFAULT_TOKEN_TTL)
+        return token, expire_time
+    
+    def _has_credentials(self) -> bool:
+        """Whether an access key is configured at all"""
+        return bool(self.config.get('access_key_id') and self.config.get('access_key_secret'))
+    
+    def _valid(self, margin: float = 0) -> bool:
+        """Whether the cached token is usable for at least ``margin`` more seconds (caller holds the lock)"""
+        return self.token is not None and time.time() < self.expire_time - margin
+    
+    def refresh(self) -> Optional[str]:
+        """
+        Fetch a new token, or wait for the fetch already in progress
+        
+        Returns:
+            Current token (None if no valid token could be obtained)
+        """
+        with self._condition:
+            if self._refreshing:
+                self._stats['waits'] += 1
+                self._condition.wait_for(lambda: not self._refreshing, timeout=15)
+                return self.token if self._valid() else None
+            self._refreshing = True
+        
+        token, expire_time = None, 0.0
+        try:
+            token, expire_time = self._fetch()
+        except Exception as e:
+            logger.error(f"Error getting token: {str(e)}")
+        finally:
+            with self._condition:
+                self._stats['fetches'] += 1
+                if token:
+                    self.token = token
+                    self.expire_time = expire_time
+                    logger.info(f"Obtained NLS access token, valid for {expire_time - time.time():.0f}s")
+                else:
+                    self._stats['failures'] += 1
+                self._refreshing = False
+                self._condition.notify_all()
+        
+        with self._condition:
+            return self.token if self._valid() else None
+    
+    def get_token(self) -> Optional[str]:
+        """
+        Current token, fetched only if none is cached or it has expired
+        
+        Returns:
+            Token, or None if no valid token could be obtained
+        """
+        self.start()
+        with self._condition:
+            if self._valid():
+                self._stats['hits'] += 1
+                # Within the margin: the refresher renews it while this one is still good
+                if not self._valid(self.refresh_margin) and time.time() >= self._next_refresh:
+                    self._wake.set()
+                return self.token
+        return self.refresh()
+    
+    def start(self):
+        """Start the background refresher (idempotent, not started without credentials)"""
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if not self._has_credentials():
+                return
+            self._thread = threading.Thread(target=self._run, name='nls-token-refresh', daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        """Refresher loop: renew ahead of expiry, back off on failures"""
+        failures = 0
+        while True:
+            with self._condition:
+                remaining = self.expire_time - time.time() if self.token else 0.0
+            delay = remaining - self.refresh_margin
+            
+            if delay <= 0:
+                if self.refresh() is None:
+                    failures += 1
+                    delay = min(self.retry_interval * 2 ** (failures - 1), MAX_RETRY_INTERVAL)
+                    if failures > 1:
+                        logger.warning(f"NLS token refresh failed {failures} times, next attempt in {delay:.0f}s")
+                else:
+                    failures = 0
+                    with self._condition:
+                        remaining = self.expire_time - time.time()
+                    # A token shorter-lived than the margin is renewed halfway through its lifetime
+                    delay = max(self.retry_interval, remaining - self.refresh_margin, remaining / 2)
+            
+            with self._condition:
+                self._next_refresh = time.time() + delay
+            self._wake.wait(delay)
+            self._wake.clear()
+    
+    def get_stats(self) -> Dict:
+        """Get cache hit and refresh counters"""
+        with self._condition:
+            stats = dict(self._stats)
+            stats['valid'] = self._valid()
+            stats['expires_in'] = round(max(0.0, self.expire_time - time.time())) if self.token else 0
+        return stats
+
+# One manager per access key for the whole process
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_token_manager(config: Dict = None) -> NLSTokenManager:
+    """
+    Shared token manager for an NLS configuration
+    
+    Args:
+        config: Alibaba NLS configuration (defaults to ALIBABA_NLS_CONFIG)
+        
+    Returns:
+        NLSTokenManager
+    """
+    config = config or ALIBABA_NLS_CONFIG
+    key = (config.get('access_key_id'), config.get('region'))
+    with _managers_lock:
+        if key not in _managers:
+            _managers[key] = NLSTokenManager(config, refresh_margin=float(config.get('token_refresh_margin', 300)))
+        return _managers[key]
+
+def get_token_stats() -> Dict:
+    """
+    Get token manager counters of every configured access key
+    
+    Returns:
+        Dictionary keyed by masked access key id
+    """
+    with _managers_lock:
+        managers = dict(_managers)
+    # 只暴露访问密钥前缀
+    return {f"{(key[0] or '')[:4]}***": manager.get_stats() for key, manager in managers.items()}
@@ -20,10 +20,13 @@ import subprocess
 project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
+import numpy as np
 from faster_whisper import WhisperModel
-from pydub import AudioSegment
 
 from plugins.config import MP3_TO_TXT_CONFIG, TMP_DIR, LOGS_DIR, MODELS_DIR
+from plugins.common.ffmpeg_utils import FFmpegTools
+from plugins.common.audio_stream import decode_stream
+from plugins.common.silence import TimeMap
 
 logger = logging.getLogger(__name__)
 
@@ -93,8 +96,8 @@ class WhisperConverter:
                 progress_callback(0, error_msg)
             return False
     
-    def _prepare_audio(self, input_path: Path, progress_callback=None) -> Path:
-        """准备音频文件供Whisper处理"""
+    def _prepare_audio(self, input_path: Path, progress_callback=None):
+        """准备音频供Whisper处理，返回文件路径或16kHz单声道float32数组"""
         try:
             if progress_callback:
                 progress_callback(25, "准备音频文件...")
@@ -105,34 +108,40 @@ class WhisperConverter:
                 logger.info(f"音频文件格式支持，直接使用: {input_path}")
                 return input_path
             
-            # 需要转换为WAV格式
-            logger.info(f"转换音频格式: {input_path.suffix} -> .wav")
-            
-            # 加载音频文件
-            audio = AudioSegment.from_file(str(input_path))
-            
-            # 转换为WAV格式（Whisper推荐）
-            output_path = self.tmp_dir / f"{input_path.stem}_whisper.wav"
-            audio.export(str(output_path), format="wav")
+            # 通过管道直接解码为16kHz单声道float32数组，不写临时文件
+            logger.info(f"直接解码PCM: {input_path.name}")
+            sample_rate = 16000
+            duration = float(FFmpegTools().get_video_info(input_path, fast=True).get('duration', 0))
+            
+            # 按探测时长预分配，逐帧拷入，峰值内存约为一份音频数组
+            audio = np.empty(int(duration * sample_rate) + sample_rate, dtype=np.float32)
+            length = 0
+            for frame in decode_stream(input_path, sr=sample_rate, channels=1, frame_ms=1000, dtype='float32'):
+                if length + len(frame) > len(audio):
+                    audio = np.resize(audio, max(len(audio) * 2, length + len(frame)))
+                audio[length:length + len(frame)] = frame
+                length += len(frame)
+            audio = audio[:length]
             
             if progress_callback:
-                progress_callback(30, "音频格式转换完成")
+                progress_callback(30, "音频解码完成")
             
-            logger.info(f"音频格式转换完成: {output_path}")
-            return output_path
+            logger.info(f"PCM解码完成: {length / sample_rate:.2f}秒")
+            return audio
             
         except Exception as e:
             error_msg = f"音频格式转换失败: {str(e)}"
             logger.error(error_msg)
             raise Exception(error_msg)
     
-    def _transcribe_audio(self, audio_path: Path, progress_callback=None) -> Dict:
-        """使用Faster-Whisper进行音频转录"""
+    def _transcribe_audio(self, audio_path, progress_callback=None) -> Dict:
+        """使用Faster-Whisper进行音频转录（audio_path 可以是文件路径或float32数组）"""
         try:
             if progress_callback:
                 progress_callback(40, "开始语音识别...")
             
-            logger.info(f"开始Faster-Whisper转录: {audio_path}")
+            audio_label = audio_path.name if isinstance(audio_path, Path) else f"<PCM {len(audio_path)} samples>"
+            logger.info(f"开始Faster-Whisper转录: {audio_label}")
             
             # 设置语言参数，如果是'auto'则不指定语言让模型自动检测
             language = self.whisper_config['language'] if self.whisper_config['language'] != 'auto' else None
@@ -141,7 +150,7 @@ class WhisperConverter:
                 progress_callback(45, f"使用模型: {self.whisper_config['model_size']}")
             
             logger.info(f"🔄 正在使用Faster-Whisper进行语音识别...")
-            logger.info(f"📁 音频文件: {audio_path.name}")
+            logger.info(f"📁 音频文件: {audio_label}")
             logger.info(f"🤖 模型大小: {self.whisper_config['model_size']}")
             logger.info(f"🌍 语言设置: {self.whisper_config['language']}")
             logger.info(f"💻 计算设备: {self.whisper_config['device']}")
@@ -155,7 +164,7 @@ class WhisperConverter:
             start_transcribe_time = time.time()
             
             segments, info = self.model.transcribe(
-                str(audio_path),
+                str(audio_path) if isinstance(audio_path, Path) else audio_path,
                 language=language,
                 word_timestamps=True,  # 启用词级时间戳
                 vad_filter=True,      # 启用语音活动检测
@@ -381,6 +390,14 @@ class WhisperConverter:
             if progress_callback:
                 progress_callback(85, "处理转录结果...")
             
+            # 静音裁剪过的音频：把时间戳映射回原始时间轴
+            time_map = TimeMap.load_for(input_path)
+            if time_map is not None:
+                for segment in whisper_result.get('segments', []):
+                    segment['start'] = time_map.to_original(segment.get('start', 0))
+                    segment['end'] = time_map.to_original(segment.get('end', 0))
+                logger.info(f"时间戳已映射回原始时间轴: {TimeMap.path_for(input_path).name}")
+            
             # 处理结果，优先生成SRT
             srt_content, segments = self._process_results(whisper_result)
             
@@ -407,7 +424,7 @@ class WhisperConverter:
             logger.info(f"TXT文本文件已保存: {output_txt_path}")
             
             # 清理临时文件
-            if prepared_audio_path != input_path and prepared_audio_path.exists():
+            if isinstance(prepared_audio_path, Path) and prepared_audio_path != input_path and prepared_audio_path.exists():
                 prepared_audio_path.unlink()
             
             end_time = datetime.now()
@@ -423,6 +440,7 @@ class WhisperConverter:
                 'audio_duration': whisper_result.get('duration', 0),
                 'audio_duration_after_vad': whisper_result.get('duration_after_vad', 0),
                 'segments_count': len(segments),
+                'time_map_applied': time_map is not None,
                 'srt_content_length': len(srt_content),
                 'txt_content_length': len(full_text),
                 'config_used': self.config.copy(),
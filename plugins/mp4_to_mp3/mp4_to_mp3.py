@@ -15,14 +15,22 @@ from datetime import datetime
 project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
+import numpy as np
 from pydub import AudioSegment
-from pydub.silence import split_on_silence
 
 from plugins.config import MP4_TO_MP3_CONFIG, TMP_DIR, LOGS_DIR
-from plugins.common.ffmpeg_utils import FFmpegTools, get_video_info, extract_audio, validate_video_file
+from plugins.common.ffmpeg_utils import (
+    FFmpegTools, get_video_info, extract_audio, validate_video_file, audio_codec_profile, audio_output_suffix
+)
+from plugins.common.silence import TimeMap, CUT_FRAME_RATE, remove_silence
+from plugins.common.normalize import StreamingNormalizer
+from plugins.common.scratch import scratch_manager, audio_size_hint
 
 logger = logging.getLogger(__name__)
 
+# pydub export format per output suffix
+EXPORT_FORMATS = {'.mp3': 'mp3', '.ogg': 'ogg', '.webm': 'webm', '.m4a': 'ipod'}
+
 class MP4ToMP3Converter:
     """MP4 to MP3 converter with configurable parameters"""
     
@@ -40,7 +48,7 @@ class MP4ToMP3Converter:
         
         Args:
             input_path: Path to input MP4 file
-            output_path: Path to output MP3 file
+            output_path: Path to output MP3 file (suffix follows the audio codec profile)
             progress_callback: Optional callback function for progress updates
             
         Returns:
@@ -71,51 +79,46 @@ class MP4ToMP3Converter:
             if not video_info.get('has_audio', False):
                 return False, "Video has no audio track", {}
             
-            # Create temporary audio file
-            temp_audio_path = self.tmp_dir / f"temp_{input_path.stem}.mp3"
-            
-            if progress_callback:
-                progress_callback(20, "Extracting audio with FFmpeg...")
+            # The container follows the codec profile (.mp3, .ogg/.webm for Opus, .m4a for HE-AAC)
+            output_path = output_path.with_suffix(audio_output_suffix(self.config))
             
-            # Extract audio using FFmpeg tools (传递已获取的视频信息)
-            success, extract_msg = self.ffmpeg_tools.extract_audio(
-                input_path, temp_audio_path, self.config,
-                lambda p, m: progress_callback(20 + p//3, m) if progress_callback else None,
-                video_info  # 传递预先获取的视频信息，避免重复调用
+            # Loudness/silence pre-analysis: drop stages that would change nothing
+            processing_config, processing_decisions, analysis = self._plan_processing(
+                input_path, video_info, progress_callback
             )
             
-            if not success:
-                return False, f"Audio extraction failed: {extract_msg}", {}
-            
-            if progress_callback:
-                progress_callback(60, "Post-processing audio...")
-            
-            # Load audio with pydub for additional processing
-            audio_segment = AudioSegment.from_mp3(str(temp_audio_path))
-            
-            # Apply additional audio processing if configured
-            processed_audio = self._process_audio(audio_segment, progress_callback)
-            
-            if progress_callback:
-                progress_callback(80, "Saving final MP3 file...")
-            
-            # Export final MP3 with optimized settings
-            processed_audio.export(
-                str(output_path),
-                format="mp3",
-                bitrate=self.config['audio_bitrate'],
-                parameters=[
-                    "-ac", str(self.config['audio_channels']),
-                    "-ar", str(self.config['audio_sample_rate'])
-                ]
+            # Stream-copy fast path: remux when re-encoding buys nothing
+            audio_mode = 'transcode'
+            passthrough_path, passthrough_reason = self._get_passthrough_output(
+                video_info, output_path, processing_config
             )
+            if passthrough_path is not None:
+                if progress_callback:
+                    progress_callback(20, "Copying audio stream (no re-encode)...")
+                
+                success, copy_msg = self.ffmpeg_tools.copy_audio_stream(
+                    input_path, passthrough_path,
+                    lambda p, m: progress_callback(20 + p * 3 // 4, m) if progress_callback else None,
+                    video_info
+                )
+                if success:
+                    audio_mode = 'copy'
+                    output_path = passthrough_path
+                else:
+                    logger.warning(f"Stream copy failed, falling back to transcode: {copy_msg}")
+                    passthrough_reason = f"stream copy failed: {copy_msg}"
+            
+            # A time map left by an earlier trimmed export no longer applies
+            TimeMap.discard(output_path)
             
-            # Clean up temporary file
-            if temp_audio_path.exists():
-                temp_audio_path.unlink()
+            engine_used = None
+            if audio_mode == 'transcode':
+                engine_used = self._transcode(input_path, output_path, video_info, progress_callback,
+                                              processing_config, analysis)
             
             # Get final file info
             final_size = output_path.stat().st_size
+            time_map_path = TimeMap.path_for(output_path)
             end_time = datetime.now()
             duration = (end_time - start_time).total_seconds()
             
@@ -125,7 +128,15 @@ class MP4ToMP3Converter:
                 'compression_ratio': round(final_size / original_size, 3),
                 'duration_seconds': duration,
                 'video_info': video_info,
-                'config_used': self.config.copy(),
+                'audio_mode': audio_mode,
+                'audio_mode_reason': passthrough_reason,
+                'audio_codec': audio_codec_profile(processing_config) if audio_mode == 'transcode' else video_info.get('audio_codec'),
+                'engine_used': engine_used,
+                'audio_analysis': {k: v for k, v in analysis.items() if k != 'silences'} if analysis else None,
+                'processing_decisions': processing_decisions,
+                'time_map': str(time_map_path) if time_map_path.exists() else None,
+                'output_path': str(output_path),
+                'config_used': {k: v for k, v in processing_config.items() if k != 'silence_cuts'},
                 'timestamp': end_time.isoformat()
             }
             
@@ -142,57 +153,271 @@ class MP4ToMP3Converter:
             error_msg = f"Conversion failed: {str(e)}"
             logger.error(error_msg)
             
-            # Clean up on error
-            if 'temp_audio_path' in locals() and temp_audio_path.exists():
-                temp_audio_path.unlink()
-            
             return False, error_msg, {}
     
-    def _process_audio(self, audio: AudioSegment, progress_callback=None) -> AudioSegment:
-        """Process audio according to configuration"""
+    def _plan_processing(self, input_path: Path, video_info: Dict,
+                         progress_callback=None) -> Tuple[Dict, Dict, Optional[Dict]]:
+        """
+        Analyze the audio track and turn off processing it does not need
+        
+        Returns:
+            Tuple of (effective configuration, decisions per stage, analysis)
+        """
+        if not self.config.get('analyze_audio', True):
+            return self.config, {}, None
+        if not (self.config.get('normalize_audio', False) or self.config.get('remove_silence', False)):
+            return self.config, {}, None
+        
+        if progress_callback:
+            progress_callback(12, "Analyzing loudness and silence...")
+        
+        analysis = self.ffmpeg_tools.analyze_audio(
+            input_path, self.config, video_info,
+            lambda p, m: progress_callback(12 + p * 8 // 100, m) if progress_callback else None
+        )
+        config, decisions = self.ffmpeg_tools.plan_audio_processing(self.config, analysis)
+        for stage, decision in decisions.items():
+            logger.info(f"{stage}: {'applied' if decision['applied'] else 'skipped'} ({decision['reason']})")
+        return config, decisions, analysis
+    
+    def _transcode(self, input_path: Path, output_path: Path, video_info: Dict, progress_callback=None,
+                   config: Dict = None, analysis: Optional[Dict] = None) -> str:
+        """
+        Re-encode the audio track into the final MP3 (or Opus/AAC) file
+        
+        The default 'filtergraph' engine does silence removal, loudness
+        normalization, downmix and resampling in a single FFmpeg run that
+        writes the output directly. The 'streaming' engine (also the
+        fallback) does the pydub-style peak normalization and silence cuts
+        in two bounded-memory passes. The legacy 'pydub' engine encodes a
+        temp MP3 and post-processes it in memory.
+        
+        Args:
+            config: Effective configuration from _plan_processing
+            analysis: Loudness analysis, used to re-plan normalization for the fallback
+            
+        Returns:
+            Name of the engine that produced the output
+        """
+        config = config or self.config
+        engine = config.get('engine', 'filtergraph')
+        if engine == 'filtergraph':
+            if progress_callback:
+                progress_callback(20, "Extracting and processing audio with FFmpeg...")
+            
+            success, extract_msg = self.ffmpeg_tools.extract_audio(
+                input_path, output_path, config,
+                lambda p, m: progress_callback(20 + p * 3 // 4, m) if progress_callback else None,
+                video_info
+            )
+            if success:
+                # Lets transcripts of the trimmed MP3 be mapped back onto the video
+                cuts = config.get('silence_cuts')
+                if config.get('remove_silence', False) and cuts:
+                    time_map = TimeMap.from_intervals(np.array(cuts['intervals'], dtype=np.int64),
+                                                      CUT_FRAME_RATE, cuts['total'])
+                    if not time_map.is_identity:
+                        time_map.save(output_path)
+                return 'filtergraph'
+            
+            logger.warning(f"Filtergraph engine failed, falling back to streaming: {extract_msg}")
+            
+            # The fallback also applies a peak gain, which the filtergraph plan did not decide on
+            if self.config.get('normalize_audio', False) and analysis is not None:
+                planned, decisions = self.ffmpeg_tools.plan_audio_processing(
+                    dict(self.config, engine='streaming'), analysis
+                )
+                config = dict(config, normalize_audio=planned['normalize_audio'], peak_gain=planned['peak_gain'])
+                decision = decisions['peak_gain']
+                logger.info(f"peak_gain (streaming fallback): "
+                            f"{'applied' if decision['applied'] else 'skipped'} ({decision['reason']})")
+        
+        if engine == 'pydub':
+            self._transcode_pydub(input_path, output_path, video_info, progress_callback, config)
+            return 'pydub'
+        
+        self._transcode_streaming(input_path, output_path, video_info, progress_callback, config)
+        return 'streaming'
+    
+    def _transcode_streaming(self, input_path: Path, output_path: Path, video_info: Dict, progress_callback=None,
+                             config: Dict = None):
+        """Two-pass normalize/trim/encode with memory bounded by one decode chunk"""
+        config = config or self.config
+        normalizer = StreamingNormalizer(config)
+        duration = float(video_info.get('duration', 0))
+        
+        if progress_callback:
+            progress_callback(20, "Measuring audio levels...")
+        
+        measured = normalizer.measure(
+            input_path, duration,
+            lambda p, m: progress_callback(20 + p * 3 // 10, m) if progress_callback else None
+        )
+        logger.info(f"Streaming normalization: peak={measured['peak']}, gain={measured['gain_db']} dB, "
+                    f"{measured['duration']:.1f}s -> {measured['kept_duration']:.1f}s")
+        
+        if progress_callback:
+            progress_callback(50, "Encoding normalized audio...")
+        
+        time_map = normalizer.render(
+            input_path, output_path,
+            lambda p, m: progress_callback(50 + p * 45 // 100, m) if progress_callback else None
+        )
+        
+        # Lets transcripts of the trimmed MP3 be mapped back onto the video
+        if time_map is not None:
+            time_map.save(output_path)
+    
+    def _transcode_pydub(self, input_path: Path, output_path: Path, video_info: Dict, progress_callback=None,
+                         config: Dict = None):
+        """Extract audio with FFmpeg, post-process with pydub and export the final MP3"""
+        config = config or self.config
+        
+        # Private scratch directory: concurrent jobs on same-named files never collide
+        with scratch_manager.job(f"mp4_to_mp3-{input_path.stem}") as scratch:
+            temp_audio_path = scratch.allocate(
+                f"{input_path.stem}.mp3",
+                audio_size_hint(float(video_info.get('duration', 0)), config.get('audio_bitrate', '64k'))
+            )
+            
+            if progress_callback:
+                progress_callback(20, "Extracting audio with FFmpeg...")
+            
+            # Silence removal is done by pydub below; the intermediate is always MP3
+            extract_config = dict(config, remove_silence=False, audio_codec='mp3')
+            
+            # Extract audio using FFmpeg tools (传递已获取的视频信息)
+            success, extract_msg = self.ffmpeg_tools.extract_audio(
+                input_path, temp_audio_path, extract_config,
+                lambda p, m: progress_callback(20 + p//3, m) if progress_callback else None,
+                video_info  # 传递预先获取的视频信息，避免重复调用
+            )
+            
+            if not success:
+                raise RuntimeError(f"Audio extraction failed: {extract_msg}")
+            scratch.check()
+            
+            if progress_callback:
+                progress_callback(60, "Post-processing audio...")
+            
+            # Load audio with pydub for additional processing
+            audio_segment = AudioSegment.from_mp3(str(temp_audio_path))
+            
+            # Apply additional audio processing if configured
+            processed_audio, time_map = self._process_audio(audio_segment, progress_callback, config)
+            
+            if progress_callback:
+                progress_callback(80, "Saving final MP3 file...")
+            
+            # Export final audio with the configured codec profile
+            processed_audio.export(
+                str(output_path),
+                format=EXPORT_FORMATS.get(output_path.suffix, 'mp3'),
+                parameters=self.ffmpeg_tools.audio_encoder_args(config) + [
+                    "-ac", str(config['audio_channels']),
+                    "-ar", str(config['audio_sample_rate'])
+                ]
+            )
+            
+            # Lets transcripts of the trimmed MP3 be mapped back onto the video
+            if time_map is not None and not time_map.is_identity:
+                time_map.save(output_path)
+    
+    def _get_passthrough_output(self, video_info: Dict, output_path: Path,
+                                config: Dict = None) -> Tuple[Optional[Path], str]:
+        """
+        Decide whether the source audio can be stream-copied
+        
+        Args:
+            video_info: Probed video information
+            output_path: Requested output path
+            config: Effective configuration (after pre-analysis), defaults to self.config
+            
+        Returns:
+            Tuple of (output path for stream copy or None, reason)
+        """
+        config = config or self.config
+        if not config.get('passthrough', False):
+            return None, "passthrough disabled"
+        
+        if (config.get('normalize_audio', False) or config.get('peak_gain', False)
+                or config.get('remove_silence', False)):
+            return None, "audio processing requires re-encoding"
+        
+        source_codec = video_info.get('audio_codec', '')
+        target_codec = audio_codec_profile(config)
+        source_bitrate = video_info.get('audio_bitrate', 0)
+        source_channels = video_info.get('audio_channels', 0)
+        target_bitrate = _parse_bitrate(config.get('audio_bitrate', '64k'))
+        
+        if not source_bitrate or source_bitrate > target_bitrate:
+            return None, f"source bitrate {source_bitrate} exceeds target {target_bitrate}"
+        
+        if source_channels > int(config.get('audio_channels', 1)):
+            return None, f"source has {source_channels} channels"
+        
+        if source_codec == 'mp3' and target_codec == 'mp3':
+            return output_path, "source is MP3 within target bitrate"
+        
+        if source_codec == 'opus' and target_codec == 'opus':
+            return output_path, "source is Opus within target bitrate"
+        
+        if source_codec == 'aac' and (target_codec == 'aac_he' or config.get('passthrough_m4a', False)):
+            return output_path.with_suffix('.m4a'), "source is AAC within target bitrate, kept as M4A"
+        
+        return None, f"source codec {source_codec or 'unknown'} differs from target"
+    
+    def _process_audio(self, audio: AudioSegment, progress_callback=None,
+                       config: Dict = None) -> Tuple[AudioSegment, Optional[TimeMap]]:
+        """Process audio according to configuration, returning the silence time map if trimmed"""
+        config = config or self.config
         processed = audio
+        time_map = None
         
         # Convert to mono if configured
-        if self.config['audio_channels'] == 1:
+        if config['audio_channels'] == 1:
             processed = processed.set_channels(1)
         
         # Set sample rate
-        processed = processed.set_frame_rate(self.config['audio_sample_rate'])
+        processed = processed.set_frame_rate(config['audio_sample_rate'])
         
-        # Normalize audio if configured
-        if self.config.get('normalize_audio', False):
+        # Normalize audio if configured (the loudnorm decode filter is planned separately)
+        if config.get('peak_gain', config.get('normalize_audio', False)):
             if progress_callback:
                 progress_callback(65, "Normalizing audio...")
             processed = processed.normalize()
         
         # Remove silence if configured
-        if self.config.get('remove_silence', False):
+        if config.get('remove_silence', False):
             if progress_callback:
                 progress_callback(70, "Removing silence...")
-            processed = self._remove_silence(processed)
+            processed, time_map = self._remove_silence(processed, config)
         
-        return processed
+        return processed, time_map
     
-    def _remove_silence(self, audio: AudioSegment) -> AudioSegment:
+    def _remove_silence(self, audio: AudioSegment, config: Dict = None) -> Tuple[AudioSegment, Optional[TimeMap]]:
         """Remove silence from audio to reduce file size"""
+        config = config or self.config
         try:
-            # Split audio on silence
-            chunks = split_on_silence(
-                audio,
-                min_silence_len=1000,  # 1 second of silence
-                silence_thresh=audio.dBFS - 16,  # 16dB below average
-                keep_silence=200  # Keep 200ms of silence
-            )
+            # Vectorized RMS detection over the raw samples, output built in one gather
+            samples = np.asarray(audio.get_array_of_samples())
+            if audio.channels > 1:
+                samples = samples.reshape(-1, audio.channels)
             
-            # Concatenate chunks
-            if chunks:
-                return sum(chunks)
-            else:
-                return audio
+            # Same relative threshold as the former split_on_silence call: 16 dB below the average level
+            trimmed, time_map = remove_silence(
+                samples, audio.frame_rate,
+                threshold_db=audio.dBFS - 16,
+                min_silence=float(config.get('silence_min_duration', 1.0)),
+                keep=float(config.get('silence_keep', 0.2))
+            )
+            if trimmed is samples:
+                return audio, None
+            return audio._spawn(trimmed.tobytes()), time_map
                 
         except Exception as e:
             logger.warning(f"Failed to remove silence: {str(e)}")
-            return audio
+            return audio, None
     
     def get_video_info(self, video_path: Path) -> Dict:
         """Get video file information"""
@@ -207,6 +432,18 @@ class MP4ToMP3Converter:
         self.config.update(new_config)
         logger.info(f"Configuration updated: {new_config}")
 
+def _parse_bitrate(bitrate) -> int:
+    """Parse bitrate such as '64k' or 64000 into bits per second"""
+    value = str(bitrate).strip().lower()
+    try:
+        if value.endswith('k'):
+            return int(float(value[:-1]) * 1000)
+        if value.endswith('m'):
+            return int(float(value[:-1]) * 1000000)
+        return int(float(value))
+    except ValueError:
+        return 0
+
 def convert_mp4_to_mp3(input_path: str, output_path: str, 
                       config: Dict = None, progress_callback=None) -> Tuple[bool, str, Dict]:
     """
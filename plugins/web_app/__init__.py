@@ -33,16 +33,20 @@ def main():
     
     from plugins.config import (
         APP_NAME, APP_VERSION, HOST, PORT, DEBUG,
-        WORKSPACE_DIR, MODELS_DIR, LOGS_DIR, UPLOAD_DIR, TMP_DIR, STATUS_DIR
+        WORKSPACE_DIR, MODELS_DIR, LOGS_DIR, UPLOAD_DIR, TMP_DIR, STATUS_DIR, CACHE_DIR
     )
     
     logger = logging.getLogger(__name__)
     logger.info(f"Starting {APP_NAME} v{APP_VERSION}...")
     
     # 确保所有目录存在
-    for directory in [WORKSPACE_DIR, MODELS_DIR, LOGS_DIR, UPLOAD_DIR, TMP_DIR, STATUS_DIR]:
+    for directory in [WORKSPACE_DIR, MODELS_DIR, LOGS_DIR, UPLOAD_DIR, TMP_DIR, STATUS_DIR, CACHE_DIR]:
         directory.mkdir(exist_ok=True, parents=True)
     
+    # 清理上次异常退出时遗留的任务临时目录
+    from plugins.common.scratch import scratch_manager
+    scratch_manager.recover()
+    
     # 创建Flask应用和SocketIO
     app, socketio = create_app()
     
@@ -5,9 +5,11 @@ API Routes Module
 Contains all API endpoints for the Flask application
 """
 
+import os
 import sys
 import json
 import logging
+import threading
 import uuid
 from pathlib import Path
 from datetime import datetime
@@ -21,6 +23,7 @@ sys.path.insert(0, str(project_root))
 from plugins.config import *
 from .utils import active_conversions, conversion_history, is_allowed_file, get_file_type, validate_conversion_type
 from .conversion_handler import start_conversion_task, get_conversion_status, get_all_conversions, get_conversion_history
+from plugins.common.ffmpeg_utils import AUDIO_CODEC_PROFILES
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +43,7 @@ def api_convert():
     请求参数：
     - file: 上传的文件对象 (multipart/form-data)
     - conversion_type: 转换类型 (mp4_to_mp3|mp3_to_txt|mp4_to_txt)
+    - audio_codec: 可选，音频输出编码 (mp3|opus|aac_he)，默认使用配置文件
     
     返回：
     - 成功: {'success': True, 'conversion_id': str, 'message': str}
@@ -58,6 +62,7 @@ def api_convert():
         file = request.files['file']
         conversion_type = request.form.get('conversion_type')
         conversion_engine = request.form.get('conversion_engine', 'alibaba_nls')  # 默认使用阿里云NLS
+        audio_codec = request.form.get('audio_codec') or None  # 默认使用配置文件中的编码
         
         # 验证文件名
         if file.filename == '':
@@ -67,6 +72,10 @@ def api_convert():
         if not conversion_type:
             return jsonify({'success': False, 'message': '请选择转换类型'})
         
+        # 验证音频编码
+        if audio_codec and audio_codec not in AUDIO_CODEC_PROFILES:
+            return jsonify({'success': False, 'message': f'不支持的音频编码: {audio_codec}'})
+        
         # 验证文件格式
         if not is_allowed_file(file.filename):
             return jsonify({'success': False, 'message': '不支持的文件格式'})
@@ -127,7 +136,8 @@ def api_convert():
         }
         
         # 在后台线程中开始转换
-        start_conversion_task(conversion_id, str(input_path), conversion_type, filename, conversion_engine)
+        start_conversion_task(conversion_id, str(input_path), conversion_type, filename, conversion_engine,
+                              audio_codec)
         
         return jsonify({
             'success': True,
@@ -299,10 +309,23 @@ def api_status():
           'logs': str,
           'upload': str,
           'tmp': str,
-          'status': str
-        }
+          'status': str,
+          'cache': str
+        },
+        'probe_cache': dict,     # ffprobe缓存命中统计
+        'ffmpeg_scheduler': dict, # FFmpeg任务槽位、排队与运行时间统计
+        'result_cache': dict,    # 转换结果缓存命中率与占用
+        'scratch': dict,         # 任务临时空间分配与配额统计
+        'nls_token': dict,       # NLS访问令牌缓存与后台刷新统计
+        'nls_engine': dict       # NLS异步会话引擎统计（会话数、并发峰值、失败数）
       }
     """
+    from plugins.common.ffmpeg_utils import get_probe_cache_stats, get_scheduler_stats
+    from plugins.common.result_cache import get_result_cache_stats
+    from plugins.common.scratch import get_scratch_stats
+    from plugins.mp3_to_txt.nls_token import get_token_stats
+    from plugins.mp3_to_txt.nls_async import get_async_engine_stats
+    
     return jsonify({
         'status': 'running',
         'app_name': APP_NAME,
@@ -317,8 +340,15 @@ def api_status():
             'logs': str(LOGS_DIR),
             'upload': str(UPLOAD_DIR),
             'tmp': str(TMP_DIR),
-            'status': str(STATUS_DIR)
-        }
+            'status': str(STATUS_DIR),
+            'cache': str(CACHE_DIR)
+        },
+        'probe_cache': get_probe_cache_stats(),
+        'ffmpeg_scheduler': get_scheduler_stats(),
+        'result_cache': get_result_cache_stats(),
+        'scratch': get_scratch_stats(),
+        'nls_token': get_token_stats(),
+        'nls_engine': get_async_engine_stats()
     })
 
 @api_bp.route('/download/<conversion_id>')
@@ -393,15 +423,16 @@ def save_workspace_file():
         file_path = upload_dir / filename
         
         # 根据文件类型保存
-        if file_type == 'text' and filename.endswith('.txt'):
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-        elif file_type == 'srt' and filename.endswith('.srt'):
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-        else:
+        if not ((file_type == 'text' and filename.endswith('.txt')) or
+                (file_type == 'srt' and filename.endswith('.srt'))):
             return jsonify({'success': False, 'message': '不支持的文件类型'}), 400
         
+        # 先写临时文件再替换，不原地改写（文件可能与其他路径共享 inode）
+        temp_path = file_path.with_name(f".{file_path.name}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temp_path, file_path)
+        
         return jsonify({'success': True, 'message': '文件保存成功'})
     except Exception as e:
         logger.error(f"保存工作区文件失败: {str(e)}")
@@ -409,54 +440,179 @@ def save_workspace_file():
 
 @api_bp.route('/workspace/timeline/generate', methods=['POST'])
 def generate_timeline():
-    """生成视频时间轴缩略图"""
+    """
+    生成视频时间轴缩略图
+    
+    功能：
+    - 按缩放级别（每张缩略图的秒数）返回雪碧图索引
+    - 首次请求时单次解码生成该级别，之后直接返回缓存
+    
+    请求体：
+    - video_filename: 视频文件名
+    - interval: 缩略图间隔（秒），默认10，取最接近的已配置级别
+    """
     try:
         data = request.get_json()
         video_filename = data.get('video_filename')
-        interval = data.get('interval', 10)  # 每10秒一个缩略图
+        try:
+            interval = float(data.get('interval', 10))  # 每10秒一个缩略图
+        except (TypeError, ValueError):
+            interval = 0
         
         if not video_filename:
             return jsonify({'success': False, 'message': '缺少视频文件名'}), 400
         
+        if not interval > 0:
+            return jsonify({'success': False, 'message': '缩略图间隔必须大于0'}), 400
+        
         upload_dir = Path(current_app.config.get('UPLOAD_FOLDER', 'workspace/upload'))
         video_path = upload_dir / video_filename
         
         if not video_path.exists():
             return jsonify({'success': False, 'message': '视频文件不存在'}), 404
         
-        # 创建缩略图目录
-        thumbnails_dir = upload_dir / 'thumbnails' / video_filename.replace('.', '_')
-        thumbnails_dir.mkdir(parents=True, exist_ok=True)
+        # 使用单次解码的雪碧图生成器（按级别懒生成并缓存）
+        from plugins.common.timeline import TimelineSpriteGenerator
+        from plugins.common.keyframes import get_keyframe_index
+        from plugins.common.media_prep import derived_paths
         
-        # 使用FFmpeg生成缩略图
-        from plugins.common.ffmpeg_utils import generate_video_thumbnails
+        # 后台预建关键帧索引，后续取帧直接跳到关键帧
+        threading.Thread(target=get_keyframe_index, args=(video_path,), daemon=True).start()
         
-        thumbnails_subdir = video_filename.replace('.', '_')
-        thumbnails_output_dir = upload_dir / 'thumbnails' / thumbnails_subdir
-        
-        thumbnails = generate_video_thumbnails(
-            str(video_path), 
-            str(thumbnails_output_dir), 
-            interval
+        thumbnails_dir = derived_paths(video_path)['thumbnails']
+        generator = TimelineSpriteGenerator(
+            video_path,
+            thumbnails_dir,
+            url_prefix=f'/uploads/thumbnails/{thumbnails_dir.name}'
         )
-        
-        video_duration = get_video_duration(str(video_path))
+        level = generator.get_level(interval)
+        if not level:
+            return jsonify({'success': False, 'message': '生成缩略图失败'}), 500
         
         return jsonify({
             'success': True, 
-            'thumbnails': thumbnails,
-            'duration': video_duration
+            'thumbnails': level['thumbnails'],
+            'interval': level['interval'],
+            'levels': generator.levels,
+            'sheet_width': level['sheet_width'],
+            'sheet_height': level['sheet_height'],
+            'vtt_url': level['vtt_url'],
+            'duration': level['duration']
         })
     except Exception as e:
         logger.error(f"生成时间轴失败: {str(e)}")
         return jsonify({'success': False, 'message': f'生成失败: {str(e)}'}), 500
 
+@api_bp.route('/workspace/frames', methods=['POST'])
+def extract_workspace_frames():
+    """
+    批量提取视频帧
+    
+    功能：
+    - 一次请求提取多个时间点的帧（如每条字幕的开始时间）
+    - 多个时间点共用一次解码，结果按 (视频指纹, 时间, 尺寸) 缓存
+    
+    请求体：
+    - video_filename: 视频文件名
+    - timestamps: 时间点列表（秒），最多 max_frame_timestamps 个
+    - width: 图片宽度，默认160
+    - height: 图片高度，默认90
+    """
+    try:
+        data = request.get_json()
+        video_filename = data.get('video_filename')
+        timestamps = data.get('timestamps') or []
+        width = int(data.get('width', 160))
+        height = int(data.get('height', 90))
+        
+        if not video_filename or not isinstance(timestamps, list):
+            return jsonify({'success': False, 'message': '缺少视频文件名或时间点列表'}), 400
+        
+        if not (16 <= width <= 1920 and 16 <= height <= 1080):
+            return jsonify({'success': False, 'message': '图片尺寸超出范围'}), 400
+        
+        # 每个时间点都要解码取帧，限制单次请求的数量
+        if len(timestamps) > MAX_FRAME_TIMESTAMPS:
+            return jsonify({'success': False,
+                            'message': f'时间点数量 ({len(timestamps)}) 超过限制 ({MAX_FRAME_TIMESTAMPS})'}), 400
+        
+        upload_dir = Path(current_app.config.get('UPLOAD_FOLDER', 'workspace/upload'))
+        video_path = upload_dir / video_filename
+        
+        if not video_path.exists():
+            return jsonify({'success': False, 'message': '视频文件不存在'}), 404
+        
+        from plugins.common.ffmpeg_utils import extract_video_frames
+        
+        frames_dir = upload_dir / 'thumbnails' / 'frames'
+        frames = extract_video_frames(str(video_path), [float(t) for t in timestamps],
+                                      str(frames_dir), width, height)
+        
+        return jsonify({
+            'success': True,
+            'frames': [
+                {
+                    'time': frame['time'],
+                    'url': '/uploads/thumbnails/' + Path(frame['path']).relative_to(upload_dir / 'thumbnails').as_posix(),
+                    'width': width,
+                    'height': height
+                } for frame in frames
+            ]
+        })
+    except Exception as e:
+        logger.error(f"批量提取视频帧失败: {str(e)}")
+        return jsonify({'success': False, 'message': f'提取失败: {str(e)}'}), 500
+
+@api_bp.route('/workspace/waveform')
+def get_workspace_waveform():
+    """
+    获取音频波形峰值
+    
+    功能：
+    - 首次请求时解码一次音频生成多级峰值金字塔并缓存
+    - 按缩放窗口切片内存映射的峰值文件，返回数据量只与窗口像素宽度有关
+    
+    参数：
+    - video_filename: 视频文件名
+    - start: 窗口开始时间（秒），默认0
+    - end: 窗口结束时间（秒），默认到结尾
+    - pixels: 窗口宽度（像素），默认1000
+    """
+    try:
+        video_filename = request.args.get('video_filename')
+        if not video_filename:
+            return jsonify({'success': False, 'message': '缺少视频文件名'}), 400
+        
+        upload_dir = Path(current_app.config.get('UPLOAD_FOLDER', 'workspace/upload'))
+        video_path = upload_dir / video_filename
+        
+        if not video_path.exists():
+            return jsonify({'success': False, 'message': '视频文件不存在'}), 404
+        
+        from plugins.common.ffmpeg_utils import generate_waveform_peaks, read_waveform_peaks
+        from plugins.common.media_prep import derived_paths
+        
+        waveform_dir = derived_paths(video_path)['waveform']
+        index = generate_waveform_peaks(str(video_path), str(waveform_dir))
+        if not index:
+            return jsonify({'success': False, 'message': '生成波形失败'}), 500
+        
+        start = float(request.args.get('start', 0))
+        end = float(request.args.get('end', index['duration']))
+        pixels = min(int(request.args.get('pixels', 1000)), 8192)
+        
+        peaks = read_waveform_peaks(str(waveform_dir), start, end, pixels)
+        return jsonify({'success': True, **peaks})
+    except Exception as e:
+        logger.error(f"获取波形失败: {str(e)}")
+        return jsonify({'success': False, 'message': f'获取波形失败: {str(e)}'}), 500
+
 def get_video_duration(video_path):
     """获取视频时长 (秒)"""
     try:
         # 使用FFmpeg获取视频信息
         from plugins.common.ffmpeg_utils import get_video_info
-        video_info = get_video_info(video_path)
+        video_info = get_video_info(video_path, fast=True)
         return float(video_info.get('duration', 0))
     except:
         # 如果获取失败，返回默认值
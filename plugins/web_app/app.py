@@ -62,7 +62,7 @@ def create_app():
     logger.info(f"Flask app configured with MAX_CONTENT_LENGTH: {MAX_CONTENT_LENGTH} bytes ({MAX_CONTENT_LENGTH / (1024*1024*1024):.2f} GB)")
     
     # 确保目录存在
-    for directory in [UPLOAD_DIR, TMP_DIR, LOGS_DIR, STATUS_DIR]:
+    for directory in [UPLOAD_DIR, TMP_DIR, LOGS_DIR, STATUS_DIR, CACHE_DIR]:
         directory.mkdir(exist_ok=True, parents=True)
     
     # 注册错误处理器
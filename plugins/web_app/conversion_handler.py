@@ -23,13 +23,19 @@ from .utils import active_conversions, conversion_history
 from plugins.mp4_to_mp3.mp4_to_mp3 import MP4ToMP3Converter, save_conversion_log as save_mp4_log
 from plugins.mp3_to_txt.mp3_to_txt import MP3ToTXTConverter, save_conversion_log as save_txt_log
 from plugins.mp3_to_txt.whisper_convert import WhisperConverter, save_whisper_conversion_log
+from plugins.common.media_prep import MediaPreparer, discard_artifact
+from plugins.common.result_cache import result_cache
+from plugins.common.silence import TimeMap, TIMEMAP_SUFFIX
+from plugins.common.scratch import scratch_manager, audio_size_hint
+from plugins.common.ffmpeg_utils import get_video_info
 
 # Import WebSocket handler
 from . import websocket_handler
 
 logger = logging.getLogger(__name__)
 
-def process_conversion(conversion_id: str, input_path: str, conversion_type: str, original_filename: str, conversion_engine: str = 'alibaba_nls'):
+def process_conversion(conversion_id: str, input_path: str, conversion_type: str, original_filename: str, conversion_engine: str = 'alibaba_nls',
+                       audio_codec: str = None):
     """
     后台转换处理函数
     
@@ -43,6 +49,8 @@ def process_conversion(conversion_id: str, input_path: str, conversion_type: str
     - input_path: 输入文件路径
     - conversion_type: 转换类型 (mp4_to_mp3|mp3_to_txt|mp4_to_txt)
     - original_filename: 原始文件名
+    - conversion_engine: 识别引擎 (alibaba_nls|whisper)
+    - audio_codec: 音频输出编码 (mp3|opus|aac_he)，为空时使用配置文件
     
     转换类型说明：
     - mp4_to_mp3: 视频转音频，提取MP4中的音频保存为MP3
@@ -57,6 +65,7 @@ def process_conversion(conversion_id: str, input_path: str, conversion_type: str
     logger.info(f"开始处理转换任务 - ID: {conversion_id}, 类型: {conversion_type}, 文件: {original_filename}")
     logger.debug(f"输入文件路径: {input_path}")
     
+    scratch = None
     try:
         conversion = active_conversions[conversion_id]
         logger.debug(f"获取到转换任务对象: {conversion}")
@@ -80,10 +89,33 @@ def process_conversion(conversion_id: str, input_path: str, conversion_type: str
         else:
             logger.debug(f"配置加载成功: {list(config.keys())}")
         
+        if audio_codec:
+            # 请求指定的音频编码覆盖配置文件
+            config['mp4_to_mp3'] = dict(config.get('mp4_to_mp3') or MP4_TO_MP3_CONFIG, audio_codec=audio_codec)
+            logger.info(f"使用请求指定的音频编码: {audio_codec}")
+        
         input_file = Path(input_path)
         logger.info(f"输入文件信息 - 路径: {input_file}, 存在: {input_file.exists()}, 大小: {input_file.stat().st_size if input_file.exists() else 'N/A'} bytes")
         
-        if conversion_type == 'mp4_to_mp3':
+        # 相同输入内容 + 相同有效配置的结果直接从缓存硬链接回来
+        cache_key = None
+        cached = None
+        if result_cache.enabled:
+            try:
+                cache_key = result_cache.make_key(input_file, conversion_type, conversion_engine, config)
+                cached = result_cache.lookup(cache_key, UPLOAD_DIR, input_file.stem)
+            except Exception as e:
+                logger.warning(f"结果缓存查询失败: {str(e)}")
+        
+        if cached:
+            logger.info(f"命中结果缓存 - 输出文件: {cached['files']}")
+            success, message, metadata = True, cached['message'], cached['metadata']
+            output_file = Path(cached['output_file'])
+            if conversion_type == 'mp4_to_mp3' and not any(f.endswith(TIMEMAP_SUFFIX) for f in cached['files']):
+                # 缓存的音频未裁剪静音，旧的时间映射不再适用
+                TimeMap.discard(output_file)
+            
+        elif conversion_type == 'mp4_to_mp3':
             logger.info("开始 MP4 转 MP3 转换")
             # MP4转MP3转换
             output_file = UPLOAD_DIR / f"{input_file.stem}.mp3"
@@ -103,6 +135,9 @@ def process_conversion(conversion_id: str, input_path: str, conversion_type: str
                 logger.debug(f"转换元数据: {metadata}")
             
             if success:
+                # 直接复制音频流时输出文件后缀可能改变（如 .m4a）
+                output_file = Path(metadata.get('output_path', output_file))
+                logger.info(f"音频处理方式: {metadata.get('audio_mode')} ({metadata.get('audio_mode_reason')})")
                 logger.info("保存转换日志")
                 save_mp4_log(str(input_file), str(output_file), metadata)
                 logger.debug(f"输出文件大小: {output_file.stat().st_size if output_file.exists() else 'N/A'} bytes")
@@ -145,34 +180,74 @@ def process_conversion(conversion_id: str, input_path: str, conversion_type: str
         elif conversion_type == 'mp4_to_txt':
             logger.info("开始 MP4 转文字完整转换流程")
             # 完整MP4转文字转换
-            # 第一步：转换MP4为MP3
-            temp_mp3_file = TMP_DIR / f"{input_file.stem}.mp3"
-            logger.debug(f"临时 MP3 文件路径: {temp_mp3_file}")
-            
-            update_progress(0, "转换视频为音频...")
-            logger.info("第一步：开始 MP4 转 MP3")
-            mp4_converter = MP4ToMP3Converter(config.get('mp4_to_mp3'))
-            success, message, metadata = mp4_converter.convert(
-                input_file, temp_mp3_file, 
-                lambda p, m: update_progress(p//2, f"视频转音频: {m}")
-            )
-            
-            logger.info(f"MP4 转 MP3 完成 - 成功: {success}, 消息: {message}")
-            if metadata:
-                logger.debug(f"MP4 转 MP3 元数据: {metadata}")
-            
-            if not success:
-                logger.error(f"视频转音频失败: {message}")
-                raise Exception(f"视频转音频失败: {message}")
+            direct_pcm = config.get('mp3_to_txt', {}).get('direct_pcm', True)
+            prepare_media = config.get('mp3_to_txt', {}).get('prepare_media', True)
+            audio_source = None
+            asr_artifact = False
+            if prepare_media:
+                # 单次解码同时生成 MP3、识别用 PCM、波形峰值和时间轴雪碧图
+                logger.info("第一步：单次解码准备媒体产物")
+                update_progress(0, "准备媒体...")
+                preparer = MediaPreparer(input_file, config.get('mp4_to_mp3'))
+                prepared, prepare_message, artifacts = preparer.prepare(
+                    UPLOAD_DIR / f"{input_file.stem}.mp3",
+                    lambda p, m: update_progress(p * 30 // 100, f"准备媒体: {m}")
+                )
+                logger.info(f"媒体准备完成 - 成功: {prepared}, 消息: {prepare_message}")
+                if prepared and 'asr_pcm' in artifacts:
+                    audio_source = Path(artifacts['asr_pcm']['path'])
+                    asr_artifact = True
+                    progress_base, progress_span = 30, 70
+                else:
+                    logger.warning(f"媒体准备失败，回退到逐步转换: {prepare_message}")
             
-            logger.debug(f"临时 MP3 文件大小: {temp_mp3_file.stat().st_size if temp_mp3_file.exists() else 'N/A'} bytes")
+            if audio_source is not None:
+                logger.debug(f"使用识别用 PCM 产物: {audio_source}")
+            elif direct_pcm:
+                # 直接通过管道把视频解码为 PCM 交给识别引擎，不生成临时 MP3
+                logger.info("启用直接 PCM 管道，跳过 MP4 转 MP3")
+                audio_source = input_file
+                progress_base, progress_span = 0, 100
+            else:
+                # 第一步：转换MP4为MP3（写入本任务独占的临时目录）
+                mp4_config = config.get('mp4_to_mp3') or MP4_TO_MP3_CONFIG
+                scratch = scratch_manager.job(f"mp4_to_txt-{conversion_id}")
+                temp_mp3_file = scratch.allocate(
+                    f"{input_file.stem}.mp3",
+                    audio_size_hint(float(get_video_info(str(input_file), fast=True).get('duration', 0)),
+                                    mp4_config.get('audio_bitrate', '64k'))
+                )
+                logger.debug(f"临时 MP3 文件路径: {temp_mp3_file}")
+                
+                update_progress(0, "转换视频为音频...")
+                logger.info("第一步：开始 MP4 转 MP3")
+                mp4_converter = MP4ToMP3Converter(config.get('mp4_to_mp3'))
+                success, message, metadata = mp4_converter.convert(
+                    input_file, temp_mp3_file, 
+                    lambda p, m: update_progress(p//2, f"视频转音频: {m}")
+                )
+                
+                logger.info(f"MP4 转 MP3 完成 - 成功: {success}, 消息: {message}")
+                if metadata:
+                    logger.debug(f"MP4 转 MP3 元数据: {metadata}")
+                
+                if not success:
+                    logger.error(f"视频转音频失败: {message}")
+                    raise Exception(f"视频转音频失败: {message}")
+                
+                # 直接复制音频流时临时文件后缀可能改变（如 .m4a）
+                temp_mp3_file = Path(metadata.get('output_path', temp_mp3_file))
+                logger.debug(f"临时 MP3 文件大小: {temp_mp3_file.stat().st_size if temp_mp3_file.exists() else 'N/A'} bytes")
+                scratch.check()
+                audio_source = temp_mp3_file
+                progress_base, progress_span = 50, 50
             
             # 第二步：转换MP3为文字
             output_txt_file = UPLOAD_DIR / f"{input_file.stem}.txt"
             output_srt_file = UPLOAD_DIR / f"{input_file.stem}.srt"
             logger.debug(f"最终输出文件路径 - TXT: {output_txt_file}, SRT: {output_srt_file}")
             
-            update_progress(50, "转换音频为文字...")
+            update_progress(progress_base, "转换音频为文字...")
             logger.info(f"第二步：开始 MP3 转文字，使用引擎: {conversion_engine}")
             
             # 根据引擎选择不同的转换器
@@ -184,8 +259,8 @@ def process_conversion(conversion_id: str, input_path: str, conversion_type: str
                 txt_converter = MP3ToTXTConverter(config.get('mp3_to_txt'))
             
             success, message, metadata = txt_converter.convert(
-                temp_mp3_file, output_txt_file, output_srt_file,
-                lambda p, m: update_progress(50 + p//2, f"音频转文字: {m}")
+                audio_source, output_txt_file, output_srt_file,
+                lambda p, m: update_progress(progress_base + p * progress_span // 100, f"音频转文字: {m}")
             )
             
             logger.info(f"MP3 转文字完成 - 成功: {success}, 消息: {message}")
@@ -194,9 +269,12 @@ def process_conversion(conversion_id: str, input_path: str, conversion_type: str
             
             # 清理临时文件
             logger.info("清理临时文件")
-            if temp_mp3_file.exists():
-                temp_mp3_file.unlink()
-                logger.debug(f"已删除临时文件: {temp_mp3_file}")
+            if scratch is not None:
+                scratch.cleanup()
+                logger.debug(f"已删除临时目录: {scratch.token}")
+            if success and asr_artifact:
+                # 识别用 PCM 约 115 MB/小时，识别成功后不再保留（失败时留给重试）
+                discard_artifact(input_file, 'asr_pcm')
             
             if success:
                 logger.info("保存转换日志")
@@ -212,6 +290,13 @@ def process_conversion(conversion_id: str, input_path: str, conversion_type: str
             logger.error(error_msg)
             raise Exception(error_msg)
         
+        if success and cache_key and not cached:
+            if conversion_type == 'mp4_to_mp3':
+                cache_files = [output_file, TimeMap.path_for(output_file)]
+            else:
+                cache_files = [output_txt_file, output_srt_file]
+            result_cache.store(cache_key, conversion_type, cache_files, input_file.stem, message, metadata)
+        
         # 更新转换状态
         logger.info(f"更新转换状态 - 成功: {success}")
         conversion['completed'] = True
@@ -278,8 +363,14 @@ def process_conversion(conversion_id: str, input_path: str, conversion_type: str
         websocket_handler.emit_error(conversion_id, str(e))
         
         logger.error(f"转换任务 {conversion_id} 最终状态: failed")
+    
+    finally:
+        # 无论成功或失败都删除本任务的临时目录
+        if scratch is not None:
+            scratch.cleanup()
 
-def start_conversion_task(conversion_id: str, input_path: str, conversion_type: str, original_filename: str, conversion_engine: str = 'alibaba_nls'):
+def start_conversion_task(conversion_id: str, input_path: str, conversion_type: str, original_filename: str, conversion_engine: str = 'alibaba_nls',
+                          audio_codec: str = None):
     """
     启动转换任务
     
@@ -292,10 +383,12 @@ def start_conversion_task(conversion_id: str, input_path: str, conversion_type:
     - input_path: 输入文件路径
     - conversion_type: 转换类型
     - original_filename: 原始文件名
+    - conversion_engine: 识别引擎
+    - audio_codec: 音频输出编码，为空时使用配置文件
     """
     thread = threading.Thread(
         target=process_conversion,
-        args=(conversion_id, input_path, conversion_type, original_filename, conversion_engine)
+        args=(conversion_id, input_path, conversion_type, original_filename, conversion_engine, audio_codec)
     )
     thread.daemon = True
     thread.start()